@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the action parsing and dispatch of open_ai_react.query, comparing the original implementation
+(regex compiled on every call, two matches per line, eval) with the actions module.
+
+Usage:
+    python benchmarks/bench_actions.py [--number 20000]
+"""
+import argparse
+import ast
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from actions import ActionRegistry, calculate, literal_args, parse_actions  # noqa: E402
+
+RESPONSES = [
+    "Thought: I should calculate the weight of 2 bulldogs\nAction: calculate: 51 * 2 + (3.5 / 7) - 2 ** 3\nPAUSE",
+    "Thought: I should create a new sql query using sql_query\n"
+    "Action: sql_query: (\"brand\", [\"cocacola\", \"pepsi\"], 0.1)\nPAUSE",
+    "Thought: I know the answer.\n" + "Some reasoning line.\n" * 20 + "Answer: 2 bulldogs weight 102 lbs",
+]
+
+
+def sql_query(column, values, change_price):
+    return "New Scenario created"
+
+
+baseline_actions = {"calculate": lambda what: eval(what), "sql_query": sql_query}
+
+
+def baseline(result):
+    action_re = re.compile(r'^Action: (\w+): (.*)$')
+    actions = [action_re.match(a) for a in result.split('\n') if action_re.match(a)]
+    if actions:
+        action, action_input = actions[0].groups()
+        if action not in baseline_actions:
+            raise Exception("Unknown action: {}: {}".format(action, action_input))
+        if action == 'sql_query':
+            return baseline_actions[action](*ast.literal_eval(action_input))
+        return baseline_actions[action](action_input)
+
+
+registry = ActionRegistry()
+registry.register("calculate", calculate)
+registry.register("sql_query", sql_query, decode=literal_args)
+
+
+def engine(result):
+    actions = parse_actions(result)
+    if actions:
+        return registry.dispatch(*actions[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="iterations per response")
+    args = parser.parse_args()
+    for response in RESPONSES:
+        assert baseline(response) == engine(response)
+    print(f"{'response':<12}{'baseline us':>14}{'engine us':>12}{'speedup':>10}")
+    for i, response in enumerate(RESPONSES):
+        before = min(timeit.repeat(lambda: baseline(response), number=args.number, repeat=3)) / args.number
+        after = min(timeit.repeat(lambda: engine(response), number=args.number, repeat=3)) / args.number
+        print(f"{i:<12}{before * 1e6:>14.2f}{after * 1e6:>12.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
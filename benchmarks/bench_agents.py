@@ -0,0 +1,207 @@
+"""
+End-to-end benchmark of the three agents (lang_graph.Agent, essay_writer.EssayAgent and open_ai_react.query) against
+the fake LLM and search backends of benchmarks/fakes.py, so runs are repeatable and need no API keys.
+
+For every agent and scenario size it reports the wall time, the throughput at the given concurrency, the p50/p95
+latency of every graph node, the LLM calls and tokens, and (with --memory) the peak traced memory.
+
+Usage:
+    python benchmarks/bench_agents.py [--agents react,essay,openai] [--scenarios small,medium,large]
+                                      [--llm-latency lognormal:0.05:0.5] [--search-latency lognormal:0.1:0.5]
+                                      [--concurrency 4] [--memory] [--json results.json]
+                                      [--trace spans.jsonl] [--metrics metrics.prom]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# The agent modules read their settings at import time, keep them away from real credentials and files.
+TMP_DIR = tempfile.mkdtemp(prefix="bench_agents_")
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ["TAVILY_API_KEY"] = "fake"
+os.environ["CHECKPOINT_DB"] = os.path.join(TMP_DIR, "checkpoints.sqlite")
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from checkpointer import DurableSqliteSaver  # noqa: E402
+from clients import tavily_search_tool  # noqa: E402
+from essay_writer import FAST_ROUTES, EssayAgent  # noqa: E402
+from fakes import FakeChatModel, FakeOpenAIClient, FakeSearchClient, Latency, Usage  # noqa: E402
+from lang_graph import Agent  # noqa: E402
+from routing import ModelRouter  # noqa: E402
+from tracing import Tracer  # noqa: E402
+import open_ai_react  # noqa: E402
+
+# Scenario sizes: runs per scenario, tool calls (or search queries) per turn and essay revisions.
+SCENARIOS = {
+    "small": {"runs": 4, "tool_calls": 1, "revisions": 1},
+    "medium": {"runs": 8, "tool_calls": 3, "revisions": 2},
+    "large": {"runs": 16, "tool_calls": 5, "revisions": 4},
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def timed_stream(graph, inputs, config, timings):
+    """
+    Runs a graph, attributing the time between two consecutive updates to the nodes of the later one.
+    """
+    start = time.perf_counter()
+    for event in graph.stream(inputs, config, stream_mode="updates"):
+        now = time.perf_counter()
+        for node in event:
+            timings[node].append(now - start)
+        start = now
+
+
+def make_model(scenario, args, usage, routes):
+    """
+    Creates the fake model of an agent, or with --fast-llm-latency a router over a strong and a fast fake model.
+    """
+    def model(latency):
+        return FakeChatModel(latency=Latency.parse(latency), tool_calls=scenario["tool_calls"],
+                             response_words=args.response_words, usage=usage)
+
+    if not args.fast_llm_latency:
+        return model(args.llm_latency)
+    return ModelRouter(model(args.llm_latency), fast=model(args.fast_llm_latency), routes=routes)
+
+
+def react_runner(scenario, args, usage):
+    model = make_model(scenario, args, usage, {"llm": "fast"})
+    search = FakeSearchClient(Latency.parse(args.search_latency))
+    checkpointer = DurableSqliteSaver.from_path(os.path.join(TMP_DIR, f"react-{uuid.uuid4().hex}.sqlite"))
+    agent = Agent(model, [tavily_search_tool(search, max_results=2)], checkpointer=checkpointer,
+                  system="You are a smart research assistant.", tracer=args.tracer)
+
+    def run(i, timings):
+        config = {"configurable": {"thread_id": f"react-{i}"}}
+        timed_stream(agent.graph, {"messages": [HumanMessage(content=f"question {i}")]}, config, timings)
+
+    return run
+
+
+def essay_runner(scenario, args, usage):
+    model = make_model(scenario, args, usage, FAST_ROUTES)
+    search = FakeSearchClient(Latency.parse(args.search_latency))
+    checkpointer = DurableSqliteSaver.from_path(os.path.join(TMP_DIR, f"essay-{uuid.uuid4().hex}.sqlite"))
+    agent = EssayAgent(model=model, search_tool=search, checkpointer=checkpointer, tracer=args.tracer)
+
+    def run(i, timings):
+        config = {"configurable": {"thread_id": f"essay-{i}"}}
+        inputs = {"task": f"topic {i}", "max_revisions": scenario["revisions"], "revision_number": 1}
+        timed_stream(agent.graph, inputs, config, timings)
+
+    return run
+
+
+def openai_runner(scenario, args, usage):
+    client = FakeOpenAIClient(Latency.parse(args.llm_latency))
+    client.usage = usage
+
+    def run(i, timings):
+        start = time.perf_counter()
+        open_ai_react.query(f"How much do 2 pencils and a notebook cost? ({i})", client=client)
+        timings["query"].append(time.perf_counter() - start)
+
+    return run
+
+
+RUNNERS = {"react": react_runner, "essay": essay_runner, "openai": openai_runner}
+
+
+def bench(agent, scenario_name, args):
+    scenario = SCENARIOS[scenario_name]
+    usage = Usage()
+    run = RUNNERS[agent](scenario, args, usage)
+    timings = defaultdict(list)
+    if args.memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    # The agents print their progress, keep it out of the report.
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        # Every run gets its own timings so concurrent runs don't interleave their updates.
+        per_run = [defaultdict(list) for _ in range(scenario["runs"])]
+        list(executor.map(run, range(scenario["runs"]), per_run))
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if args.memory else 0
+    if args.memory:
+        tracemalloc.stop()
+    for run_timings in per_run:
+        for node, values in run_timings.items():
+            timings[node].extend(values)
+    return {
+        "agent": agent,
+        "scenario": scenario_name,
+        **scenario,
+        "concurrency": args.concurrency,
+        "wall_s": wall,
+        "runs_per_s": scenario["runs"] / wall,
+        "nodes": {
+            node: {"count": len(v), "p50_ms": percentile(v, 0.5) * 1e3, "p95_ms": percentile(v, 0.95) * 1e3}
+            for node, v in timings.items()
+        },
+        "llm": usage.as_dict(),
+        "peak_memory_mb": peak / 2 ** 20,
+    }
+
+
+def print_result(result):
+    llm = result["llm"]
+    print(f"{result['agent']:<8}{result['scenario']:<8}{result['runs']:>5}{result['wall_s']:>9.2f}"
+          f"{result['runs_per_s']:>9.2f}{llm['calls']:>7}{llm['input_tokens']:>10}{llm['output_tokens']:>9}"
+          f"{result['peak_memory_mb']:>9.1f}")
+    for node, stats in result["nodes"].items():
+        print(f"{'':<16}{node:<20}{stats['count']:>5}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", default=",".join(RUNNERS), help="comma separated agents to run")
+    parser.add_argument("--scenarios", default="small,medium", help="comma separated scenario sizes")
+    parser.add_argument("--llm-latency", default="lognormal:0.05:0.5", help="kind:mean[:sigma] or seconds")
+    parser.add_argument("--fast-llm-latency", help="route the cheap nodes to a fast model with this latency")
+    parser.add_argument("--search-latency", default="lognormal:0.1:0.5", help="kind:mean[:sigma] or seconds")
+    parser.add_argument("--response-words", type=int, default=200, help="words per model answer")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent runs")
+    parser.add_argument("--memory", action="store_true", help="trace the peak memory (slows the runs down)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--trace", help="export the node spans to this JSON lines file")
+    parser.add_argument("--metrics", help="write the Prometheus metrics of the traced nodes to this file")
+    args = parser.parse_args()
+    args.tracer = Tracer(path=args.trace) if args.trace or args.metrics else None
+
+    results = []
+    print(f"{'agent':<8}{'size':<8}{'runs':>5}{'wall s':>9}{'runs/s':>9}{'calls':>7}{'tok in':>10}{'tok out':>9}"
+          f"{'peak MB':>9}")
+    print(f"{'':<16}{'node':<20}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}")
+    for agent in args.agents.split(","):
+        for scenario in args.scenarios.split(","):
+            result = bench(agent, scenario, args)
+            print_result(result)
+            results.append(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.metrics:
+        args.tracer.write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
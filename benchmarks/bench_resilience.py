@@ -0,0 +1,162 @@
+"""
+Resilience benchmark: calls the real Tavily and OpenAI clients against a local FlakyServer injecting errors, hangs
+and tail latency, with and without the retries, timeouts and hedging of src/resilience.py. Reports the success rate,
+the latency percentiles and the requests the server received.
+
+The "stream" and "slow-stream" targets stream a FakeChatModel to a token sink through a ModelRouter, the first with
+faults injected mid-stream, the second with streams outlasting --timeout. They check that the client never receives
+a token twice ("garbled" calls, where the tokens sent are not a prefix of the answer), and the benchmark exits with
+status 1 if it does.
+
+Usage:
+    python benchmarks/bench_resilience.py [--calls 400] [--concurrency 8] [--error-rate 0.05] [--hang-rate 0.02]
+                                          [--hang-seconds 2] [--latency lognormal:0.02:0.5] [--timeout 1]
+                                          [--targets search,llm,stream,slow-stream]
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from clients import TavilySearchClient, make_chat_model  # noqa: E402
+from fakes import FakeChatModel, Faults, FlakyServer, Latency, Usage  # noqa: E402
+from resilience import CircuitBreaker, Policy  # noqa: E402
+from routing import STRONG, ModelRouter  # noqa: E402
+from streaming import TOKEN_SINK  # noqa: E402
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def policies(args):
+    return {
+        "none": Policy("none", attempts=1),
+        "retry": Policy("retry", attempts=4, backoff=0.05, timeout=args.timeout,
+                        breaker=CircuitBreaker("retry", failure_threshold=50)),
+        "retry+hedge": Policy("retry+hedge", attempts=4, backoff=0.05, timeout=args.timeout,
+                              hedge_after=args.hedge_after, idempotent=True,
+                              breaker=CircuitBreaker("retry+hedge", 50)),
+    }
+
+
+def make_call(target, server):
+    if target == "search":
+        client = TavilySearchClient(api_key="fake", base_url=server.url)
+        return lambda i: client.search(f"query {i}", max_results=2)
+    model = make_chat_model("gpt-4o", base_url=f"{server.url}/v1", api_key="fake")
+    return lambda i: model.invoke(f"question {i}")
+
+
+def report(target, name, results, requests, wall, garbled=None):
+    latencies = [seconds for _, seconds in results]
+    ok = sum(1 for success, _ in results if success)
+    print(f"{target:<13}{name:<13}{100 * ok / len(results):>6.1f}%{percentile(latencies, 0.5) * 1e3:>9.1f}"
+          f"{percentile(latencies, 0.95) * 1e3:>9.1f}{percentile(latencies, 0.99) * 1e3:>9.1f}"
+          f"{max(latencies) * 1e3:>9.1f}{requests:>10}{wall:>8.2f}{'-' if garbled is None else garbled:>9}")
+
+
+def bench(target, name, policy, args):
+    server = FlakyServer(Latency.parse(args.latency), error_rate=args.error_rate, hang_rate=args.hang_rate,
+                         hang_seconds=args.hang_seconds)
+    with server:
+        call = make_call(target, server)
+
+        def run(i):
+            start = time.perf_counter()
+            try:
+                policy.call(call, i)
+                return True, time.perf_counter() - start
+            except Exception:
+                return False, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(run, range(args.calls)))
+        wall = time.perf_counter() - start
+    report(target, name, results, server.usage.calls + server.errors, wall)
+
+
+def bench_stream(target, name, policy, args):
+    """
+    Streams answers of 20 words through a router under `policy` and returns the number of garbled calls.
+    """
+    usage = Usage()
+    if target == "stream":
+        calls = args.calls
+        model = FakeChatModel(latency=Latency.parse(args.latency), response_words=20, usage=usage,
+                              faults=Faults(error_rate=args.error_rate, mid_stream=True))
+    else:
+        calls = min(args.calls, 4 * args.concurrency)  # Every stream takes --hang-seconds
+        model = FakeChatModel(latency=Latency.parse(args.latency), response_words=20, usage=usage,
+                              token_seconds=args.hang_seconds / 20)
+    router = ModelRouter(model, policies={STRONG: policy})
+
+    def run(i):
+        messages = [HumanMessage(content=f"question {i}")]
+        tokens = []
+        config = {"configurable": {TOKEN_SINK: lambda node, delta: tokens.append(delta)}}
+        start = time.perf_counter()
+        try:
+            response = router.invoke("answer", messages, config)
+            success = True
+        except Exception:
+            response, success = None, False
+        seconds = time.perf_counter() - start
+        time.sleep(args.hang_seconds / 10)  # Lets abandoned attempts send their late tokens
+        sent, answer = "".join(tokens), model.respond(messages, None)[0]
+        garbled = not answer.startswith(sent) or (success and response.content != sent)
+        return success, seconds, garbled
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(run, range(calls)))
+    wall = time.perf_counter() - start
+    garbled = sum(1 for *_, bad in results if bad)
+    report(target, name, [(success, seconds) for success, seconds, _ in results], usage.calls, wall, garbled)
+    return garbled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="requests answered with a 429 or 500")
+    parser.add_argument("--hang-rate", type=float, default=0.02, help="requests that hang for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=2.0)
+    parser.add_argument("--latency", default="lognormal:0.02:0.5", help="latency distribution of every request")
+    parser.add_argument("--timeout", type=float, default=1.0, help="seconds an attempt may take")
+    parser.add_argument("--hedge-after", type=float, default=0.1, help="minimum delay before a hedged request")
+    parser.add_argument("--targets", default="search,llm,stream,slow-stream",
+                        help="comma separated: search, llm, stream, slow-stream")
+    args = parser.parse_args()
+    # The retries log a warning each, keep them out of the report.
+    logging.getLogger("resilience").setLevel(logging.ERROR)
+
+    print(f"{'target':<13}{'policy':<13}{'ok':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'requests':>10}{'wall s':>8}{'garbled':>9}")
+    garbled = 0
+    for target in args.targets.split(","):
+        for name, policy in policies(args).items():
+            with contextlib.redirect_stderr(io.StringIO()):
+                if target in ("stream", "slow-stream"):
+                    garbled += bench_stream(target, name, policy, args)
+                else:
+                    bench(target, name, policy, args)
+    if garbled:
+        sys.exit(f"{garbled} streamed calls sent tokens twice")
+
+
+if __name__ == "__main__":
+    main()
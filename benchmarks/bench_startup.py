@@ -0,0 +1,60 @@
+"""
+Cold start benchmark of the agent modules: every import runs in a fresh interpreter, the way a newly spawned worker
+pays for it. Reports the median import time and which heavy dependencies the import pulled in.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--modules lang_graph,essay_writer,open_ai_react]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Dependencies that should only be loaded once a client, model or checkpointer is actually used.
+HEAVY_MODULES = [
+    "openai",
+    "langchain_openai",
+    "httpx",
+    "numpy",
+    "langchain_core.tools",
+    "langgraph.checkpoint.sqlite",
+    "dotenv",
+]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(src=SRC_DIR, module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True, cwd=SRC_DIR,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--modules", default="lang_graph,essay_writer,open_ai_react", help="comma separated modules")
+    args = parser.parse_args()
+    print(f"{'module':<16}{'median ms':>11}{'min ms':>9}  heavy dependencies loaded")
+    for module in args.modules.split(","):
+        runs = [probe(module) for _ in range(args.repeat)]
+        times = [r["seconds"] * 1e3 for r in runs]
+        loaded = ", ".join(runs[-1]["loaded"]) or "-"
+        print(f"{module:<16}{statistics.median(times):>11.1f}{min(times):>9.1f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark of the size of the graph state: how many bytes a long conversation writes to the checkpointer per step,
+with and without blobs, and how long the messages reducer takes as the history grows.
+
+Usage:
+    python benchmarks/bench_state.py [--turns 20] [--tool-calls 3] [--result-words 200] [--steps 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_state_")
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ["TAVILY_API_KEY"] = "fake"
+os.environ["CHECKPOINT_DB"] = os.path.join(TMP_DIR, "checkpoints.sqlite")
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.graph import add_messages  # noqa: E402
+
+from append_log import append_messages  # noqa: E402
+from checkpointer import DurableSqliteSaver  # noqa: E402
+from clients import tavily_search_tool  # noqa: E402
+from fakes import FakeChatModel, FakeSearchClient, Latency  # noqa: E402
+from lang_graph import Agent  # noqa: E402
+
+
+def checkpoint_sizes(turns, tool_calls, result_words, blob_threshold):
+    """
+    Runs a conversation of `turns` questions on one thread and returns the bytes of every checkpoint and of the
+    blobs.
+    """
+    path = os.path.join(TMP_DIR, f"state-{blob_threshold}.sqlite")
+    checkpointer = DurableSqliteSaver.from_path(path, max_checkpoints_per_thread=None, blob_threshold=blob_threshold)
+    model = FakeChatModel(latency=Latency(mean=0), tool_calls=tool_calls)
+    search = FakeSearchClient(Latency(mean=0), result_words=result_words)
+    agent = Agent(model, [tavily_search_tool(search, max_results=2)], checkpointer=checkpointer)
+    config = {"configurable": {"thread_id": "conversation"}}
+    for turn in range(turns):
+        agent.graph.invoke({"messages": [HumanMessage(content=f"question {turn}")]}, config)
+    with checkpointer.cursor(transaction=False) as cur:
+        sizes = [row[0] for row in cur.execute("SELECT length(checkpoint) FROM checkpoints ORDER BY thread_ts")]
+        blobs = cur.execute("SELECT count(*), coalesce(sum(length(CAST(data AS BLOB))), 0) FROM blobs").fetchone()
+    return sizes, blobs
+
+
+def reducer_seconds(reducer, steps):
+    messages = reducer([], [HumanMessage(content="question")])
+    start = time.perf_counter()
+    for i in range(steps):
+        messages = reducer(messages, [AIMessage(content=f"answer {i}")])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20, help="questions asked on the thread")
+    parser.add_argument("--tool-calls", type=int, default=3, help="tool calls per question")
+    parser.add_argument("--result-words", type=int, default=200, help="words per search result")
+    parser.add_argument("--steps", type=int, default=2000, help="reducer calls of the reducer benchmark")
+    args = parser.parse_args()
+
+    print(f"{'blobs':<10}{'steps':>7}{'first B':>10}{'last B':>10}{'written KB':>12}{'KB/step':>9}{'blob KB':>9}")
+    for blob_threshold in (None, 512):
+        sizes, (blob_count, blob_bytes) = checkpoint_sizes(
+            args.turns, args.tool_calls, args.result_words, blob_threshold
+        )
+        written = sum(sizes) + blob_bytes
+        label = "off" if blob_threshold is None else f">={blob_threshold}"
+        print(f"{label:<10}{len(sizes):>7}{sizes[0]:>10}{sizes[-1]:>10}{written / 1024:>12.1f}"
+              f"{written / len(sizes) / 1024:>9.2f}{blob_bytes / 1024:>9.1f}")
+
+    print(f"\n{'reducer':<18}{'steps':>7}{'ms':>10}")
+    for name, reducer in (("add_messages", add_messages), ("append_messages", append_messages)):
+        print(f"{name:<18}{args.steps:>7}{reducer_seconds(reducer, args.steps) * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
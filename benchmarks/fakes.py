@@ -0,0 +1,421 @@
+"""
+Deterministic local stand-ins for the OpenAI and Tavily backends, so the agents can be run and measured without API
+keys or network access.
+
+`Faults` makes the fakes fail, and `FlakyServer` serves the OpenAI chat completions and Tavily search APIs over HTTP
+with injected errors, hangs and tail latency, to exercise the real clients and the resilience layer.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+import typing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+WORDS = (
+    "the of and to in is that for it as was with be by on not this are from at or an have which but their "
+    "history research essay economy climate science policy growth energy society culture data evidence model "
+    "result analysis impact future market people government technology change system study effect"
+).split()
+
+
+class Latency:
+    """
+    A latency distribution, sampled in seconds.
+
+    Parameters:
+        kind (str): "constant", "uniform" (between 0 and 2 * mean) or "lognormal" (median `mean`, shape `sigma`).
+        mean (float): The mean (median for lognormal) latency in seconds.
+        sigma (float): The shape of the lognormal distribution.
+        seed (int): The seed of the random generator.
+    """
+
+    def __init__(self, kind="constant", mean=0.0, sigma=0.5, seed=0):
+        self.kind = kind
+        self.mean = mean
+        self.sigma = sigma
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Parses "kind:mean[:sigma]", e.g. "lognormal:0.2:0.6", or a plain number of seconds.
+        """
+        parts = str(spec).split(":")
+        if len(parts) == 1:
+            return cls("constant", float(parts[0]))
+        return cls(parts[0], float(parts[1]), *(float(p) for p in parts[2:]))
+
+    def sample(self):
+        with self.lock:
+            if self.kind == "constant":
+                return self.mean
+            if self.kind == "uniform":
+                return self.random.uniform(0, 2 * self.mean)
+            if self.kind == "lognormal":
+                return self.mean * self.random.lognormvariate(0, self.sigma)
+        raise ValueError(f"unknown latency distribution {self.kind!r}")
+
+    def sleep(self):
+        delay = self.sample()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class FakeTransientError(ConnectionError):
+    """
+    The error raised by the fakes on an injected fault; resilience treats it as transient.
+    """
+
+
+class Faults:
+    """
+    Injects failures into a fake backend: each call fails with probability `error_rate`, and the first
+    `fail_first` calls always fail. With `mid_stream`, streamed calls fail after their first tokens instead of before.
+    """
+
+    def __init__(self, error_rate=0.0, fail_first=0, seed=0, mid_stream=False):
+        self.error_rate = error_rate
+        self.fail_first = fail_first
+        self.mid_stream = mid_stream
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def should_fail(self):
+        with self.lock:
+            self.calls += 1
+            fail = self.calls <= self.fail_first or self.random.random() < self.error_rate
+            self.failures += fail
+            return fail
+
+    def check(self, name="fake backend"):
+        if self.should_fail():
+            raise FakeTransientError(f"{name}: injected failure")
+
+
+class Usage:
+    """
+    Thread-safe counters of the calls and tokens of the fake backends.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, input_tokens, output_tokens):
+        with self.lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+    def as_dict(self):
+        return {"calls": self.calls, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens}
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def fake_text(seed_text, words):
+    """
+    Generates `words` words of filler text, deterministic for a given seed text.
+    """
+    rng = random.Random(hashlib.sha1(seed_text.encode("utf-8")).hexdigest())
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def fake_value(annotation, name, seed_text, items):
+    origin = typing.get_origin(annotation)
+    if origin in (list, List):
+        (item_type,) = typing.get_args(annotation) or (str,)
+        return [fake_value(item_type, f"{name} {i}", seed_text, items) for i in range(items)]
+    if annotation is int:
+        return 7
+    if annotation is float:
+        return 0.5
+    if annotation is bool:
+        return True
+    return f"{name}: {fake_text(seed_text + name, 6)}"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A deterministic chat model with configurable latency and response size.
+
+    When tools are bound and the last message is from the user, it answers with `tool_calls` calls to the first tool;
+    otherwise it answers with `response_words` words of text. `with_structured_output` returns an instance of the
+    schema with every field filled in (lists get `tool_calls` items). With `faults`, calls fail as they tell.
+    Streamed text answers wait `token_seconds` before every token after the first.
+    """
+
+    latency: Any = None
+    token_seconds: float = 0.0
+    tool_calls: int = 3
+    response_words: int = 200
+    usage: Any = None
+    faults: Any = None
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[getattr(t, "name", t) for t in tools], **kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        def respond(messages):
+            seed_text = str(messages[-1].content) if messages else ""
+            self.wait()
+            self.record(messages, seed_text)
+            return schema(**{
+                name: fake_value(field.outer_type_, name, seed_text, self.tool_calls)
+                for name, field in schema.__fields__.items()
+            })
+
+        return RunnableLambda(respond)
+
+    def wait(self, stream=False):
+        if self.latency is not None:
+            self.latency.sleep()
+        if self.faults is not None and not (stream and self.faults.mid_stream):
+            self.faults.check("chat model")
+
+    def record(self, messages, output):
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(output)
+        if self.usage is not None:
+            self.usage.add(input_tokens, output_tokens)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def respond(self, messages, tools):
+        last = messages[-1]
+        if tools and isinstance(last, HumanMessage):
+            tool_calls = [
+                {"name": tools[0], "args": {"query": f"{last.content} {i}"}, "id": f"call_{i}_{id(last)}"}
+                for i in range(self.tool_calls)
+            ]
+            return "", tool_calls
+        seed_text = "\n".join(str(m.content) for m in messages if not isinstance(m, ToolMessage))
+        return fake_text(seed_text, self.response_words), []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content, tool_calls = self.respond(messages, kwargs.get("tools"))
+        self.wait()
+        message = AIMessage(content=content, tool_calls=tool_calls)
+        message.usage_metadata = self.record(messages, content)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        content, tool_calls = self.respond(messages, kwargs.get("tools"))
+        self.wait(stream=True)
+        fail = self.faults is not None and self.faults.mid_stream and self.faults.should_fail()
+        self.record(messages, content)
+        if tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": t["name"], "args": str(t["args"]).replace("'", '"'), "id": t["id"], "index": i}
+                for i, t in enumerate(tool_calls)
+            ]))
+            return
+        for i, word in enumerate(content.split(" ")):
+            if i == 2 and fail:
+                raise FakeTransientError("chat model: injected failure mid-stream")
+            if i and self.token_seconds:
+                time.sleep(self.token_seconds)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeSearchClient:
+    """
+    A search client with the `search` method of TavilyClient, returning deterministic results after a latency
+    sampled from a distribution. With `faults`, searches fail as they tell.
+    """
+
+    def __init__(self, latency=None, result_words=80, faults=None):
+        self.latency = latency
+        self.result_words = result_words
+        self.faults = faults
+        self.usage = Usage()
+
+    def search(self, query, max_results=5, **kwargs):
+        if self.latency is not None:
+            self.latency.sleep()
+        if self.faults is not None:
+            self.faults.check("search")
+        self.usage.add(estimate_tokens(query), 0)
+        return {
+            "query": query,
+            "results": [
+                {"url": f"https://example.com/{i}", "content": fake_text(f"{query} {i}", self.result_words)}
+                for i in range(max_results)
+            ],
+        }
+
+
+class FakeOpenAIClient:
+    """
+    An OpenAI client stand-in for open_ai_react: `client.chat.completions.create(...)` follows a fixed
+    get_price -> calculate -> Answer script, keyed on the number of observations in the conversation.
+    """
+
+    SCRIPT = [
+        "Thought: I should look up the prices of the items\nAction: get_price: pencil, notebook\nPAUSE",
+        "Thought: I should calculate the cost of 2 pencils and a notebook\nAction: calculate: 2 * 1.0 + 2.5\nPAUSE",
+        "Answer: 2 pencils and a notebook cost 4.5 Euros",
+    ]
+
+    def __init__(self, latency=None):
+        self.latency = latency
+        self.usage = Usage()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, stream=False, **kwargs):
+        if self.latency is not None:
+            self.latency.sleep()
+        observations = sum(1 for m in messages if m["role"] == "user" and m["content"].startswith("Observation"))
+        content = self.SCRIPT[min(observations, len(self.SCRIPT) - 1)]
+        self.usage.add(sum(estimate_tokens(m["content"]) for m in messages), estimate_tokens(content))
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        return (
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+            for word in content.split(" ")
+        )
+
+
+class FlakyServer:
+    """
+    A local HTTP server speaking the OpenAI chat completions (POST /v1/chat/completions, not streamed) and Tavily
+    search (POST /search) APIs, with injected faults, so the real clients and the resilience layer can be tested
+    without network access.
+
+    Every request waits a latency sampled from `latency`, then fails with a 500 or 429 with probability
+    `error_rate`, or hangs for `hang_seconds` with probability `hang_rate` (the tail latency a hedged request
+    avoids).
+
+    Example:
+        with FlakyServer(error_rate=0.2) as server:
+            client = TavilySearchClient(api_key="fake", base_url=server.url)
+            model = make_chat_model("gpt-4o", base_url=f"{server.url}/v1", api_key="fake")
+
+    Attributes:
+        url (str): The base URL of the server, once started.
+        usage (Usage): The requests answered successfully.
+        errors (int): The requests answered with an error.
+        hangs (int): The requests that hung.
+    """
+
+    def __init__(self, latency=None, error_rate=0.0, hang_rate=0.0, hang_seconds=10.0, result_words=80, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.result_words = result_words
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.usage = Usage()
+        self.errors = 0
+        self.hangs = 0
+        self.server = None
+        self.url = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        fakes = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                status, payload = fakes.respond(self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def fault(self):
+        with self.lock:
+            draw = self.random.random()
+            if draw < self.error_rate:
+                self.errors += 1
+                return "error"
+            if draw < self.error_rate + self.hang_rate:
+                self.hangs += 1
+                return "hang"
+        return None
+
+    def respond(self, path, body):
+        if self.latency is not None:
+            self.latency.sleep()
+        fault = self.fault()
+        if fault == "error":
+            status = 429 if self.random.random() < 0.5 else 500
+            return status, {"error": {"message": "injected failure", "type": "server_error"}}
+        if fault == "hang":
+            time.sleep(self.hang_seconds)
+        if path.endswith("/chat/completions"):
+            messages = body.get("messages") or []
+            content = fake_text(json.dumps(messages), 40)
+            input_tokens = sum(estimate_tokens(str(m.get("content"))) for m in messages)
+            self.usage.add(input_tokens, estimate_tokens(content))
+            return 200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": input_tokens, "completion_tokens": estimate_tokens(content),
+                          "total_tokens": input_tokens + estimate_tokens(content)},
+            }
+        if path.endswith("/search"):
+            query = body.get("query", "")
+            self.usage.add(estimate_tokens(query), 0)
+            return 200, {
+                "query": query,
+                "results": [
+                    {"url": f"https://example.com/{i}", "content": fake_text(f"{query} {i}", self.result_words)}
+                    for i in range(int(body.get("max_results", 5)))
+                ],
+            }
+        return 404, {"error": {"message": f"unknown path {path}"}}
@@ -0,0 +1,146 @@
+import ast
+import operator
+import re
+from functools import lru_cache
+
+# Matches the "Action: <name>: <input>" lines of a model response.
+ACTION_RE = re.compile(r"^Action: (\w+): (.*)$", re.MULTILINE)
+
+
+class UnknownAction(Exception):
+    pass
+
+
+def parse_actions(text):
+    """
+    Extracts all the actions of a model response in a single pass.
+
+    Parameters:
+        text (str): The model response.
+
+    Returns:
+        list[tuple[str, str]]: The (action name, raw input) pairs, in the order they appear.
+    """
+    return [(m.group(1), m.group(2).strip()) for m in ACTION_RE.finditer(text)]
+
+
+def text(raw):
+    """Passes the action input as a single string argument."""
+    return (raw,)
+
+
+def literal_args(raw):
+    """Decodes the action input as a Python literal, e.g. ("brand", ["cocacola", "pepsi"], 0.5), into arguments."""
+    value = ast.literal_eval(raw)
+    return value if isinstance(value, tuple) else (value,)
+
+
+class ActionRegistry:
+    """
+    Maps action names to their functions and to the decoder turning the raw action input into arguments.
+    """
+
+    def __init__(self):
+        self.actions = {}
+
+    def register(self, name, func, decode=text):
+        self.actions[name] = (func, decode)
+        return func
+
+    def __contains__(self, name):
+        return name in self.actions
+
+    def dispatch(self, name, raw):
+        """
+        Decodes the raw input of an action and runs it.
+
+        Raises:
+            UnknownAction: If no action is registered under `name`.
+        """
+        try:
+            func, decode = self.actions[name]
+        except KeyError:
+            raise UnknownAction("Unknown action: {}: {}".format(name, raw)) from None
+        return func(*decode(raw))
+
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+}
+MAX_EXPONENT = 1000
+# Integers are unbounded in Python: nested powers such as ((2**1000)**1000)**1000 would take hours and all the memory,
+# so every intermediate integer is kept under this size (about 3000 digits).
+MAX_INT_BITS = 10_000
+
+
+def _checked(value):
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ValueError(f"result is too large (over {MAX_INT_BITS} bits)")
+    return value
+
+
+def _power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise ValueError(f"exponent {exponent} is too large")
+    # The result has at least (bits - 1) * exponent bits: refuse it before computing it.
+    if isinstance(base, int) and isinstance(exponent, int) and (abs(base).bit_length() - 1) * exponent > MAX_INT_BITS:
+        raise ValueError(f"result is too large (over {MAX_INT_BITS} bits)")
+    return operator.pow(base, exponent)
+
+
+def _compile_node(node):
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = node.value
+        return lambda: value
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        op = _power if isinstance(node.op, ast.Pow) else BINARY_OPERATORS[type(node.op)]
+        left, right = _compile_node(node.left), _compile_node(node.right)
+        return lambda: _checked(op(left(), right()))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        op, operand = UNARY_OPERATORS[type(node.op)], _compile_node(node.operand)
+        return lambda: op(operand())
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS
+            and not node.keywords):
+        func, args = FUNCTIONS[node.func.id], [_compile_node(a) for a in node.args]
+        return lambda: func(*(a() for a in args))
+    raise ValueError(f"unsupported expression: {ast.dump(node)}")
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression):
+    """
+    Compiles an arithmetic expression into a function evaluating it.
+
+    Only numbers, the + - * / // % ** operators, parentheses and the abs, round, min and max functions are allowed,
+    so unlike `eval` the expression cannot run arbitrary code. Compiled expressions are memoized.
+
+    Raises:
+        ValueError: If the expression contains anything else.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"invalid expression: {expression}") from e
+    return _compile_node(tree)
+
+
+def calculate(what):
+    return compile_expression(what)()
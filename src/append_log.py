@@ -0,0 +1,143 @@
+import threading
+from uuid import uuid4
+
+from langchain_core.messages import convert_to_messages, message_chunk_to_message
+
+
+class _Store:
+    """
+    The position of every key of the items shared by the versions of an AppendLog, and how many of them are
+    indexed.
+    """
+
+    __slots__ = ("length", "index", "key", "lock")
+
+    def __init__(self, items, key):
+        self.length = 0
+        self.key = key
+        self.index = {}
+        self.lock = threading.Lock()
+        self.add(items)
+
+    def add(self, items):
+        if self.key is not None:
+            for i, item in enumerate(items, self.length):
+                self.index[self.key(item)] = i
+        self.length += len(items)
+
+
+class AppendLog(list):
+    """
+    A list that is extended without indexing its items again.
+
+    The items can be indexed by a `key` function (e.g. the message id) to find the position of an item in constant
+    time. `extended` returns a new log whose index is shared with this one: only the new items are indexed, and every
+    log only trusts the positions below its length, so older versions (e.g. the value of a checkpoint still being
+    written in the background) never see the items of newer ones. Only extending a version that is no longer the
+    latest one, or replacing items, indexes all the items again.
+
+    It is a plain list to its users (graph outputs are JSON serializable and can be appended to), and it is
+    serialized as one, so checkpoints written with it load with or without this class. A log changed in place is
+    no longer the latest version of its index.
+    """
+
+    __slots__ = ("_store",)
+
+    def __init__(self, items=(), key=None):
+        super().__init__(items)
+        self._store = _Store(self, key)
+
+    @classmethod
+    def _view(cls, items, store):
+        log = cls.__new__(cls)
+        list.__init__(log, items)
+        log._store = store
+        return log
+
+    @classmethod
+    def wrap(cls, items, key=None):
+        """
+        Returns `items` if it is already a log with the same key, otherwise a new log of them.
+        """
+        if isinstance(items, AppendLog) and items.key is key:
+            return items
+        return cls(items or (), key)
+
+    @property
+    def key(self):
+        return self._store.key
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def to_list(self):
+        return list(self)
+
+    def position(self, key):
+        """
+        Returns the position of the item with `key`, or None.
+        """
+        i = self._store.index.get(key)
+        if i is None or i >= len(self) or self._store.key(self[i]) != key:
+            return None
+        return i
+
+    def extended(self, items):
+        """
+        Returns a new log with `items` appended, indexing only them unless this log is not the latest version of its
+        index.
+        """
+        items = list(items)
+        if not items:
+            return self
+        store = self._store
+        with store.lock:
+            if len(self) == store.length:
+                store.add(items)
+                return self._view(self + items, store)
+        return type(self)(self + items, store.key)
+
+    def replace(self, replacements):
+        """
+        Returns a new log with the items at the given positions replaced, indexing them all again.
+
+        Parameters:
+            replacements (dict[int, Any]): The new item of every position.
+        """
+        items = list(self)
+        for i, item in replacements.items():
+            items[i] = item
+        return type(self)(items, self._store.key)
+
+
+def message_id(message):
+    return message.id
+
+
+def append_messages(left, right):
+    """
+    Reducer of a messages channel, equivalent to langgraph's `add_messages` but without processing the history again.
+
+    Only the new messages are converted and given ids; they are appended to the current messages, and a message
+    with the id of an existing one replaces it.
+
+    Returns:
+        AppendLog: The messages.
+    """
+    log = AppendLog.wrap(left, message_id)
+    if not isinstance(right, (list, tuple)):
+        right = [right]
+    messages = [message_chunk_to_message(m) for m in convert_to_messages(right)]
+    appended = {}
+    replacements = {}
+    for message in messages:
+        if message.id is None:
+            message.id = str(uuid4())
+        i = log.position(message.id)
+        if i is None:
+            appended[message.id] = message
+        else:
+            replacements[i] = message
+    if replacements:
+        log = log.replace(replacements)
+    return log.extended(appended.values())
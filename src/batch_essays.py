@@ -0,0 +1,295 @@
+"""
+Batch essay generation: runs EssayAgent over a file of topics on a pool of workers.
+
+Usage:
+    python src/batch_essays.py topics.jsonl essays.jsonl [--workers 4] [--mode process|async]
+                               [--llm-rpm 500] [--search-rpm 100] [--max-revisions 2]
+
+Topics are read from a JSONL file ({"id": ..., "topic": ...} per line, "task" is accepted for "topic") or a CSV
+file with the same columns. The id is optional, it defaults to a hash of the topic.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from rate_limit import RateLimitCallback, RateLimitedSearchClient, TokenBucket
+from resilience import arun_with_resume, run_with_resume
+from tracing import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def read_topics(path):
+    """
+    Reads the topics of a JSONL or CSV file.
+
+    Returns:
+        list[dict]: The topics, as {"id", "topic"} dicts plus any other field of the input (e.g. max_revisions).
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    topics = []
+    for row in rows:
+        topic = row.get("topic") or row.get("task")
+        if not topic:
+            raise ValueError(f"topic missing in {row!r}")
+        row_id = row.get("id") or hashlib.sha1(topic.encode("utf-8")).hexdigest()[:16]
+        topics.append({**row, "id": str(row_id), "topic": topic})
+    return topics
+
+
+def completed_ids(path):
+    """
+    Returns the ids of the topics already written to the output file, so an interrupted batch can be restarted.
+    """
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by a crash
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def build_agent(options):
+    """
+    The default agent factory: an EssayAgent on the OpenAI and Tavily APIs, checkpointing to `checkpoint_db`.
+    """
+    from cache import CachedSearchClient, LRUCache
+    from checkpointer import DurableSqliteSaver
+    from clients import TavilySearchClient, make_chat_model
+    from essay_writer import EssayAgent
+
+    return EssayAgent(
+        model=make_chat_model(options["model"]),
+        search_tool=CachedSearchClient(TavilySearchClient(), LRUCache()),
+        checkpointer=DurableSqliteSaver.from_path(options["checkpoint_db"]),
+    )
+
+
+def load_factory(spec):
+    """
+    Resolves an agent factory given as "module:function".
+    """
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+class EssayWorker:
+    """
+    Runs the topics of a batch on one agent, drawing its LLM and search calls from the shared rate limits.
+
+    Every topic runs on its own thread id, derived from the topic id. If the checkpointer already holds a run of
+    that thread, an interrupted run is resumed from its last checkpoint and a finished one is returned as is. A run
+    failing with a transient error is resumed from its last checkpoint too (see `resilience.run_with_resume`).
+    """
+
+    def __init__(self, options, llm_bucket=None, search_bucket=None):
+        self.options = options
+        self.agent = load_factory(options["factory"])(options)
+        self.callbacks = [RateLimitCallback(llm_bucket)] if llm_bucket else []
+        if search_bucket:
+            self.agent.search_tool = RateLimitedSearchClient(self.agent.search_tool, search_bucket)
+
+    def config(self, topic):
+        return {"configurable": {"thread_id": f"essay-{topic['id']}"}, "callbacks": self.callbacks}
+
+    def inputs(self, topic):
+        state = self.agent.graph.get_state(self.config(topic))
+        if state.next:
+            return None  # Resume the interrupted run
+        if state.values.get("draft"):
+            return False  # Already finished
+        return {
+            "task": topic["topic"],
+            "max_revisions": int(topic.get("max_revisions") or self.options["max_revisions"]),
+            "revision_number": 1,
+        }
+
+    @staticmethod
+    def record(topic, values, start):
+        return {
+            "id": topic["id"],
+            "topic": topic["topic"],
+            "status": "ok",
+            "draft": values.get("draft"),
+            "revision_number": values.get("revision_number"),
+            "skipped_revisions": values.get("skipped_revisions") or 0,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    def run(self, topic):
+        start = time.perf_counter()
+        config = self.config(topic)
+        inputs = self.inputs(topic)
+        if inputs is False:
+            values = self.agent.graph.get_state(config).values
+        else:
+            values = run_with_resume(self.agent.graph, inputs, config)
+        return self.record(topic, values, start)
+
+    async def arun(self, topic):
+        start = time.perf_counter()
+        config = self.config(topic)
+        inputs = await asyncio.to_thread(self.inputs, topic)
+        if inputs is False:
+            values = (await asyncio.to_thread(self.agent.graph.get_state, config)).values
+        else:
+            values = await arun_with_resume(self.agent.graph, inputs, config)
+        return self.record(topic, values, start)
+
+
+def error_record(topic, error):
+    return {"id": topic["id"], "topic": topic["topic"], "status": "error", "error": repr(error)}
+
+
+_worker = None
+
+
+def _init_worker(options, llm_bucket, search_bucket):
+    global _worker
+    _worker = EssayWorker(options, llm_bucket, search_bucket)
+
+
+def _run_topic(topic):
+    try:
+        return _worker.run(topic)
+    except Exception as e:
+        return error_record(topic, e)
+
+
+def run_processes(topics, options, workers, llm_bucket, search_bucket):
+    """
+    Runs the topics on a pool of `workers` processes, each with its own agent, yielding the records as they finish.
+
+    At most two topics per worker are submitted at a time, so a large batch is not pickled into the pool upfront.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(options, llm_bucket, search_bucket)) as executor:
+        topics = iter(topics)
+        pending = set()
+        while True:
+            for topic in topics:
+                pending.add(executor.submit(_run_topic, topic))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+async def run_async(topics, options, workers, llm_bucket, search_bucket):
+    """
+    Runs the topics as up to `workers` concurrent runs of a single agent, yielding the records as they finish.
+    """
+    worker = EssayWorker(options, llm_bucket, search_bucket)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run(topic):
+        async with semaphore:
+            try:
+                return await worker.arun(topic)
+            except Exception as e:
+                return error_record(topic, e)
+
+    for result in asyncio.as_completed([run(topic) for topic in topics]):
+        yield await result
+
+
+def run_batch(input_path, output_path, workers=4, mode="process", llm_rpm=None, search_rpm=None, max_revisions=2,
+              model="gpt-4o", checkpoint_db="checkpoints.sqlite", factory="batch_essays:build_agent"):
+    """
+    Generates an essay for every topic of `input_path` and appends the results to `output_path`, one JSON line per
+    topic as soon as it is done. Topics already written with status "ok" are skipped, and topics interrupted by a
+    crash resume from their last checkpoint, so a failed batch is restarted by running it again.
+
+    Parameters:
+        input_path (str): The JSONL or CSV file of topics.
+        output_path (str): The JSONL file of results.
+        workers (int, optional): The number of worker processes, or of concurrent runs in async mode. Defaults to 4.
+        mode (str, optional): "process" (a process pool) or "async" (one event loop). Defaults to "process".
+        llm_rpm (float, optional): The LLM requests per minute of all workers together. Defaults to None (no limit).
+        search_rpm (float, optional): The search requests per minute of all workers together. Defaults to None.
+        max_revisions (int, optional): The revisions of topics that do not set their own. Defaults to 2.
+        model (str, optional): The OpenAI model of the default factory. Defaults to "gpt-4o".
+        checkpoint_db (str, optional): The checkpoint database shared by the workers. Defaults to
+            "checkpoints.sqlite".
+        factory (str, optional): The "module:function" building the agent of a worker from the options dict.
+            Defaults to `build_agent`.
+
+    Returns:
+        dict: The number of topics run, skipped and failed, the elapsed seconds and the essays per second.
+    """
+    options = {"model": model, "checkpoint_db": checkpoint_db, "max_revisions": max_revisions, "factory": factory}
+    done = completed_ids(output_path)
+    topics = [t for t in read_topics(input_path) if t["id"] not in done]
+    shared = mode == "process"
+    context = multiprocessing.get_context("spawn")
+    llm_bucket = TokenBucket.per_minute(llm_rpm, shared, context) if llm_rpm else None
+    search_bucket = TokenBucket.per_minute(search_rpm, shared, context) if search_rpm else None
+    stats = {"topics": len(topics), "skipped": len(done), "ok": 0, "failed": 0}
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as output:
+        def write(record):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            stats["ok" if record["status"] == "ok" else "failed"] += 1
+            logger.info("%s %s (%d/%d)", record["status"], record["id"], stats["ok"] + stats["failed"], len(topics),
+                        extra={"topic_id": record["id"], "status": record["status"]})
+
+        if mode == "process":
+            for record in run_processes(topics, options, workers, llm_bucket, search_bucket):
+                write(record)
+        elif mode == "async":
+            async def consume():
+                async for record in run_async(topics, options, workers, llm_bucket, search_bucket):
+                    write(record)
+
+            asyncio.run(consume())
+        else:
+            raise ValueError(f"mode must be 'process' or 'async', got {mode!r}")
+    stats["seconds"] = time.perf_counter() - start
+    stats["essays_per_second"] = stats["ok"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL or CSV file of topics")
+    parser.add_argument("output", help="JSONL file the essays are appended to")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=["process", "async"], default="process")
+    parser.add_argument("--llm-rpm", type=float, help="LLM requests per minute, all workers together")
+    parser.add_argument("--search-rpm", type=float, help="search requests per minute, all workers together")
+    parser.add_argument("--max-revisions", type=int, default=2)
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--checkpoint-db", default=os.environ.get("CHECKPOINT_DB", "checkpoints.sqlite"))
+    parser.add_argument("--factory", default="batch_essays:build_agent", help="module:function building the agent")
+    args = parser.parse_args()
+    configure_logging()
+    stats = run_batch(args.input, args.output, args.workers, args.mode, args.llm_rpm, args.search_rpm,
+                      args.max_revisions, args.model, args.checkpoint_db, args.factory)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """
+    Normalizes a search query so that trivially different spellings share a cache entry.
+    """
+    return " ".join(str(query).lower().split())
+
+
+def make_cache_key(query, **params):
+    """
+    Builds a content-addressed cache key from the normalized query and the search parameters.
+
+    Parameters:
+        query (str): The search query.
+        **params: Any other parameters of the search call (e.g. max_results).
+
+    Returns:
+        str: A sha256 hex digest identifying the query and parameters.
+    """
+    payload = json.dumps({"query": normalize_query(query), "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BaseCache:
+    """
+    Common interface of the cache backends: `get`, `set` and hit/miss counters.
+
+    Attributes:
+        ttl (float): Seconds an entry stays valid. None means entries never expire.
+        max_entries (int): The maximum number of entries kept before the least recently used ones are evicted.
+        hits (int): The number of lookups that found a valid entry.
+        misses (int): The number of lookups that did not.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class LRUCache(BaseCache):
+    """
+    An in-memory cache with least-recently-used eviction and a time to live.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        super().__init__(max_entries, ttl)
+        self.entries = OrderedDict()  # key -> (created, value), least recently used first
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or self.expired(entry[0]):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SqliteCache(BaseCache):
+    """
+    An on-disk cache stored in a SQLite database, so entries survive restarts and can be shared between processes.
+
+    Values must be JSON serializable. The database file is memory-mapped (`mmap_size`) so that hot entries are
+    read from the page cache without extra copies.
+    """
+
+    def __init__(self, path="search_cache.sqlite", max_entries=100_000, ttl=24 * 3600, mmap_size=256 * 1024 * 1024):
+        super().__init__(max_entries, ttl)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA mmap_size={int(mmap_size)};
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+            """
+        )
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or self.expired(row[1]):
+                if row is not None:
+                    self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            # Evict the least recently used entries once the cache is over its size limit.
+            self.conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache")
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class CachedSearchClient:
+    """
+    Wraps a search client with a `search(query, **kwargs)` method (e.g. TavilyClient) with a cache.
+
+    Attributes:
+        client: The wrapped search client.
+        cache (BaseCache): The cache backend.
+    """
+
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+
+    def search(self, query, **kwargs):
+        key = make_cache_key(query, **kwargs)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.client.search(query=query, **kwargs)
+            self.cache.set(key, result)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def cached_search_tool(tool, cache):
+    """
+    Wraps a LangChain search tool (e.g. TavilySearchResults) with a cache.
+
+    The returned tool keeps the name, description and argument schema of the wrapped tool, so it can be bound to
+    a model in its place.
+
+    Parameters:
+        tool (BaseTool): The search tool to wrap.
+        cache (BaseCache): The cache backend.
+
+    Returns:
+        StructuredTool: The cached tool.
+    """
+    from langchain_core.tools import StructuredTool
+
+    tool_params = {"tool": tool.name}
+    if getattr(tool, "max_results", None) is not None:
+        tool_params["max_results"] = tool.max_results
+
+    def search(query, **kwargs):
+        key = make_cache_key(query, **tool_params, **kwargs)
+        result = cache.get(key)
+        if result is None:
+            result = tool.invoke({"query": query, **kwargs})
+            # TavilySearchResults reports failures as a string instead of raising, so only result lists are cached.
+            if not isinstance(result, str):
+                cache.set(key, result)
+        return result
+
+    async def asearch(query, **kwargs):
+        key = make_cache_key(query, **tool_params, **kwargs)
+        result = cache.get(key)
+        if result is None:
+            result = await tool.ainvoke({"query": query, **kwargs})
+            # TavilySearchResults reports failures as a string instead of raising, so only result lists are cached.
+            if not isinstance(result, str):
+                cache.set(key, result)
+        return result
+
+    return StructuredTool.from_function(
+        func=search,
+        coroutine=asearch,
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+    )
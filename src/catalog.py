@@ -0,0 +1,170 @@
+import csv
+import os
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+NON_WORD_RE = re.compile(r"[^\w.]+")
+QUANTITY_RE = re.compile(r"^\s*\d+(?:\s*x)?\s+", re.IGNORECASE)
+
+
+def normalize(name):
+    """
+    Normalizes an item name for lookups: lower case, punctuation removed, whitespace collapsed and a plural "s"
+    dropped from every word ("Pencils" and "pencil" share a key). Quantities are removed by `strip_quantity`.
+    """
+    words = NON_WORD_RE.sub(" ", name.lower()).split()
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+
+def strip_quantity(name):
+    """
+    Removes a leading quantity from an item name ("2 pencils", "3x notebook"), keeping names that start with a
+    number ("7up 330ml").
+    """
+    return QUANTITY_RE.sub("", name, count=1)
+
+
+def ngrams(text, n=3):
+    padded = f" {text} "
+    return [padded[i:i + n] for i in range(max(1, len(padded) - n + 1))]
+
+
+class Match:
+    """
+    The result of a catalog lookup.
+
+    Attributes:
+        record (dict): The record found, or None if the name is unknown or ambiguous.
+        candidates (list): The names the lookup could not choose between, empty unless the name is ambiguous.
+    """
+
+    __slots__ = ("record", "candidates")
+
+    def __init__(self, record=None, candidates=()):
+        self.record = record
+        self.candidates = list(candidates)
+
+    @property
+    def found(self):
+        return self.record is not None
+
+    @property
+    def ambiguous(self):
+        return bool(self.candidates)
+
+
+class Catalog:
+    """
+    An in-memory index of named records (items, dog breeds, ...).
+
+    Exact lookups go through a dict keyed on the normalized name. A name that is not found exactly is matched on
+    whole words first ("pen" finds "ballpoint pen"), then fuzzily through an inverted index of character n-grams.
+    Both indexes are built once when the catalog is loaded and only the names sharing a word or an n-gram with the
+    query are scored, so the cost of a lookup does not grow with the size of the catalog. A lookup never guesses:
+    when several names match equally well ("terrier"), they are returned as candidates instead of a record.
+
+    Attributes:
+        records (dict): The records, keyed on their normalized name.
+        names (dict): The original names, keyed on their normalized name.
+        min_similarity (float): The minimum Dice similarity of the n-grams of a fuzzy match.
+        margin (float): How far ahead of the runner-up a fuzzy match must score to be chosen.
+        max_candidates (int): The maximum number of candidates returned for an ambiguous name.
+    """
+
+    def __init__(self, records, n=3, min_similarity=0.5, margin=0.1, max_candidates=5):
+        self.n = n
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.max_candidates = max_candidates
+        self.records = {}
+        self.names = {}
+        self.ngram_counts = {}
+        self.index = defaultdict(list)  # n-gram -> normalized names containing it
+        self.words = defaultdict(set)  # word -> normalized names containing it
+        for name, record in records.items():
+            key = normalize(name)
+            self.records[key] = record
+            self.names[key] = name
+            grams = set(ngrams(key, n))
+            self.ngram_counts[key] = len(grams)
+            for gram in grams:
+                self.index[gram].append(key)
+            for word in key.split():
+                self.words[word].add(key)
+
+    @classmethod
+    def from_csv(cls, path, key_column, **kwargs):
+        """
+        Loads a catalog from a CSV file, using `key_column` as the name of every row.
+        """
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls({row[key_column]: row for row in csv.DictReader(f)}, **kwargs)
+
+    def lookup(self, name):
+        """
+        Finds the record of a name: exactly, by its words, or fuzzily.
+
+        Returns:
+            Match: The record, the candidates if several names match equally well, or neither if none is close.
+        """
+        key = normalize(name)
+        if not key:
+            return Match()
+        record = self.records.get(key)
+        if record is not None:
+            return Match(record)
+        matches = self.match_words(key)
+        if not matches:
+            matches = self.match_ngrams(key)
+        if len(matches) == 1:
+            return Match(self.records[matches[0]])
+        return Match(candidates=[self.names[match] for match in matches[:self.max_candidates]])
+
+    def match_words(self, key):
+        """
+        Returns the names containing every word of the key, shortest first.
+        """
+        postings = sorted((self.words.get(word, ()) for word in key.split()), key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        return sorted(matches, key=lambda match: (len(match), match))
+
+    def match_ngrams(self, key):
+        """
+        Returns the names similar enough to the key, best first, keeping only those within `margin` of the best.
+        """
+        grams = set(ngrams(key, self.n))
+        shared = Counter(candidate for gram in grams for candidate in self.index.get(gram, ()))
+        scores = {
+            candidate: 2 * count / (len(grams) + self.ngram_counts[candidate]) for candidate, count in shared.items()
+        }
+        matches = sorted((c for c, score in scores.items() if score >= self.min_similarity), key=scores.get,
+                         reverse=True)
+        if not matches:
+            return []
+        best = scores[matches[0]]
+        return [match for match in matches if scores[match] > best - self.margin]
+
+    def lookup_many(self, names):
+        return [self.lookup(name) for name in names]
+
+    def __len__(self):
+        return len(self.records)
+
+
+@lru_cache(maxsize=None)
+def products():
+    return Catalog.from_csv(os.path.join(DATA_DIR, "products.csv"), "name")
+
+
+@lru_cache(maxsize=None)
+def dog_breeds():
+    return Catalog.from_csv(os.path.join(DATA_DIR, "dog_breeds.csv"), "breed")
+
+
+def split_names(names):
+    """
+    Splits a batch lookup input ("pencil, notebook") into names.
+    """
+    return [name.strip() for name in names.split(",") if name.strip()]
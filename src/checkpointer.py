@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import weakref
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+
+import orjson
+from langgraph.checkpoint.sqlite import JsonPlusSerializerCompat, SqliteSaver
+
+from append_log import AppendLog
+from cache import LRUCache
+
+# zlib streams start with this byte, which never starts a JSON document or a pickle.
+ZLIB_MAGIC = b"\x78"
+# A string moved out of a checkpoint is replaced by {"__blob__": <sha256 of the string>}.
+BLOB_KEY = "__blob__"
+BLOB_REF_RE = re.compile(rb'\{"__blob__":\s*"([0-9a-f]{64})"\}')
+
+
+@lru_cache(maxsize=16384)
+def blob_hash(text):
+    # Strings cache their own hash, so looking up a string already seen costs no rehashing of its content.
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CompressedSerializer(JsonPlusSerializerCompat):
+    """
+    Serializes checkpoints with orjson and compresses them with zlib once they are larger than `threshold` bytes.
+
+    With a `blob_threshold`, `dumps_with_blobs` moves long strings out of the checkpoint into content-addressed
+    blobs, which `loads` resolves with `blob_loader` (set by the checkpointer storing the blobs).
+
+    Checkpoints written by the plain SqliteSaver (JSON or pickle) can still be loaded.
+    """
+
+    def __init__(self, threshold=1024, level=6, blob_threshold=None):
+        super().__init__()
+        self.threshold = threshold
+        self.level = level
+        self.blob_threshold = blob_threshold
+        self.blob_loader = None
+
+    def _default(self, obj):
+        if isinstance(obj, AppendLog):
+            return obj.to_list()
+        return super()._default(obj)
+
+    def _encode(self, obj):
+        try:
+            return orjson.dumps(
+                obj,
+                default=self._default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            return super().dumps(obj)
+
+    def _compress(self, data):
+        if len(data) < self.threshold:
+            return data
+        return zlib.compress(data, self.level)
+
+    def dumps(self, obj):
+        return self._compress(self._encode(obj))
+
+    def dumps_with_blobs(self, obj):
+        """
+        Serializes `obj`, moving every string of at least `blob_threshold` characters out of it into a blob
+        addressed by its hash. A string repeated in many checkpoints (a message, a tool output, a research snippet)
+        is then stored once, and the checkpoints only hold references to it.
+
+        Returns:
+            tuple[bytes, dict[str, str]]: The serialized object and its blobs by hash.
+        """
+        if self.blob_threshold is None:
+            return self.dumps(obj), {}
+        blobs = {}
+        try:
+            obj = self._externalize(obj, blobs)
+        except TypeError:
+            return self.dumps(obj), {}
+        return self._compress(self._encode(obj)), blobs
+
+    def _externalize(self, obj, blobs):
+        if isinstance(obj, str):
+            if len(obj) < self.blob_threshold:
+                return obj
+            digest = blob_hash(obj)
+            blobs[digest] = obj
+            return {BLOB_KEY: digest}
+        if obj is None or isinstance(obj, (bool, int, float)):
+            return obj
+        if isinstance(obj, dict):
+            return {k: self._externalize(v, blobs) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple, AppendLog)):
+            return [self._externalize(v, blobs) for v in obj]
+        return self._externalize(self._default(obj), blobs)
+
+    def loads(self, data):
+        if data[:1] == ZLIB_MAGIC:
+            data = zlib.decompress(data)
+        refs = BLOB_REF_RE.findall(data) if self.blob_loader is not None and data[:1] == b"{" else None
+        if not refs:
+            return super().loads(data)
+        blobs = self.blob_loader({ref.decode() for ref in refs})
+
+        def revive(value):
+            if len(value) == 1 and BLOB_KEY in value:
+                return blobs[value[BLOB_KEY]]
+            return self._reviver(value)
+
+        return json.loads(data, object_hook=revive)
+
+
+class DurableSqliteSaver(SqliteSaver):
+    """
+    A file-backed SqliteSaver for running many conversations in one process.
+
+    Compared to `SqliteSaver.from_conn_string(":memory:")`:
+        - checkpoints are stored on disk in WAL mode, so threads survive restarts and memory does not grow with
+          the number of checkpoints;
+        - reads go through a pool of per-thread connections and do not wait for writes, which are serialized on
+          a single writer connection;
+        - checkpoints are serialized with orjson and compressed;
+        - strings of at least `blob_threshold` characters (messages, tool outputs, research snippets) are stored
+          once in a `blobs` table, keyed by their hash, and checkpoints only hold references to them. LangGraph
+          writes every channel at every step, so this keeps the size of a step's write close to the size of the
+          data it added rather than of the whole history;
+        - only the last `max_checkpoints_per_thread` checkpoints of every thread are kept, and the blobs they no
+          longer reference are deleted every `collect_every` prunes;
+        - the async checkpointer API is supported by running the queries in the default executor, so compiled
+          graphs can be driven with `ainvoke`/`astream`.
+
+    Attributes:
+        path (str): The path of the SQLite database file.
+        max_checkpoints_per_thread (int): The number of checkpoints kept per thread_id. None keeps them all.
+        prune_every (int): Old checkpoints of a thread are pruned once every `prune_every` graph steps.
+        collect_every (int): The blobs no longer referenced are deleted once every `collect_every` prunes (see
+            `collect_blobs`). None never deletes them, e.g. for a database shared between processes.
+        blob_threshold (int): The length from which strings are stored as blobs. None stores them in the checkpoints.
+    """
+
+    def __init__(self, conn, path=None, max_checkpoints_per_thread=20, prune_every=10, serde=None,
+                 blob_threshold=512, collect_every=100):
+        super().__init__(conn, serde=serde or CompressedSerializer(blob_threshold=blob_threshold))
+        self.path = path
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.prune_every = prune_every
+        self.collect_every = collect_every
+        self.prunes = 0
+        self.metadata_serde = JsonPlusSerializerCompat()
+        self.readers = weakref.WeakKeyDictionary()  # thread -> its read connection, dropped with the thread
+        self.readers_lock = threading.Lock()
+        self.blob_cache = LRUCache(max_entries=4096, ttl=None)
+        self.written_blobs = LRUCache(max_entries=16384, ttl=None)
+        if isinstance(self.serde, CompressedSerializer):
+            self.serde.blob_loader = self.load_blobs
+
+    @classmethod
+    def from_path(cls, path="checkpoints.sqlite", **kwargs):
+        """
+        Creates a saver storing its checkpoints in the SQLite database at `path`.
+
+        Parameters:
+            path (str, optional): The database file. Defaults to "checkpoints.sqlite".
+            **kwargs: Passed to the constructor (max_checkpoints_per_thread, prune_every, serde, blob_threshold,
+                collect_every).
+
+        Returns:
+            DurableSqliteSaver: The checkpointer.
+        """
+        conn = cls.connect(path)
+        return cls(conn, path=None if path == ":memory:" else path, **kwargs)
+
+    @staticmethod
+    def connect(path):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA busy_timeout=5000;
+            """
+        )
+        return conn
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data TEXT)")
+
+    @contextmanager
+    def cursor(self, transaction=True):
+        if transaction or self.path is None:
+            with super().cursor(transaction) as cur:
+                yield cur
+            return
+        # Read-only queries use a connection owned by the calling thread, so they run concurrently with each
+        # other and with the writer (WAL mode).
+        self.setup()
+        thread = threading.current_thread()
+        conn = self.readers.get(thread)
+        if conn is None:
+            conn = self.connect(self.path)
+            with self.readers_lock:
+                self.readers[thread] = conn
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    def put(self, config, checkpoint, metadata):
+        thread_id = str(config["configurable"]["thread_id"])
+        if isinstance(self.serde, CompressedSerializer):
+            data, blobs = self.serde.dumps_with_blobs(checkpoint)
+        else:
+            data, blobs = self.serde.dumps(checkpoint), {}
+        collect = False
+        with self.lock, self.cursor() as cur:
+            # Blobs already written by this saver are not sent again; the others are ignored if already stored.
+            new_blobs = [(digest, text) for digest, text in blobs.items() if self.written_blobs.get(digest) is None]
+            if new_blobs:
+                cur.executemany("INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", new_blobs)
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, thread_ts, parent_ts, checkpoint, metadata) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint["id"],
+                    config["configurable"].get("thread_ts"),
+                    data,
+                    # Metadata stays plain JSON so that `list(filter=...)` can query it with json_extract.
+                    self.metadata_serde.dumps(metadata),
+                ),
+            )
+            if self.max_checkpoints_per_thread is not None and metadata.get("step", 0) % self.prune_every == 0:
+                self.prune_thread(cur, thread_id)
+                self.prunes += 1
+                collect = self.collect_every is not None and self.prunes % self.collect_every == 0
+        for digest, _ in new_blobs:
+            self.written_blobs.set(digest, True)
+        if collect:
+            self.collect_blobs()
+        return {
+            "configurable": {
+                "thread_id": config["configurable"]["thread_id"],
+                "thread_ts": checkpoint["id"],
+            }
+        }
+
+    def prune_thread(self, cur, thread_id):
+        cur.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND thread_ts NOT IN ("
+            "SELECT thread_ts FROM checkpoints WHERE thread_id = ? ORDER BY thread_ts DESC LIMIT ?)",
+            (thread_id, thread_id, self.max_checkpoints_per_thread),
+        )
+
+    def prune(self):
+        """
+        Deletes all but the last `max_checkpoints_per_thread` checkpoints of every thread, and the blobs no longer
+        referenced.
+        """
+        with self.lock, self.cursor() as cur:
+            thread_ids = [row[0] for row in cur.execute("SELECT DISTINCT thread_id FROM checkpoints").fetchall()]
+            for thread_id in thread_ids:
+                self.prune_thread(cur, thread_id)
+        self.collect_blobs()
+
+    def delete_thread(self, thread_id):
+        """
+        Deletes all checkpoints of a thread. Its blobs are deleted by the next `collect_blobs`.
+        """
+        with self.lock, self.cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+
+    def load_blobs(self, digests):
+        """
+        Returns the strings of the given blob hashes.
+        """
+        blobs = {}
+        missing = []
+        for digest in digests:
+            text = self.blob_cache.get(digest)
+            if text is None:
+                missing.append(digest)
+            else:
+                blobs[digest] = text
+        if missing:
+            with self.cursor(transaction=False) as cur:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    rows = cur.execute(
+                        f"SELECT hash, data FROM blobs WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for digest, text in rows:
+                        blobs[digest] = text
+                        self.blob_cache.set(digest, text)
+        return blobs
+
+    def collect_blobs(self):
+        """
+        Deletes the blobs not referenced by any checkpoint. It must not run while another process writes to the
+        database, since that process may reuse a blob it believes is stored: savers sharing a database with other
+        processes need `collect_every=None`.
+
+        Returns:
+            int: The number of blobs deleted.
+        """
+        with self.lock, self.cursor() as cur:
+            referenced = set()
+            for (data,) in cur.execute("SELECT checkpoint FROM checkpoints"):
+                if data[:1] == ZLIB_MAGIC:
+                    data = zlib.decompress(data)
+                referenced.update(ref.decode() for ref in BLOB_REF_RE.findall(data))
+            stored = [row[0] for row in cur.execute("SELECT hash FROM blobs").fetchall()]
+            unreferenced = [(digest,) for digest in stored if digest not in referenced]
+            cur.executemany("DELETE FROM blobs WHERE hash = ?", unreferenced)
+        self.written_blobs.clear()
+        return len(unreferenced)
+
+    def close(self):
+        """
+        Closes the read connections of every thread and the writer connection.
+        """
+        with self.readers_lock:
+            readers = list(self.readers.values())
+            self.readers.clear()
+        for conn in readers:
+            conn.close()
+        with self.lock:
+            self.conn.close()
+
+    async def aget_tuple(self, config):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata):
+        return await asyncio.get_running_loop().run_in_executor(None, self.put, config, checkpoint, metadata)
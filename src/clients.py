@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_URL = "https://api.openai.com"
+TAVILY_API_URL = "https://api.tavily.com"
+
+# Connection settings shared by every client of the process. They can be overridden with environment variables
+# or with `configure()` before the first client is created.
+settings = {
+    "max_connections": int(os.environ.get("HTTP_MAX_CONNECTIONS", 100)),
+    "max_keepalive_connections": int(os.environ.get("HTTP_MAX_KEEPALIVE", 20)),
+    "keepalive_expiry": float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30)),
+    "http2": os.environ.get("HTTP_HTTP2", "0") == "1",
+    # Retries of failed connection attempts by the httpx transports. Failed requests are retried by the resilience
+    # policies of their callers, so the OpenAI and Tavily clients do not retry them.
+    "retries": int(os.environ.get("HTTP_RETRIES", 2)),
+    "timeout": float(os.environ.get("HTTP_TIMEOUT", 60)),
+    # Per-host connection limits, on top of the global limit.
+    "host_limits": {
+        OPENAI_API_URL: int(os.environ.get("HTTP_OPENAI_MAX_CONNECTIONS", 50)),
+        TAVILY_API_URL: int(os.environ.get("HTTP_TAVILY_MAX_CONNECTIONS", 20)),
+    },
+}
+
+_lock = threading.Lock()
+_clients = {}
+
+
+@lru_cache(maxsize=None)
+def load_env():
+    """
+    Loads the .env file (API keys) once, when the first client is created rather than when a module is imported.
+    """
+    from dotenv import load_dotenv
+
+    return load_dotenv()
+
+
+def configure(**kwargs):
+    """
+    Overrides connection settings. Must be called before the first client is created.
+    """
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown HTTP client settings: {sorted(unknown)}")
+    if _clients:
+        raise RuntimeError("HTTP clients already created, configure() must be called before using them")
+    settings.update(kwargs)
+
+
+def _http2():
+    if not settings["http2"]:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def _limits(max_connections):
+    import httpx
+
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(settings["max_keepalive_connections"], max_connections),
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+
+
+def _build_client(client_class, transport_class):
+    http2 = _http2()
+    mounts = {
+        f"{url}/": transport_class(limits=_limits(limit), http2=http2, retries=settings["retries"])
+        for url, limit in settings["host_limits"].items()
+    }
+    return client_class(
+        transport=transport_class(
+            limits=_limits(settings["max_connections"]), http2=http2, retries=settings["retries"]
+        ),
+        mounts=mounts,
+        timeout=settings["timeout"],
+    )
+
+
+def _get(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def get_http_client():
+    """
+    Returns the process-wide httpx.Client. Connections to every host are pooled and kept alive between calls.
+    """
+    import httpx
+
+    return _get("http", lambda: _build_client(httpx.Client, httpx.HTTPTransport))
+
+
+def get_async_http_client():
+    """
+    Returns the process-wide httpx.AsyncClient. It must only be used from a single event loop.
+    """
+    import httpx
+
+    return _get("async_http", lambda: _build_client(httpx.AsyncClient, httpx.AsyncHTTPTransport))
+
+
+def get_openai_client():
+    """
+    Returns the process-wide OpenAI client, sending its requests through the shared connection pool. It does not
+    retry failed requests: they are retried by the "llm" resilience policy.
+    """
+    from openai import OpenAI
+
+    load_env()
+    return _get("openai", lambda: OpenAI(http_client=get_http_client(), max_retries=0))
+
+
+def make_chat_model(model, **kwargs):
+    """
+    Creates a ChatOpenAI model that sends its requests through the shared sync and async connection pools.
+
+    The model does not retry failed requests unless given `max_retries`: they are retried by the resilience policies
+    of the ModelRouter.
+
+    Parameters:
+        model (str): The OpenAI model name.
+        **kwargs: Other ChatOpenAI parameters.
+
+    Returns:
+        ChatOpenAI: The chat model.
+    """
+    from langchain_openai import ChatOpenAI
+
+    load_env()
+    kwargs.setdefault("max_retries", 0)
+    return ChatOpenAI(
+        model=model,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        **kwargs,
+    )
+
+
+class TavilySearchClient:
+    """
+    A Tavily search client using the shared connection pools, with the same `search` method as TavilyClient.
+
+    Requests rejected with 429 or failing with a 5xx status are retried with exponential backoff, `retries` times.
+    By default they are not: searches are retried by the "search" resilience policy of their callers.
+
+    Attributes:
+        api_key (str): The Tavily API key. Defaults to the TAVILY_API_KEY environment variable.
+        retries (int): The number of retries of a failed request. Defaults to 0.
+        backoff (float): Seconds to wait before the first retry, doubled on each further retry.
+        base_url (str): The API URL, e.g. of a local stub server in tests. Defaults to TAVILY_API_URL.
+    """
+
+    def __init__(self, api_key=None, retries=0, backoff=0.5, base_url=TAVILY_API_URL):
+        if api_key is None:
+            load_env()
+        self.api_key = api_key or os.environ["TAVILY_API_KEY"]
+        self.retries = retries
+        self.backoff = backoff
+        self.base_url = base_url
+
+    def payload(self, query, max_results=5, search_depth="basic", **kwargs):
+        return {"api_key": self.api_key, "query": query, "max_results": max_results, "search_depth": search_depth,
+                **kwargs}
+
+    @staticmethod
+    def should_retry(response):
+        return response.status_code == 429 or response.status_code >= 500
+
+    def search(self, query, **kwargs):
+        client = get_http_client()
+        for attempt in range(self.retries + 1):
+            response = client.post(f"{self.base_url}/search", json=self.payload(query, **kwargs))
+            if not self.should_retry(response) or attempt == self.retries:
+                break
+            tracing.add("retries")
+            time.sleep(self.backoff * 2 ** attempt)
+        response.raise_for_status()
+        return response.json()
+
+    async def asearch(self, query, **kwargs):
+        client = get_async_http_client()
+        for attempt in range(self.retries + 1):
+            response = await client.post(f"{self.base_url}/search", json=self.payload(query, **kwargs))
+            if not self.should_retry(response) or attempt == self.retries:
+                break
+            tracing.add("retries")
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+        response.raise_for_status()
+        return response.json()
+
+
+@lru_cache(maxsize=None)
+def tavily_input():
+    """
+    Returns the input schema of the search tool, defined on first use to keep pydantic out of the import.
+    """
+    from langchain_core.pydantic_v1 import BaseModel, Field
+
+    class TavilyInput(BaseModel):
+        query: str = Field(description="search query to look up")
+
+    return TavilyInput
+
+
+def tavily_search_tool(client=None, max_results=5, search_depth="advanced"):
+    """
+    Creates a search tool equivalent to langchain_community's TavilySearchResults, backed by a client with a
+    `search(query, **kwargs)` method (TavilySearchClient by default, possibly wrapped in a CachedSearchClient).
+
+    Parameters:
+        client (optional): The search client. Defaults to a new TavilySearchClient.
+        max_results (int, optional): The number of results per search. Defaults to 5.
+        search_depth (str, optional): "basic" or "advanced". Defaults to "advanced".
+
+    Returns:
+        StructuredTool: The search tool, returning a list of {"url", "content"} results.
+    """
+    from langchain_core.tools import StructuredTool
+
+    client = client or TavilySearchClient()
+
+    def search(query):
+        response = client.search(query=query, max_results=max_results, search_depth=search_depth)
+        return [{"url": r["url"], "content": r["content"]} for r in response["results"]]
+
+    return StructuredTool.from_function(
+        func=search,
+        name="tavily_search_results_json",
+        description=(
+            "A search engine optimized for comprehensive, accurate, and trusted results. "
+            "Useful for when you need to answer questions about current events. "
+            "Input should be a search query."
+        ),
+        args_schema=tavily_input(),
+    )
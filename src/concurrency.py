@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+
+def _start(func, item):
+    """
+    Calls `func(item)` on a new daemon thread, in a copy of the caller's context (so it sees the current run config
+    and trace span), and returns its future.
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(func, item))
+        except BaseException as e:
+            future.set_exception(e)
+
+    future.set_running_or_notify_cancel()
+    threading.Thread(target=run, daemon=True, name="run_concurrently").start()
+    return future
+
+
+def run_concurrently(func, items, max_workers=4, timeout=None):
+    """
+    Calls `func` on every item with at most `max_workers` calls running at once and returns the results in the
+    order of `items`.
+
+    Calls that raise, or that take more than `timeout` seconds, are not re-raised. Their slot in the returned list
+    holds the exception instead, so one slow or failing call never costs the others. Every call gets its own
+    `timeout`, counted from when it starts, not from when it was queued. A call that times out is left to finish in
+    the background and its result discarded; its worker is freed for the next call right away.
+
+    Parameters:
+        func (Callable): The function to call with each item.
+        items (list): The items to process.
+        max_workers (int, optional): The maximum number of concurrent calls. Defaults to 4.
+        timeout (float, optional): Seconds each call may take. Defaults to None (no limit).
+
+    Returns:
+        list: One entry per item, either the value returned by `func` or the exception it produced.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    queued = iter(range(len(items)))
+    running = {}  # future -> (position of its item, start time)
+    max_workers = max(1, max_workers)
+    while True:
+        while len(running) < max_workers and (i := next(queued, None)) is not None:
+            running[_start(func, items[i])] = (i, time.monotonic())
+        if not running:
+            return results
+        wait_for = None
+        if timeout is not None:
+            wait_for = max(0.0, min(start for _, start in running.values()) + timeout - time.monotonic())
+        done, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, _ = running.pop(future)
+            results[i] = future.exception() if future.exception() is not None else future.result()
+        if timeout is not None:
+            now = time.monotonic()
+            for future, (i, start) in list(running.items()):
+                if now - start >= timeout:
+                    del running[future]  # Abandoned: it finishes in the background
+                    results[i] = FuturesTimeoutError(f"call did not finish within {timeout}s")
+
+
+async def arun_concurrently(func, items, max_concurrency=4, timeout=None):
+    """
+    Awaits `func` on every item with at most `max_concurrency` calls in flight and returns the results in the
+    order of `items`.
+
+    Each call gets its own `timeout`; a call that exceeds it is cancelled. As with `run_concurrently`, failures
+    are returned in place of the result instead of being raised.
+
+    Parameters:
+        func (Callable): The coroutine function to await with each item.
+        items (list): The items to process.
+        max_concurrency (int, optional): The maximum number of concurrent calls. Defaults to 4.
+        timeout (float, optional): Seconds each call may take. Defaults to None (no limit).
+
+    Returns:
+        list: One entry per item, either the value returned by `func` or the exception it produced.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def call(item):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(func(item), timeout=timeout)
+            except asyncio.TimeoutError:
+                return asyncio.TimeoutError(f"call did not finish within {timeout}s")
+            except Exception as e:
+                return e
+
+    return list(await asyncio.gather(*(call(item) for item in items)))
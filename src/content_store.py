@@ -0,0 +1,178 @@
+import hashlib
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+from append_log import AppendLog
+from tokens import count_tokens
+
+WORD_RE = re.compile(r"\w+")
+NUM_PERM = 64
+SHINGLE_SIZE = 5
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed coefficients of the hash permutations, so signatures are stable across processes.
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME or 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME)
+    for i in range(NUM_PERM)
+]
+
+
+def words(text):
+    return WORD_RE.findall(text.lower())
+
+
+def content_hash(text):
+    """
+    Hashes a snippet after normalizing case and whitespace, to detect exact duplicates.
+    """
+    return hashlib.sha1(" ".join(words(text)).encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def minhash(text):
+    """
+    Computes the MinHash signature of the word shingles of a snippet.
+
+    The fraction of equal positions between two signatures estimates the Jaccard similarity of their shingle sets.
+    """
+    tokens = words(text)
+    shingles = {
+        " ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))
+    }
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles
+    ] or [0]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(signature_a, signature_b):
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / NUM_PERM
+
+
+def fresh_content(existing, new, threshold=0.8):
+    """
+    Returns the new snippets that are neither exact nor near duplicates of the existing ones or of each other.
+
+    Parameters:
+        existing (list[str]): The snippets already collected. An AppendLog keyed by `content_hash` is checked for
+            exact duplicates without hashing its snippets again.
+        new (list[str]): The snippets to add.
+        threshold (float, optional): The estimated Jaccard similarity above which two snippets are considered
+            duplicates. Defaults to 0.8.
+
+    Returns:
+        list[str]: The snippets of `new` to append, in their original order.
+    """
+    indexed = isinstance(existing, AppendLog) and existing.key is content_hash
+    seen = set() if indexed else {content_hash(s) for s in existing}
+    signatures = [minhash(s) for s in existing]
+    fresh = []
+    for snippet in new:
+        digest = content_hash(snippet)
+        if not snippet.strip() or digest in seen or (indexed and existing.position(digest) is not None):
+            continue
+        signature = minhash(snippet)
+        if any(similarity(signature, other) >= threshold for other in signatures):
+            continue
+        seen.add(digest)
+        signatures.append(signature)
+        fresh.append(snippet)
+    return fresh
+
+
+def merge_content(existing, new, threshold=0.8):
+    """
+    Appends the new snippets to the existing ones, skipping exact and near duplicates.
+
+    Parameters:
+        existing (list[str]): The snippets already collected.
+        new (list[str]): The snippets to add.
+        threshold (float, optional): The estimated Jaccard similarity above which two snippets are considered
+            duplicates. Defaults to 0.8.
+
+    Returns:
+        list[str]: A new list with the existing snippets followed by the new, non-duplicate ones.
+    """
+    return list(existing) + fresh_content(existing, new, threshold)
+
+
+class ReplaceContent(list):
+    """
+    A content update that replaces the snippets of the state instead of being merged into them (see `add_content`).
+    """
+
+
+def add_content(existing, update):
+    """
+    Reducer of a content channel of a graph state: appends the snippets written by a node to the current ones,
+    skipping duplicates, unless the update is a ReplaceContent.
+
+    Nodes can therefore return only the snippets they found, and parallel branches can all write to the channel in
+    the same step. The snippets are kept in an AppendLog, so a step only hashes its new snippets instead of all of
+    them.
+    """
+    if isinstance(update, ReplaceContent):
+        return AppendLog(update, content_hash)
+    log = AppendLog.wrap(existing, content_hash)
+    return log.extended(fresh_content(log, update or []))
+
+
+def rank_content(snippets, query, k1=1.5, b=0.75):
+    """
+    Scores the relevance of every snippet to the query with BM25.
+
+    Returns:
+        list[float]: One score per snippet, in the order of `snippets`.
+    """
+    documents = [Counter(words(s)) for s in snippets]
+    if not documents:
+        return []
+    average_length = sum(sum(d.values()) for d in documents) / len(documents) or 1
+    scores = []
+    for document in documents:
+        length = sum(document.values())
+        score = 0.0
+        for term in set(words(query)):
+            frequency = document.get(term, 0)
+            if not frequency:
+                continue
+            document_frequency = sum(1 for d in documents if term in d)
+            idf = math.log(1 + (len(documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+        scores.append(score)
+    return scores
+
+
+def select_content(snippets, query, max_tokens=None, max_items=None):
+    """
+    Selects the snippets most relevant to the query that fit within a token budget.
+
+    Snippets are taken greedily by decreasing relevance; a snippet that does not fit in the remaining budget is
+    skipped in favour of smaller, less relevant ones. The selected snippets keep their original order so that the
+    prompt built from them stays stable between revisions.
+
+    Parameters:
+        snippets (list[str]): The candidate snippets.
+        query (str): The text to rank the snippets against (e.g. the essay task).
+        max_tokens (int, optional): The token budget of the selection. Defaults to None (no limit).
+        max_items (int, optional): The maximum number of snippets selected. Defaults to None (no limit).
+
+    Returns:
+        list[str]: The selected snippets.
+    """
+    scores = rank_content(snippets, query)
+    order = sorted(range(len(snippets)), key=lambda i: scores[i], reverse=True)
+    selected = []
+    used = 0
+    for i in order:
+        if max_items is not None and len(selected) >= max_items:
+            break
+        if max_tokens is not None:
+            tokens = count_tokens(snippets[i])
+            if used + tokens > max_tokens:
+                continue
+            used += tokens
+        selected.append(i)
+    return [snippets[i] for i in sorted(selected)]
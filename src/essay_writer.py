@@ -1,16 +1,21 @@
 #  Modified from langgraph tutorial
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, List
+from langgraph.graph import StateGraph, START, END
+from typing import Annotated, TypedDict, List
 
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
-from tavily import TavilyClient
+import logging
 import os
+import re
 from langchain_core.pydantic_v1 import BaseModel
-from langgraph.checkpoint.sqlite import SqliteSaver
-from dotenv import load_dotenv
+from concurrency import run_concurrently
+from content_store import ReplaceContent, add_content, fresh_content, minhash, select_content, similarity
+from routing import ModelRouter, as_router
+from streaming import stream_with_tokens
+import resilience
+import tracing
+from tracing import configure_logging, trace_node
 
-_ = load_dotenv()
+logger = logging.getLogger(__name__)
 
 
 PLAN_PROMPT = """You are an expert writer tasked with writing a high level outline of an essay. \
@@ -32,7 +37,14 @@ Utilize all the information below as needed:
 
 REFLECTION_PROMPT = """You are a teacher grading an essay submission. \
 Generate critique and recommendations for the user's submission. \
-Provide detailed recommendations, including requests for length, depth, style, etc."""
+Provide detailed recommendations, including requests for length, depth, style, etc. \
+End with a last line of the form "Score: N/10" grading the submission from 1 to 10."""
+
+# Nodes that only turn a short text into search queries, routed to the fast model when there is one.
+FAST_ROUTES = {"research_plan": "fast", "research_critique": "fast"}
+
+# The grade the reflection prompt asks for on its last line.
+SCORE_RE = re.compile(r"Score:\s*(\d+(?:\.\d+)?)\s*(?:/\s*10)?", re.IGNORECASE)
 
 RESEARCH_CRITIQUE_PROMPT = """You are a researcher charged with providing information that can \
 be used when making any requested revisions (as outlined below). \
@@ -44,9 +56,22 @@ class AgentState(TypedDict):
     plan: str
     draft: str
     critique: str
-    content: List[str]
+    content: Annotated[List[str], add_content]  # Nodes return the snippets they found, merged without duplicates
     revision_number: int
     max_revisions: int
+    similarity: float  # Estimated similarity of the last two drafts
+    score: float  # Grade of the last draft, from the critique
+    previous_score: float
+    converged: str  # Why the revision loop stopped early
+    skipped_revisions: int
+
+
+def parse_score(critique):
+    """
+    Extracts the grade from a critique, or returns None if it has none.
+    """
+    matches = SCORE_RE.findall(critique or "")
+    return float(matches[-1]) if matches else None
 
 
 class Queries(BaseModel):
@@ -61,7 +86,15 @@ class EssayAgent:
         system (str): An initial system message to prepend to all interactions.
         graph (StateGraph): The compiled state graph for message processing.
         search_tool (funct): A function that searches for information based on a query.
-        model (ChatOpenAI): The OpenAI model bound with tools for message processing.
+        model (ModelRouter): Picks the model of every node.
+        max_search_workers (int): The maximum number of search queries run at the same time.
+        search_timeout (float): Seconds a search query may take, retries included.
+        content_token_budget (int): The maximum number of tokens of research content put in the writer prompt.
+        max_content_items (int): The maximum number of research snippets kept in the state.
+        tracer (Tracer): Records a span for every node, model and search call, or None.
+        similarity_threshold (float): Drafts at least this similar to the previous one end the revision loop.
+        target_score (float): A critique grade at which the revision loop ends.
+        min_improvement (float): The minimum grade gain between two drafts for the revision loop to continue.
 
     Methods:
         __init__(self, model, tools, system=""): Initializes the agent.
@@ -70,61 +103,94 @@ class EssayAgent:
         take_action(self, state: AgentState): Invokes the appropriate tool based on the last message's tool calls.
     """
 
-    def __init__(self, model, search_tool, checkpointer, system=""):
+    def __init__(self, model, search_tool, checkpointer, system="", max_search_workers=3, search_timeout=30,
+                 content_token_budget=4000, max_content_items=40, tracer=None, similarity_threshold=0.9,
+                 target_score=9, min_improvement=0.5):
         """
         Initializes the agent with a model, tools, and an optional system message.
 
         Parameters:
-            model (ChatOpenAI): The OpenAI model to use for processing messages.
+            model (ChatOpenAI or ModelRouter): The model of every node, or a router picking a model per node
+                (see FAST_ROUTES).
             search_tool (Callable): A function that searches for information based on a query.
             system (str, optional): An initial system message. Defaults to an empty string.
+            max_search_workers (int, optional): The maximum number of concurrent search queries. Defaults to 3.
+            search_timeout (float, optional): Seconds a search query may take, retries included. Queries that take
+                longer are dropped. Defaults to 30.
+            content_token_budget (int, optional): The maximum number of tokens of research content put in the
+                writer prompt. Defaults to 4000.
+            max_content_items (int, optional): The maximum number of research snippets kept in the state. The least
+                relevant snippets are dropped first. Defaults to 40.
+            tracer (Tracer, optional): Records the nodes of the graph. Defaults to None (no tracing).
+            similarity_threshold (float, optional): The estimated similarity between two consecutive drafts at
+                which the draft is considered converged. Defaults to 0.9. None disables the check.
+            target_score (float, optional): The critique grade (out of 10) at which the draft is good enough.
+                Defaults to 9. None disables the check.
+            min_improvement (float, optional): The grade gain below which a revision is not worth another one.
+                Defaults to 0.5. None disables the check.
         """
         self.system = system
         graph = StateGraph(AgentState)
-        graph.add_node("planner", self.plan_node)
-        graph.add_node("generate", self.generation_node)
-        graph.add_node("reflect", self.reflection_node)
-        graph.add_node("research_plan", self.research_plan_node)
-        graph.add_node("research_critique", self.research_critique_node)
-
-        graph.set_entry_point("planner")  # Start with the planner node
+        graph.add_node("planner", trace_node(self.plan_node, "planner", tracer))
+        graph.add_node("generate", trace_node(self.generation_node, "generate", tracer))
+        graph.add_node("reflect", trace_node(self.reflection_node, "reflect", tracer))
+        graph.add_node("research_plan", trace_node(self.research_plan_node, "research_plan", tracer))
+        graph.add_node("research_critique", trace_node(self.research_critique_node, "research_critique", tracer))
+        graph.add_node("finish", trace_node(self.finish_node, "finish", tracer))
+
+        # Research for the plan only needs the task, so it runs in parallel with the planner and generation waits
+        # for both. The revision loop stays sequential: research_critique needs the critique of reflect, and
+        # generate needs the content of research_critique.
+        graph.add_edge(START, "planner")
+        graph.add_edge(START, "research_plan")
+        graph.add_edge(["planner", "research_plan"], "generate")
         graph.add_conditional_edges(
             "generate",
             self.should_continue,
-            {END: END, "reflect": "reflect"}
+            {END: END, "reflect": "reflect", "finish": "finish"}
         )
-        graph.add_edge("planner", "research_plan")
-        graph.add_edge("research_plan", "generate")
-
-        graph.add_edge("reflect", "research_critique")
+        graph.add_conditional_edges(
+            "reflect",
+            self.should_research,
+            {"research_critique": "research_critique", "finish": "finish"}
+        )
+        graph.add_edge("finish", END)
         graph.add_edge("research_critique", "generate")
         self.graph = graph.compile(checkpointer=checkpointer)
+        self.tracer = tracer
         self.search_tool = search_tool
-        self.model = model
-
-    def plan_node(self, state: AgentState):
+        self.model = as_router(model)
+        self.max_search_workers = max_search_workers
+        self.search_timeout = search_timeout
+        self.content_token_budget = content_token_budget
+        self.max_content_items = max_content_items
+        self.similarity_threshold = similarity_threshold
+        self.target_score = target_score
+        self.min_improvement = min_improvement
+
+    def plan_node(self, state: AgentState, config=None):
         messages = [
             SystemMessage(content=PLAN_PROMPT),
             HumanMessage(content=state['task'])
         ]
-        response = self.model.invoke(messages)
-        return {"plan": response.content}
+        response = self.model.invoke("planner", messages, config)
+        # A thread can be reused for a new task: the convergence state of its previous run must not stop this one.
+        return {"plan": response.content, "draft": None, "similarity": None, "score": None, "previous_score": None,
+                "converged": None, "skipped_revisions": 0}
 
-    def research_plan_node(self, state: AgentState):
-        queries = self.model.with_structured_output(Queries).invoke([
+    def research_plan_node(self, state: AgentState, config=None):
+        queries = self.model.structured("research_plan", Queries, [
             SystemMessage(content=RESEARCH_PLAN_PROMPT),
             HumanMessage(content=state['task'])
-        ])
-        content = state['content'] or []
+        ], config, validate=lambda q: bool(q.queries))
         for q in queries.queries:
-            print(f"Query: {q}")
-            response = self.search_tool.search(query=q, max_results=2)
-            for r in response['results']:
-                content.append(r['content'])
-        return {"content": content}
+            logger.debug("Query: %s", q, extra={"node": "research_plan"})
+        return {"content": self.new_content(state, self.search(queries.queries))}
 
-    def generation_node(self, state: AgentState):
-        content = "\n\n".join(state['content'] or [])
+    def generation_node(self, state: AgentState, config=None):
+        content = "\n\n".join(
+            select_content(state.get('content') or [], state['task'], max_tokens=self.content_token_budget)
+        )
         user_message = HumanMessage(
             content=f"{state['task']}\n\nHere is my plan:\n\n{state['plan']}")
         messages = [
@@ -133,47 +199,148 @@ class EssayAgent:
             ),
             user_message
             ]
-        response = self.model.invoke(messages)
+        response = self.model.invoke("generate", messages, config)
+        previous = state.get("draft")
         return {
             "draft": response.content,
-            "revision_number": state.get("revision_number", 1) + 1
+            "revision_number": state.get("revision_number", 1) + 1,
+            "similarity": similarity(minhash(previous), minhash(response.content)) if previous else None,
         }
 
-    def reflection_node(self, state: AgentState):
+    def reflection_node(self, state: AgentState, config=None):
         messages = [
             SystemMessage(content=REFLECTION_PROMPT),
             HumanMessage(content=state['draft'])
         ]
-        response = self.model.invoke(messages)
-        return {"critique": response.content}
+        response = self.model.invoke("reflect", messages, config)
+        return {
+            "critique": response.content,
+            "score": parse_score(response.content),
+            "previous_score": state.get("score"),
+        }
 
-    def research_critique_node(self, state: AgentState):
-        queries = self.model.with_structured_output(Queries).invoke([
+    def research_critique_node(self, state: AgentState, config=None):
+        queries = self.model.structured("research_critique", Queries, [
             SystemMessage(content=RESEARCH_CRITIQUE_PROMPT),
             HumanMessage(content=state['critique'])
-        ])
-        content = state['content'] or []
-        for q in queries.queries:
-            response = self.search_tool.search(query=q, max_results=2)
+        ], config, validate=lambda q: bool(q.queries))
+        return {"content": self.new_content(state, self.search(queries.queries))}
+
+    def new_content(self, state: AgentState, snippets):
+        """
+        Returns the content update of new research snippets: the snippets that are not duplicates, which the state
+        reducer appends, or, once there are more than `max_content_items` snippets, a ReplaceContent without the ones
+        least relevant to the task.
+        """
+        existing = state.get('content') or []
+        fresh = fresh_content(existing, snippets)
+        if len(existing) + len(fresh) <= self.max_content_items:
+            return fresh
+        return ReplaceContent(select_content(list(existing) + fresh, state['task'], max_items=self.max_content_items))
+
+    def search(self, queries):
+        """
+        Runs the search queries concurrently and collects the content of their results. Each query goes through
+        the "search" resilience policy (retries, timeouts, circuit breaker); queries that still fail are dropped.
+
+        Parameters:
+            queries (list[str]): The search queries to run.
+
+        Returns:
+            list[str]: The content of the search results, in the same order as the queries.
+        """
+        def search(q):
+            # Retries of a query stop at the search timeout, after which its result would be dropped anyway.
+            with tracing.span("search", tool="search"), resilience.deadline(self.search_timeout):
+                return resilience.policy("search").call(self.search_tool.search, query=q, max_results=2)
+
+        responses = run_concurrently(
+            search,
+            queries,
+            max_workers=self.max_search_workers,
+            timeout=self.search_timeout,
+        )
+        content = []
+        for q, response in zip(queries, responses):
+            if isinstance(response, Exception):
+                logger.warning("Query failed: %s (%r)", q, response, extra={"query": q})
+                continue
             for r in response['results']:
                 content.append(r['content'])
-        return {"content": content}
+        return content
+
+    def stop_reason(self, state, critique=True):
+        """
+        Decides whether the draft has converged, so further revisions are not worth their LLM calls and searches.
+
+        Parameters:
+            state (AgentState): The current state.
+            critique (bool, optional): Whether to check the grades too. Only right after `reflect` do they grade the
+                current draft. Defaults to True.
 
-    @staticmethod
-    def should_continue(state):
+        Returns:
+            str: Why the revision loop should stop, or None to keep revising.
+        """
+        draft_similarity = state.get("similarity")
+        if self.similarity_threshold is not None and draft_similarity is not None \
+                and draft_similarity >= self.similarity_threshold:
+            return f"draft unchanged (similarity {draft_similarity:.2f})"
+        if not critique:
+            return None
+        score, previous_score = state.get("score"), state.get("previous_score")
+        if self.target_score is not None and score is not None and score >= self.target_score:
+            return f"target score reached ({score:g}/10)"
+        if self.min_improvement is not None and score is not None and previous_score is not None \
+                and score - previous_score < self.min_improvement:
+            return f"score stopped improving ({previous_score:g} -> {score:g})"
+        return None
+
+    def should_continue(self, state):
         if state["revision_number"] > state["max_revisions"]:
             return END
-        return "reflect"
+        return "finish" if self.stop_reason(state, critique=False) else "reflect"
+
+    def should_research(self, state):
+        return "finish" if self.stop_reason(state) else "research_critique"
+
+    def finish_node(self, state: AgentState):
+        """
+        Ends the revision loop early, recording why and how many revisions were skipped. Each skipped revision saves
+        the reflect, research_critique and generate LLM calls and the critique searches.
+        """
+        reason = self.stop_reason(state)
+        skipped = max(0, state["max_revisions"] - state["revision_number"] + 1)
+        logger.info("Stopped revising: %s, %d revision(s) skipped", reason, skipped,
+                    extra={"converged": reason, "skipped_revisions": skipped})
+        return {"converged": reason, "skipped_revisions": skipped}
 
 
 def main():
+    # The clients, caches and checkpointer are only needed to run the agent, not to import it.
+    from cache import CachedSearchClient, LRUCache, SqliteCache
+    from checkpointer import DurableSqliteSaver
+    from clients import TavilySearchClient, make_chat_model
+    from lang_graph import generate_unique_thread_id
+    from llm_cache import ResponseCache
+
     chat_gpt_model = 'gpt-4o'  # gpt-3.5-turbo, gpt-4o
-    model = ChatOpenAI(model=chat_gpt_model)
-    tavily = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
-    memory = SqliteSaver.from_conn_string(":memory:")
+    fast_model = os.environ.get("FAST_MODEL", "gpt-4o-mini")  # Empty to use chat_gpt_model everywhere
+    # Opt-in response cache, useful when the same topics are requested over and over. Only the calls at temperature
+    # 0 are cached: the search queries of the fast model, which need no variety, unlike the essay itself.
+    cache = ResponseCache(disk=SqliteCache("llm_cache.sqlite")) if os.environ.get("LLM_CACHE") == "1" else None
+    model = ModelRouter(
+        make_chat_model(chat_gpt_model),
+        fast=make_chat_model(fast_model, temperature=0) if fast_model else None,
+        routes=FAST_ROUTES,
+        cache=cache,
+    )
+    tavily = CachedSearchClient(TavilySearchClient(), LRUCache())
+    memory = DurableSqliteSaver.from_path(os.environ.get("CHECKPOINT_DB", "checkpoints.sqlite"))
     abot = EssayAgent(model=model, search_tool=tavily, checkpointer=memory)
-    thread = {"configurable": {"thread_id": "1"}}
+    # The checkpoints outlive the process, so every run gets its own thread instead of continuing an old topic.
+    thread = {"configurable": {"thread_id": generate_unique_thread_id()}}
     debug = True
+    configure_logging(logging.DEBUG if debug else logging.INFO)
     task = input("Enter a topic: ")
     if not debug:
         result = abot.graph.invoke(
@@ -183,12 +350,16 @@ def main():
         print(result)
         print(result['draft'])
     else:
-        for s in abot.graph.stream({
+        # Print the tokens of every node as they are generated, followed by the node updates.
+        for kind, s in stream_with_tokens(abot.graph, {
             'task': task,
             "max_revisions": 2,
             "revision_number": 1,
         }, thread):
-            print(s)
+            if kind == "token":
+                print(s["delta"], end="", flush=True)
+            else:
+                print(f"\n{s}")
 
 
 if __name__ == "__main__":
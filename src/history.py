@@ -0,0 +1,88 @@
+import json
+
+from langchain_core.messages import ToolMessage
+
+from cache import LRUCache
+from tokens import count_tokens, truncate_tokens
+
+# Tokens added by the chat format around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class MessageHistory:
+    """
+    Keeps the message history of an agent thread within a token budget.
+
+    Once the history is over budget, the outputs of the oldest tool calls are truncated (or summarized, if a
+    summarizer is given) until it fits. Tool messages are rewritten rather than removed, so every tool call of an
+    AIMessage keeps its matching ToolMessage and the history stays valid for the chat API. The most recent messages
+    are never compacted.
+
+    Attributes:
+        max_tokens (int): The token budget of the message history.
+        keep_last (int): The number of most recent messages that are never compacted.
+        tool_tokens (int): The number of tokens kept from a compacted tool output.
+        summarize (Callable): An optional function mapping a tool output to a shorter summary.
+    """
+
+    def __init__(self, max_tokens=8000, keep_last=6, tool_tokens=64, summarize=None, model="gpt-4o"):
+        self.max_tokens = max_tokens
+        self.keep_last = keep_last
+        self.tool_tokens = tool_tokens
+        self.summarize = summarize
+        self.model = model
+        # Token counts are computed once per message id, so each turn only counts the new messages.
+        self.token_counts = LRUCache(max_entries=100_000, ttl=None)
+
+    def message_tokens(self, message):
+        """
+        Returns the number of tokens a message adds to the prompt.
+        """
+        # Compacted messages keep the id of the original, so the flag is part of the key.
+        key = f"{message.id}:{bool(message.additional_kwargs.get('compacted'))}" if message.id else None
+        count = self.token_counts.get(key) if key else None
+        if count is None:
+            content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+            count = count_tokens(content, self.model) + MESSAGE_OVERHEAD_TOKENS
+            for tool_call in getattr(message, "tool_calls", None) or []:
+                count += count_tokens(json.dumps(tool_call["args"]), self.model)
+            if key:
+                self.token_counts.set(key, count)
+        return count
+
+    def compact(self, messages):
+        """
+        Compacts the oldest tool outputs until the messages fit in the token budget.
+
+        Parameters:
+            messages (list[AnyMessage]): The message history.
+
+        Returns:
+            list[ToolMessage]: The compacted tool messages. They keep the id of the message they replace, so that
+            returning them from a node with the `append_messages` reducer rewrites the history in place.
+        """
+        total = sum(self.message_tokens(m) for m in messages)
+        compacted = []
+        for message in messages[:max(0, len(messages) - self.keep_last)]:
+            if total <= self.max_tokens:
+                break
+            if not isinstance(message, ToolMessage) or message.additional_kwargs.get("compacted"):
+                continue
+            replacement = ToolMessage(
+                id=message.id,
+                tool_call_id=message.tool_call_id,
+                name=message.name,
+                content=self.shorten(str(message.content)),
+                additional_kwargs={**message.additional_kwargs, "compacted": True},
+            )
+            total -= self.message_tokens(message) - self.message_tokens(replacement)
+            compacted.append(replacement)
+        return compacted
+
+    def shorten(self, content):
+        if self.summarize is not None:
+            return self.summarize(content)
+        shortened = truncate_tokens(content, self.tool_tokens, self.model)
+        if shortened == content:
+            return content
+        return f"{shortened} ... [truncated, {count_tokens(content, self.model)} tokens in total]"
@@ -1,18 +1,43 @@
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated
-import operator
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
-from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langgraph.checkpoint.sqlite import SqliteSaver
-from dotenv import load_dotenv
+from langchain_core.runnables import RunnableLambda
+from functools import lru_cache
+import logging
+import os
 import uuid
 import time
+from append_log import append_messages
+from concurrency import run_concurrently, arun_concurrently
+from routing import ModelRouter, as_router
+from streaming import stream_with_tokens
+import resilience
+import tracing
+from tracing import configure_logging, trace_node
 
-# Define a memory checkpoint for the agent with built-in database under the hood.
-memory = SqliteSaver.from_conn_string(":memory:")
-_ = load_dotenv()
-tool = TavilySearchResults(max_results=2)
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_memory():
+    """
+    Returns the checkpointer of the agent, persisting the conversations in a SQLite database on disk. The database
+    is opened on first use, not when the module is imported.
+    """
+    from checkpointer import DurableSqliteSaver
+
+    return DurableSqliteSaver.from_path(os.environ.get("CHECKPOINT_DB", "checkpoints.sqlite"))
+
+
+@lru_cache(maxsize=None)
+def get_search_tool():
+    """
+    Returns the cached Tavily search tool of the agent, created on first use.
+    """
+    from cache import CachedSearchClient, LRUCache
+    from clients import TavilySearchClient, tavily_search_tool
+
+    return tavily_search_tool(CachedSearchClient(TavilySearchClient(), LRUCache()), max_results=2)
 
 
 def generate_unique_thread_id():
@@ -26,9 +51,11 @@ class AgentState(TypedDict):
     Defines the state structure for an agent in the language graph.
 
     Attributes:
-        messages (Annotated[list[AnyMessage], operator.add]): A list of messages that can be operated on.
+        messages (Annotated[list[AnyMessage], append_messages]): A list of messages that can be operated on. New
+            messages are appended without processing the history again, and a message with the id of an existing one
+            replaces it.
     """
-    messages: Annotated[list[AnyMessage], operator.add]
+    messages: Annotated[list[AnyMessage], append_messages]
 
 
 class Agent:
@@ -39,28 +66,46 @@ class Agent:
         system (str): An initial system message to prepend to all interactions.
         graph (StateGraph): The compiled state graph for message processing.
         tools (dict): A dictionary mapping tool names to their instances.
-        model (ChatOpenAI): The OpenAI model bound with tools for message processing.
+        model (ModelRouter): The models bound with tools for message processing.
+        max_concurrency (int): The maximum number of tool calls run at the same time.
+        tool_timeout (float): Seconds a tool call may take before it is abandoned.
+        history (MessageHistory): Keeps the messages sent to the model within a token budget.
+        tracer (Tracer): Records a span for every node, model and tool call, or None.
 
     Methods:
         __init__(self, model, tools, system=""): Initializes the agent.
         exists_action(self, state: AgentState): Checks if the last message in the state has any tool calls.
         call_openai(self, state: AgentState): Processes messages through the OpenAI model.
         take_action(self, state: AgentState): Invokes the appropriate tool based on the last message's tool calls.
+        atake_action(self, state: AgentState): Async version of take_action, used by the graph's async API.
     """
 
-    def __init__(self, model, tools, checkpointer, system=""):
+    def __init__(self, model, tools, checkpointer, system="", max_concurrency=5, tool_timeout=60, history=None,
+                 tracer=None):
         """
         Initializes the agent with a model, tools, and an optional system message.
 
         Parameters:
-            model (ChatOpenAI): The OpenAI model to use for processing messages.
+            model (ChatOpenAI or ModelRouter): The model to use for processing messages, or a router sending the
+                "llm" node to a fast model and escalating its invalid tool calls to a strong one.
             tools (list): A list of tool instances available for the agent.
             system (str, optional): An initial system message. Defaults to an empty string.
+            max_concurrency (int, optional): The maximum number of concurrent tool calls. Defaults to 5.
+            tool_timeout (float, optional): Seconds a tool call may take. Defaults to 60.
+            history (MessageHistory, optional): Compacts old tool outputs once the thread goes over its token
+                budget. Defaults to None (the full history is always sent).
+            tracer (Tracer, optional): Records the nodes of the graph. Defaults to None (no tracing).
         """
         self.system = system
+        self.max_concurrency = max_concurrency
+        self.tool_timeout = tool_timeout
+        self.history = history
+        self.tracer = tracer
         graph = StateGraph(AgentState)
-        graph.add_node("llm", self.call_openai)
-        graph.add_node("action", self.take_action)
+        graph.add_node("llm", trace_node(self.call_openai, "llm", tracer))
+        graph.add_node("action", RunnableLambda(
+            trace_node(self.take_action, "action", tracer), afunc=trace_node(self.atake_action, "action", tracer)
+        ))
         graph.add_conditional_edges(
             "llm",
             self.exists_action,
@@ -70,7 +115,7 @@ class Agent:
         graph.set_entry_point("llm")
         self.graph = graph.compile(checkpointer=checkpointer)
         self.tools = {t.name: t for t in tools}
-        self.model = model.bind_tools(tools)
+        self.model = as_router(model).bind_tools(tools)
 
     @staticmethod
     def exists_action(state: AgentState):
@@ -86,28 +131,38 @@ class Agent:
         result = state['messages'][-1]
         return len(result.tool_calls) > 0
 
-    def call_openai(self, state: AgentState):
+    def call_openai(self, state: AgentState, config=None):
         """
-        Processes messages through the OpenAI model.
+        Processes messages through the OpenAI model. The response is streamed when the graph is run with
+        `stream_with_tokens`.
+
+        If the agent has a message history budget, old tool outputs are compacted first. The compacted messages are
+        returned along with the response so that they also replace the originals in the checkpointed state.
 
         Parameters:
             state (AgentState): The current state of the agent.
+            config (RunnableConfig, optional): The run config, passed by the graph.
         """
         messages = state['messages']
+        compacted = self.history.compact(messages) if self.history else []
+        if compacted:
+            replacements = {m.id: m for m in compacted}
+            messages = [replacements.get(m.id, m) for m in messages]
         if self.system:
             messages = [SystemMessage(content=self.system)] + messages
-        message = self.model.invoke(messages)
-        return {'messages': [message]}
+        message = self.model.invoke("llm", messages, config)
+        return {'messages': compacted + [message]}
 
     def take_action(self, state: AgentState):
         """
-        Processes tool calls from the last message in the state and invokes the corresponding tool.
+        Processes tool calls from the last message in the state and invokes the corresponding tools.
 
-        This method iterates over each tool call found in the last message of the state. It checks if the tool name
-        exists within the agent's tools dictionary. If the tool name is not found, it logs a message indicating a bad
-        tool name and sets the result to a retry message. Otherwise, it invokes the tool with the provided arguments
-        and collects the results. Each result is wrapped in a ToolMessage object. After processing all tool calls,
-        it returns a dictionary containing the list of ToolMessage objects.
+        The tool calls of the last message are run concurrently on a thread pool of at most `max_concurrency`
+        workers. If a tool name is not found in the agent's tools dictionary, the result is a retry message. Tool
+        calls go through the resilience policy of their tool, which retries transient failures. A tool that still
+        fails or does not finish within `tool_timeout` seconds produces an error message instead of failing the
+        whole step, so the model can decide how to proceed. Each result is wrapped in a ToolMessage
+        object, in the same order as the tool calls.
 
         Parameters:
             state (AgentState): The current state of the agent, containing messages among other information.
@@ -117,20 +172,65 @@ class Agent:
             of the invoked tools.
         """
         tool_calls = state['messages'][-1].tool_calls  # Extract tool calls from the last message
-        results = []  # Initialize an empty list to store results
         for t in tool_calls:
-            print(f"Calling: {t}")
-            if not t['name'] in self.tools:  # Check if the tool name exists in the agent's tools
-                print("\n ....bad tool name....")
-                result = "bad tool name, retry"  # Set a retry message for the result
-            else:
-                result = self.tools[t['name']].invoke(t['args'])  # Invoke the tool with arguments
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))  # Append the result
-        print("Back to the model!")
-        return {'messages': results}  # Return the results wrapped in a dictionary
+            logger.debug("Calling tool", extra={"tool": t['name'], "tool_args": t['args'], "tool_call_id": t['id']})
+        results = run_concurrently(
+            self.invoke_tool, tool_calls, max_workers=self.max_concurrency, timeout=self.tool_timeout
+        )
+        logger.debug("Back to the model")
+        return {'messages': [self.tool_message(t, r) for t, r in zip(tool_calls, results)]}
+
+    async def atake_action(self, state: AgentState):
+        """
+        Async version of take_action. Tool calls are awaited concurrently through the tools' `ainvoke` method and
+        each one is cancelled if it does not finish within `tool_timeout` seconds.
+
+        Parameters:
+            state (AgentState): The current state of the agent, containing messages among other information.
+
+        Returns:
+            dict: A dictionary with a key 'messages' containing a list of ToolMessage objects.
+        """
+        tool_calls = state['messages'][-1].tool_calls
+        for t in tool_calls:
+            logger.debug("Calling tool", extra={"tool": t['name'], "tool_args": t['args'], "tool_call_id": t['id']})
+        results = await arun_concurrently(
+            self.ainvoke_tool, tool_calls, max_concurrency=self.max_concurrency, timeout=self.tool_timeout
+        )
+        logger.debug("Back to the model")
+        return {'messages': [self.tool_message(t, r) for t, r in zip(tool_calls, results)]}
+
+    def invoke_tool(self, tool_call):
+        if not tool_call['name'] in self.tools:  # Check if the tool name exists in the agent's tools
+            logger.warning("Bad tool name", extra={"tool": tool_call['name']})
+            return "bad tool name, retry"  # Set a retry message for the result
+        policy = resilience.policy(f"tool:{tool_call['name']}")
+        with tracing.span("tool", tool=tool_call['name']):
+            # Invoke the tool with arguments
+            return policy.call(self.tools[tool_call['name']].invoke, tool_call['args'])
+
+    async def ainvoke_tool(self, tool_call):
+        if not tool_call['name'] in self.tools:
+            logger.warning("Bad tool name", extra={"tool": tool_call['name']})
+            return "bad tool name, retry"
+        policy = resilience.policy(f"tool:{tool_call['name']}")
+        with tracing.span("tool", tool=tool_call['name']):
+            return await policy.acall(self.tools[tool_call['name']].ainvoke, tool_call['args'])
+
+    @staticmethod
+    def tool_message(tool_call, result):
+        """
+        Wraps the result of a tool call in a ToolMessage. Exceptions are reported to the model as an error message.
+        """
+        if isinstance(result, Exception):
+            result = f"tool call failed: {result!r}, retry"
+        return ToolMessage(tool_call_id=tool_call['id'], name=tool_call['name'], content=str(result))
 
 
 def main():
+    from clients import make_chat_model
+    from history import MessageHistory
+
     prompt = """You are a smart research assistant. Use the search engine to look up information. \
     You are allowed to make multiple calls (either together or in sequence). \
     Only look up information when you are sure of what you want. \
@@ -138,9 +238,16 @@ def main():
     If you need to look up some information before asking a follow up question, you are allowed to do that!
     """
     debug = True
+    configure_logging(logging.DEBUG if debug else logging.INFO)
     chat_gpt_model = 'gpt-3.5-turbo'  # gpt-3.5-turbo, gpt-4o
-    model = ChatOpenAI(model=chat_gpt_model)
-    abot = Agent(model, [tool], system=prompt, checkpointer=memory)
+    # Turns go to the fast model, long conversations and invalid tool calls to the strong one.
+    model = ModelRouter(
+        make_chat_model('gpt-4o'),
+        fast=make_chat_model(chat_gpt_model),
+        routes={"llm": "fast"},
+        max_fast_tokens=4000,
+    )
+    abot = Agent(model, [get_search_tool()], system=prompt, checkpointer=get_memory(), history=MessageHistory())
     print("Sample query: Who was the president of the United States in 1990 and who was their spouse back then")
     thread = {"configurable": {"thread_id": generate_unique_thread_id()}}  # Define a thread ID for the conversation
     while True:
@@ -148,9 +255,12 @@ def main():
         messages = [HumanMessage(content=query)]  # Initialize the messages with the user query
         # to allow for multiple conversations
         if debug:
-            for event in abot.graph.stream({"messages": messages}, thread):
+            for kind, event in stream_with_tokens(abot.graph, {"messages": messages}, thread):
+                if kind == "token":
+                    print(event["delta"], end="", flush=True)
+                    continue
                 for v in event.values():
-                    print(v['messages'])
+                    print(f"\n{v['messages']}")
         else:
             result = abot.graph.invoke({"messages": messages}, thread)
             print(result['messages'][-1].content)
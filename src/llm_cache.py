@@ -0,0 +1,213 @@
+import hashlib
+import json
+import re
+import threading
+from collections import deque
+
+import numpy as np
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from cache import LRUCache
+
+WORD_RE = re.compile(r"\w+")
+
+
+def hashed_embedding(text, dims=512):
+    """
+    A cheap local embedding: the L2-normalized bag of words of the text, hashed into `dims` buckets.
+    """
+    vector = np.zeros(dims, dtype=np.float32)
+    for word in WORD_RE.findall(text.lower()):
+        vector[int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "big") % dims] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def prompt_text(prompt):
+    """
+    Extracts the message contents of a serialized prompt, so that near-duplicate matching is not skewed by the
+    serialization format.
+    """
+    try:
+        data = json.loads(prompt)
+    except ValueError:
+        return prompt
+    contents = []
+
+    def collect(value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key == "content" and isinstance(item, str):
+                    contents.append(item)
+                else:
+                    collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    collect(data)
+    return "\n".join(contents) if contents else prompt
+
+
+def dump_generation(generation):
+    if isinstance(generation, ChatGeneration):
+        return {"message": message_to_dict(generation.message)}
+    return {"text": generation.text}
+
+
+def load_generation(value):
+    if "message" in value:
+        return ChatGeneration(message=messages_from_dict([value["message"]])[0])
+    return Generation(text=value["text"])
+
+
+def message_key(message):
+    """
+    The part of a message that the response depends on, without the ids that change from one run to the next.
+    """
+    key = {"type": message.type, "content": message.content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        key["tool_calls"] = [{"name": c["name"], "args": c["args"]} for c in tool_calls]
+    return key
+
+
+class ResponseCache:
+    """
+    An opt-in cache of model responses, meant for deterministic calls (temperature 0, structured outputs).
+
+    Callers look it up themselves around their model calls: ModelRouter for the graph nodes (see
+    `ModelRouter.cache`) and open_ai_react.Agent for raw chat completions. Requests are dicts of the model, its
+    temperature, the messages and the tools or output schema, so entries are keyed on a hash of (model, messages,
+    tools, temperature). Streamed calls bypass the cache.
+
+    Entries are kept in an in-memory LRU tier and, optionally, a disk tier shared between processes. If a
+    similarity threshold is set, a prompt that is not cached can also be answered with the response to a previous
+    prompt whose embedding is at least that similar, for the same model string.
+
+    Attributes:
+        memory (LRUCache): The in-memory tier.
+        disk (BaseCache): The optional disk tier (e.g. SqliteCache).
+        similarity_threshold (float): The minimum cosine similarity of a near-duplicate match. None disables it.
+        embed (Callable): Maps a prompt text to a normalized vector. Defaults to `hashed_embedding`.
+        hits (int): Lookups answered with an exact match.
+        near_hits (int): Lookups answered with a near-duplicate match.
+        misses (int): Lookups that were not answered.
+    """
+
+    def __init__(self, memory=None, disk=None, similarity_threshold=None, embed=hashed_embedding,
+                 max_index_entries=10_000):
+        self.memory = memory if memory is not None else LRUCache(max_entries=2048, ttl=None)
+        self.disk = disk
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.max_index_entries = max_index_entries
+        self.index = {}  # model string hash -> deque of (embedding, key)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def model_key(llm_string):
+        return hashlib.sha256(llm_string.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def lookup(self, prompt, llm_string):
+        value = self.get(self.key(prompt, llm_string))
+        if value is not None:
+            self.hits += 1
+            return [load_generation(g) for g in value]
+        if self.similarity_threshold is not None:
+            value = self.lookup_similar(prompt, llm_string)
+            if value is not None:
+                self.near_hits += 1
+                return [load_generation(g) for g in value]
+        self.misses += 1
+        return None
+
+    def lookup_similar(self, prompt, llm_string):
+        with self.lock:
+            entries = list(self.index.get(self.model_key(llm_string), ()))
+        if not entries:
+            return None
+        similarities = np.stack([e[0] for e in entries]) @ self.embed(prompt_text(prompt))
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return self.get(entries[best][1])
+
+    def update(self, prompt, llm_string, return_val):
+        key = self.key(prompt, llm_string)
+        value = [dump_generation(g) for g in return_val]
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+        if self.similarity_threshold is not None:
+            with self.lock:
+                entries = self.index.setdefault(self.model_key(llm_string), deque(maxlen=self.max_index_entries))
+                entries.append((self.embed(prompt_text(prompt)), key))
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+        with self.lock:
+            self.index.clear()
+
+    def lookup_completion(self, request):
+        """
+        Looks up the response to a raw OpenAI chat completion request (model, messages, temperature, tools).
+
+        Returns:
+            str: The cached response content, or None.
+        """
+        prompt, llm_string = self.completion_key(request)
+        generations = self.lookup(prompt, llm_string)
+        return generations[0].text if generations else None
+
+    def update_completion(self, request, content):
+        prompt, llm_string = self.completion_key(request)
+        self.update(prompt, llm_string, [Generation(text=content)])
+
+    def lookup_message(self, request):
+        """
+        Looks up the response message to a chat model request, whose messages are given by `message_key`.
+
+        Returns:
+            AIMessage: The cached response, or None.
+        """
+        prompt, llm_string = self.completion_key(request)
+        generations = self.lookup(prompt, llm_string)
+        return generations[0].message if generations else None
+
+    def update_message(self, request, message):
+        prompt, llm_string = self.completion_key(request)
+        self.update(prompt, llm_string, [ChatGeneration(message=message)])
+
+    @staticmethod
+    def completion_key(request):
+        request = dict(request)
+        prompt = json.dumps(request.pop("messages"), sort_keys=True)
+        return prompt, json.dumps(request, sort_keys=True, default=str)
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
@@ -1,11 +1,13 @@
-import re
-import ast
-from openai import OpenAI
-from dotenv import load_dotenv
+import logging
 
-_ = load_dotenv()
+import resilience
+from clients import get_openai_client
+from actions import ActionRegistry, calculate, literal_args, parse_actions
+from catalog import dog_breeds, products, split_names, strip_quantity
+from scenarios import default_engine
+from tracing import configure_logging
 
-client = OpenAI()
+logger = logging.getLogger(__name__)
 
 prompt = """
 You run in a loop of Thought, Action, PAUSE, Observation.
@@ -22,16 +24,16 @@ e.g. calculate: 4 * 7 / 3
 Runs a calculation and returns the number - uses Python so be sure to use floating point syntax if necessary
 
 get_price:
-e.g. get_price: pencil
-Returns the price of an item when given the name of the item
+e.g. get_price: pencil, notebook
+Returns the price of one or more items when given their names, separated by commas
 
 average_dog_weight:
-e.g. average_dog_weight: Collie
-returns average weight of a dog when given the breed
+e.g. average_dog_weight: Collie, Bulldog
+returns average weight of one or more dogs when given their breeds, separated by commas
 
 sql_query:
 e.g. sql_query: ("brand", ["cocacola", "pepsi"], 0.5)
-returns a string "New Scenario created" string   - if you are missing any information call ask_user action
+creates a price scenario and returns a summary of it - if you are missing any information call ask_user action
 
 ask_user: 
 e.g. ask_user: What percentage do you want to change the prices by?
@@ -91,8 +93,11 @@ Answer: New Scenario created.
 
 
 class Agent:
-    def __init__(self, system=""):
+    def __init__(self, system="", on_token=None, cache=None, client=None):
         self.system = system
+        self.client = client  # Defaults to the shared OpenAI client
+        self.on_token = on_token  # Called with every token of the responses when set, which are then streamed
+        self.cache = cache  # Optional ResponseCache, responses are deterministic since temperature is 0
         self.messages = []
         if self.system:
             self.messages.append({"role": "system", "content": system})
@@ -104,82 +109,120 @@ class Agent:
         return result
 
     def execute(self):
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # "gpt-4o",
-            temperature=0,
-            messages=self.messages)
-        return completion.choices[0].message.content
+        request = {
+            "model": "gpt-3.5-turbo",  # "gpt-4o",
+            "temperature": 0,
+            "messages": self.messages,
+        }
+        if self.cache is not None:
+            cached = self.cache.lookup_completion(request)
+            if cached is not None:
+                if self.on_token is not None:
+                    self.on_token(cached)
+                return cached
+        content = self.complete(request)
+        if self.cache is not None:
+            self.cache.update_completion(request, content)
+        return content
+
+    def complete(self, request):
+        # Transient API errors are retried by the "llm" policy. Streamed calls are not hedged, and once their first
+        # token is printed they are neither retried nor timed out, so no token is printed twice.
+        policy = resilience.policy("llm")
+        if self.on_token is not None:
+            policy = policy.replace(hedge_after=None)
+        return policy.call(self.create, request)
+
+    def create(self, request):
+        client = self.client or get_openai_client()
+        completion = client.chat.completions.create(**request, stream=self.on_token is not None)
+        if self.on_token is None:
+            return completion.choices[0].message.content
+        content = []
+        for chunk in completion:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not content:
+                    resilience.commit()
+                self.on_token(delta)
+                content.append(delta)
+        return "".join(content)
 
 
 def ask_user(user_question):
     return input(f"{user_question}:")
 
 
-def calculate(what):
-    return eval(what)
-
-
-def average_dog_weight(name):
-    if name in "Scottish Terrier":
-        return ("Scottish Terriers average 20 lbs")
-    elif name in "Border Collie":
-        return ("a Border Collies average weight is 37 lbs")
-    elif name in "Toy Poodle":
-        return ("a toy poodles average weight is 7 lbs")
-    else:
-        return ("An average dog weights 50 lbs")
-
-
-def get_price(name):
-    if name in "pencil":
-        return "A pencil costs 1.0 Euros"
-    elif name in "notebook":
-        return "A notebook costs 2.5 Euros"
-    else:
-        return "An average item costs 3.5 Euros"
+def average_dog_weight(names):
+    observations = []
+    batch = [strip_quantity(name) for name in split_names(names)]
+    for name, match in zip(batch, dog_breeds().lookup_many(batch)):
+        if match.ambiguous:
+            observations.append(f"{name} is ambiguous, did you mean {' or '.join(match.candidates)}?")
+        elif not match.found:
+            observations.append(f"{name} not found, an average dog weights 50 lbs")
+        else:
+            observations.append(f"a {match.record['breed']}'s average weight is {match.record['weight_lbs']} lbs")
+    return "; ".join(observations)
+
+
+def get_price(names):
+    observations = []
+    batch = [strip_quantity(name) for name in split_names(names)]
+    for name, match in zip(batch, products().lookup_many(batch)):
+        if match.ambiguous:
+            observations.append(f"{name} is ambiguous, did you mean {' or '.join(match.candidates)}?")
+        elif not match.found:
+            observations.append(f"{name} not found, an average item costs 3.5 Euros")
+        else:
+            observations.append(f"A {match.record['name']} costs {match.record['price']} Euros")
+    return "; ".join(observations)
 
 
 def sql_query(column: str, values: list[str], change_price: float) -> str:
-    # makes sure to format all the values to the ones stored in the database
-    return "New Scenario created"
-
-
-known_actions = {
-    "calculate": calculate,
-    "get_price": get_price,
-    "average_dog_weight": average_dog_weight,
-    "sql_query": sql_query,
-    "ask_user": ask_user
-}
-
-
-def query(question, max_turns=5):
+    # the values are formatted to the ones stored in the database by the scenario engine
+    summary = default_engine().create_scenario(column, values, change_price)
+    if not summary["products"]:
+        return f"No products found for {column} {', '.join(values)}, no scenario created"
+    return (
+        f"New Scenario created (id {summary['scenario_id']}): {summary['products']} prices changed by "
+        f"{summary['average_change']:+.1%}, average price {summary['base_average']:.2f} -> "
+        f"{summary['scenario_average']:.2f} Euros"
+    )
+
+
+known_actions = ActionRegistry()
+known_actions.register("calculate", calculate)
+known_actions.register("get_price", get_price)
+known_actions.register("average_dog_weight", average_dog_weight)
+known_actions.register("sql_query", sql_query, decode=literal_args)
+known_actions.register("ask_user", ask_user)
+
+
+def query(question, max_turns=5, stream=False, cache=None, client=None):
     i = 0
-    bot = Agent(prompt)
+    # When streaming, the responses are printed token by token as they are generated
+    bot = Agent(
+        prompt,
+        on_token=(lambda token: print(token, end="", flush=True)) if stream else None,
+        cache=cache,
+        client=client,
+    )
     next_prompt = question
-    action_re = re.compile('^Action: (\w+): (.*)$')  # python regular expression to selection action
     while i < max_turns:
         i += 1
         result = bot(next_prompt)
-        print(result)
-        actions = [
-            action_re.match(a)
-            for a in result.split('\n')
-            if action_re.match(a)
-        ]
+        if stream:
+            print()
+        else:
+            logger.info(result)
+        actions = parse_actions(result)
         if actions:
             # There is an action to run
-            action, action_input = actions[0].groups()
-
-            if action not in known_actions:
-                raise Exception("Unknown action: {}: {}".format(action, action_input))
-            print(" -- running {} {}".format(action, action_input))
-            if action == 'sql_query':
-                action_input = ast.literal_eval(action_input)
-                observation = known_actions[action](*action_input)
-            else:
-                observation = known_actions[action](action_input)
-            print("Observation:", observation)
+            action, action_input = actions[0]
+            logger.info(" -- running %s %s", action, action_input, extra={"action": action})
+            observation = known_actions.dispatch(action, action_input)
+            logger.info("Observation: %s", observation, extra={"action": action})
             next_prompt = "Observation: {}".format(observation)
         else:
 
@@ -191,6 +234,9 @@ What is their combined weight"""
 question2 = """I have 3 items, 2 pencils and a notebook. \
 What is their combined cost?"""
 question3 = """Create a scenario where you increase prices for pepsi brand"""
-print(f"Question: {question2}")
-query(question2)
+
+if __name__ == "__main__":
+    configure_logging()
+    print(f"Question: {question2}")
+    query(question2)
 
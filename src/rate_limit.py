@@ -0,0 +1,132 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class TokenBucket:
+    """
+    A token bucket limiting the rate of calls to a quota (requests to the LLM or search API).
+
+    The bucket holds at most `capacity` tokens and refills at `rate` tokens per second; every call takes `cost`
+    tokens, waiting for them if the bucket is empty. A bucket created with `shared()` keeps its state in shared
+    memory, so the worker processes of a pool it is passed to (e.g. through the pool initializer) draw from the
+    same quota.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): The maximum number of tokens, i.e. the largest burst.
+    """
+
+    def __init__(self, rate, capacity=None, _state=None, _lock=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._state = _state if _state is not None else [self.capacity, time.monotonic()]  # tokens, last refill
+        self._lock = _lock if _lock is not None else threading.Lock()
+
+    @classmethod
+    def shared(cls, rate, capacity=None, context=None):
+        """
+        Creates a bucket shared between processes.
+
+        Parameters:
+            context (multiprocessing.context.BaseContext, optional): The multiprocessing context of the pool.
+                Defaults to the default context.
+        """
+        context = context or multiprocessing.get_context()
+        capacity = capacity if capacity is not None else max(1.0, rate)
+        state = context.Array("d", [capacity, time.monotonic()])
+        return cls(rate, capacity, state, state.get_lock())
+
+    @classmethod
+    def per_minute(cls, rpm, shared=False, context=None):
+        """
+        Creates a bucket of `rpm` calls per minute, allowing bursts of up to a second of calls.
+        """
+        if shared:
+            return cls.shared(rpm / 60, max(1.0, rpm / 60), context)
+        return cls(rpm / 60, max(1.0, rpm / 60))
+
+    def __getstate__(self):
+        return {"rate": self.rate, "capacity": self.capacity, "_state": self._state,
+                "_lock": self._lock if not isinstance(self._state, list) else None}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def try_acquire(self, cost=1):
+        """
+        Takes `cost` tokens if they are available.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds until they will be.
+        """
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self._state[0] + (now - self._state[1]) * self.rate)
+            self._state[1] = now
+            if tokens >= cost:
+                self._state[0] = tokens - cost
+                return 0.0
+            self._state[0] = tokens
+            return (cost - tokens) / self.rate
+
+    def acquire(self, cost=1, timeout=None):
+        """
+        Waits until `cost` tokens are available and takes them.
+
+        Returns:
+            bool: True if the tokens were taken, False if they were not available within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (wait := self.try_acquire(cost)) > 0:
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, cost=1, timeout=None):
+        """
+        Async version of `acquire`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (wait := self.try_acquire(cost)) > 0:
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
+
+
+class RateLimitCallback(BaseCallbackHandler):
+    """
+    Takes a token from a bucket before every LLM call of a run. Pass it in the `callbacks` of the run config to
+    limit every model call made by the graph nodes, including structured output calls.
+    """
+
+    raise_error = True
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.bucket.acquire()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.bucket.acquire()
+
+
+class RateLimitedSearchClient:
+    """
+    Wraps a search client (with a `search(query, **kwargs)` method) to take a token from a bucket before every
+    search.
+    """
+
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def search(self, query, **kwargs):
+        self.bucket.acquire()
+        return self.client.search(query, **kwargs)
@@ -0,0 +1,634 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Default settings of the policies, by the part of the policy name before ":" ("llm:fast" uses the "llm" ones).
+# The timeouts can be overridden with environment variables, everything else with `configure()`. Searches are
+# idempotent but every request is billed, so hedging them is opt-in, e.g. `configure("search", hedge_after=1.0)`.
+DEFAULTS = {
+    "llm": {"attempts": 3, "timeout": float(os.environ.get("LLM_TIMEOUT", 60)), "failure_threshold": 5},
+    "search": {"attempts": 3, "timeout": float(os.environ.get("SEARCH_TIMEOUT", 15)), "idempotent": True,
+               "failure_threshold": 5},
+    "tool": {"attempts": 2, "timeout": None, "failure_threshold": 5},
+}
+
+# Exceptions of the OpenAI, httpx and Tavily clients worth retrying, by class name so the clients need not be
+# imported to classify them.
+TRANSIENT_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError", "ConnectError",
+    "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout", "ReadError", "RemoteProtocolError",
+}
+TRANSIENT_STATUS = {408, 409, 425, 429}
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+# The attempts the current code runs in, innermost last (see `commit`).
+_attempts = contextvars.ContextVar("attempts", default=())
+_lock = threading.Lock()
+_policies = {}
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised without calling a dependency whose circuit breaker is open.
+    """
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when the deadline of the current run leaves no time for another attempt.
+    """
+
+
+class AttemptAbandoned(Exception):
+    """
+    Raised by `commit` in an attempt that was already given up on (timed out, or lost to a hedged duplicate), so it
+    stops before producing an effect that the attempt replacing it will produce too.
+    """
+
+
+def is_transient(error):
+    """
+    Whether a failed call may succeed if retried: timeouts, connection errors, 429 and 5xx responses.
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in TRANSIENT_ERRORS:
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status, int) and (status in TRANSIENT_STATUS or status >= 500)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Sets the deadline of the calls made within the block, including the graph nodes it runs: no attempt starts or
+    waits past it. A deadline nested in another one cannot extend it. None leaves the current deadline unchanged.
+    """
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    token = _deadline.set(min(time.monotonic() + seconds, current) if current is not None else
+                          time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    Returns the seconds left before the current deadline, or None without a deadline.
+    """
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+class _Attempt:
+    """
+    Whether a request has committed (see `commit`) or been abandoned; whichever comes first wins. The first of the
+    `siblings` (the requests of the same attempt, hedges included) to commit abandons the others.
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self, siblings):
+        self.siblings = siblings
+        self.committed = False
+        self.abandoned = False
+
+    def commit(self):
+        with self.lock:
+            if self.abandoned:
+                raise AttemptAbandoned("the attempt was abandoned before it committed")
+            self.committed = True
+            for sibling in self.siblings:
+                if sibling is not self:
+                    sibling.abandoned = True
+
+    def abandon(self):
+        """
+        Gives up on the request. Returns False if it has already committed and must be waited for instead.
+        """
+        with self.lock:
+            if self.committed:
+                return False
+            self.abandoned = True
+            return True
+
+
+def commit():
+    """
+    Marks the attempts the current code runs in as committed: they are about to have an effect that must not be
+    repeated, such as sending streamed tokens to a client. A committed attempt is neither abandoned on timeout nor
+    lost to a hedged duplicate, and its error is raised instead of being retried. Raises AttemptAbandoned if the
+    attempt was already given up on. Outside of a policy call this does nothing.
+    """
+    for attempt in _attempts.get():
+        attempt.commit()
+
+
+@contextmanager
+def _attempt_context(attempt):
+    token = _attempts.set(_attempts.get() + (attempt,))
+    try:
+        yield
+    finally:
+        _attempts.reset(token)
+
+
+def _run_attempt(attempt, func, args, kwargs):
+    with _attempt_context(attempt):
+        return func(*args, **kwargs)
+
+
+def _start(func, args, kwargs, attempt, slots):
+    """
+    Runs `func(*args, **kwargs)` on a new daemon thread, in a copy of the caller's context (so it sees the current
+    run config, trace span and deadline), and returns its future. The thread releases one of `slots`, taken by the
+    caller, when it finishes.
+
+    Every attempt gets its own thread rather than a task queued in a pool: its timeout then only counts the time
+    the dependency takes, never time spent queued behind other calls, which the circuit breaker would otherwise
+    take for failures of the dependency. The slots bound the threads of a dependency, abandoned ones included.
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                result = context.run(_run_attempt, attempt, func, args, kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        finally:
+            slots.release()
+
+    threading.Thread(target=run, daemon=True, name="resilience").start()
+    return future
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency after `failure_threshold` consecutive transient failures, so callers fail fast
+    instead of waiting on timeouts. After `reset_timeout` seconds one trial call is let through: the circuit closes
+    again if it succeeds and stays open for another `reset_timeout` if it fails.
+
+    Attributes:
+        name (str): The dependency, for logs and metrics.
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial call.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def before(self):
+        """
+        Raises CircuitOpenError if the call should not be made.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self.trial:
+                self.trial = True
+                return
+        tracing.add("circuit_open")
+        raise CircuitOpenError(f"circuit of {self.name} is open after {self.failures} failures")
+
+    def success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info("Circuit of %s closed", self.name, extra={"dependency": self.name})
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    logger.warning("Circuit of %s opened after %d failures", self.name, self.failures,
+                                   extra={"dependency": self.name})
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+
+class Policy:
+    """
+    Makes the calls to one dependency (an LLM, the search API, a tool) resilient:
+        - every attempt is bounded by `timeout` and by the deadline of the run (see `deadline`);
+        - transient failures are retried up to `attempts` times with full jitter exponential backoff, unless the
+          deadline would pass while waiting;
+        - with `hedge_after`, an attempt of an `idempotent` call slower than the `hedge_quantile` of the recent
+          latencies (and than `hedge_after` seconds) gets a duplicate request, and the first answer wins. This cuts
+          the tail latency at the cost of a few extra requests, so it is opt-in;
+        - with a `bucket` (a rate_limit.TokenBucket), every attempt takes a token first;
+        - the circuit `breaker` fails calls fast while the dependency keeps failing.
+
+    An attempt that calls `commit()` (e.g. before sending streamed tokens) is the last one: it is no longer timed
+    out nor hedged, and its error is raised rather than retried, so its effect is never repeated.
+
+    A sync attempt with a timeout or hedging runs on its own thread; one that times out is abandoned and finishes in
+    the background. At most `max_workers` of these threads run at once, abandoned ones included, so a hanging
+    dependency cannot pile up requests: a call waits for a free one (until the deadline, without counting the wait
+    in its timeout), and a hedge is skipped when none is free. Async attempts are cancelled.
+
+    Attributes:
+        name (str): The dependency, for logs and metrics.
+        attempts (int): The maximum number of attempts of a call.
+        backoff (float): The maximum wait before the first retry, doubled on each further retry.
+        max_backoff (float): The cap of the wait between two attempts.
+        timeout (float): Seconds an attempt may take, or None.
+        hedge_after (float): The minimum delay before a hedged request, or None to disable hedging.
+        hedge_quantile (float): The latency quantile after which an attempt is hedged.
+        idempotent (bool): Whether a call can safely be made twice. Only idempotent calls are hedged.
+        max_workers (int): The maximum number of threads running attempts at once.
+        breaker (CircuitBreaker): The circuit breaker, or None.
+        bucket (TokenBucket): The rate limit, or None.
+        retry_on (Callable): Whether an exception is transient. Defaults to `is_transient`.
+    """
+
+    def __init__(self, name, attempts=3, backoff=0.5, max_backoff=8.0, timeout=None, hedge_after=None,
+                 hedge_quantile=0.95, idempotent=False, max_workers=64, breaker=None, bucket=None,
+                 retry_on=is_transient):
+        self.name = name
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.idempotent = idempotent
+        self.slots = threading.BoundedSemaphore(max_workers)
+        self.breaker = breaker
+        self.bucket = bucket
+        self.retry_on = retry_on
+        self.latencies = deque(maxlen=200)
+
+    def replace(self, **changes):
+        """
+        Returns a copy of the policy with some settings changed, sharing its breaker, bucket, threads and
+        latencies. E.g.
+        `policy.replace(hedge_after=None)` for a streamed call, whose tokens must not be sent twice.
+        """
+        policy = Policy.__new__(Policy)
+        policy.__dict__.update(self.__dict__, **changes)
+        return policy
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def hedge_delay(self):
+        if self.hedge_after is None or not self.idempotent:
+            return None
+        latencies = sorted(self.latencies)
+        if len(latencies) < 20:
+            return self.hedge_after
+        return max(self.hedge_after, latencies[int(self.hedge_quantile * (len(latencies) - 1))])
+
+    def budget(self):
+        """
+        Returns the seconds the next attempt may take, or None for no limit.
+        """
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"deadline passed before calling {self.name}")
+        if self.timeout is None:
+            return left
+        return self.timeout if left is None else min(self.timeout, left)
+
+    def retry_wait(self, attempt, error):
+        """
+        Returns the seconds to wait before retrying after `error`, or None if the call should not be retried.
+        """
+        if attempt + 1 >= self.attempts or not self.retry_on(error):
+            return None
+        wait_seconds = self.delay(attempt + 1)
+        left = remaining()
+        if left is not None and wait_seconds >= left:
+            return None
+        logger.warning("Retrying %s in %.2fs after %r", self.name, wait_seconds, error,
+                       extra={"dependency": self.name, "attempt": attempt + 1})
+        tracing.add("retries")
+        return wait_seconds
+
+    def failed(self, error):
+        if self.breaker is None or isinstance(error, DeadlineExceeded):
+            return
+        if self.retry_on(error):
+            self.breaker.failure()
+        else:
+            self.breaker.success()  # The dependency answered, the request itself was wrong
+
+    def succeeded(self, seconds):
+        self.latencies.append(seconds)
+        if self.breaker is not None:
+            self.breaker.success()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls `func(*args, **kwargs)` under the policy and returns its result, or raises the last error.
+        """
+        for attempt in range(self.attempts):
+            timeout = self.budget()
+            if self.breaker is not None:
+                self.breaker.before()
+            if self.bucket is not None and not self.bucket.acquire(timeout=timeout):
+                raise DeadlineExceeded(f"no {self.name} rate limit token within the deadline")
+            start = time.monotonic()
+            attempts = []
+            try:
+                result = self.attempt(func, args, kwargs, timeout, attempts)
+            except Exception as e:
+                self.failed(e)
+                committed = any(a.committed for a in attempts)
+                wait_seconds = None if committed else self.retry_wait(attempt, e)
+                if wait_seconds is None:
+                    raise
+                time.sleep(wait_seconds)
+                continue
+            self.succeeded(time.monotonic() - start)
+            return result
+
+    def attempt(self, func, args, kwargs, timeout, attempts):
+        """
+        Makes one attempt, hedged if it is slow, and returns its result. The state of every request started is
+        appended to `attempts`.
+        """
+        hedge_delay = self.hedge_delay()
+        if timeout is None and hedge_delay is None:
+            attempts.append(_Attempt(attempts))
+            return _run_attempt(attempts[-1], func, args, kwargs)
+        states = {}
+
+        def start_request():
+            attempts.append(_Attempt(attempts))
+            future = _start(func, args, kwargs, attempts[-1], self.slots)
+            states[future] = attempts[-1]
+            return future
+
+        left = remaining()
+        if not self.slots.acquire(timeout=None if left is None else max(0.0, left)):
+            raise DeadlineExceeded(f"no free {self.name} worker within the deadline")
+        try:
+            timeout = self.budget()  # The wait for a worker is not part of the attempt
+        except DeadlineExceeded:
+            self.slots.release()
+            raise
+        now = time.monotonic()
+        end = None if timeout is None else now + timeout
+        hedge_at = None if hedge_delay is None else now + hedge_delay
+        pending = {start_request()}
+        error = None
+        while pending:
+            committed = [f for f in pending if states[f].committed]
+            if committed:
+                # Its effect has started, so it is the answer however long it takes.
+                for future in pending:
+                    states[future].abandon()
+                return committed[0].result()
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                hedge_at = None
+                if self.slots.acquire(blocking=False):
+                    tracing.add("hedges")
+                    pending.add(start_request())
+            deadlines = [t for t in (end, hedge_at) if t is not None]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        states[other].abandon()
+                    return future.result()
+                error = future.exception()
+                if states[future].committed:
+                    for other in pending:
+                        states[other].abandon()
+                    raise error
+            if end is not None and time.monotonic() >= end:
+                committed = [f for f in pending if not states[f].abandon()]
+                if committed:
+                    return committed[0].result()
+                for future in pending:
+                    future.cancel()  # Abandoned: they finish in the background and their results are discarded
+                break
+        if error is not None and not pending:
+            raise error
+        tracing.add("timeouts")
+        raise TimeoutError(f"{self.name} call did not finish within {timeout:.1f}s")
+
+    async def acall(self, func, *args, **kwargs):
+        """
+        Async version of `call`, awaiting the coroutine function `func`.
+        """
+        for attempt in range(self.attempts):
+            timeout = self.budget()
+            if self.breaker is not None:
+                self.breaker.before()
+            if self.bucket is not None and not await self.bucket.aacquire(timeout=timeout):
+                raise DeadlineExceeded(f"no {self.name} rate limit token within the deadline")
+            start = time.monotonic()
+            attempts = []
+            try:
+                result = await self.aattempt(func, args, kwargs, timeout, attempts)
+            except Exception as e:
+                self.failed(e)
+                committed = any(a.committed for a in attempts)
+                wait_seconds = None if committed else self.retry_wait(attempt, e)
+                if wait_seconds is None:
+                    raise
+                await asyncio.sleep(wait_seconds)
+                continue
+            self.succeeded(time.monotonic() - start)
+            return result
+
+    async def aattempt(self, func, args, kwargs, timeout, attempts):
+        """
+        Async version of `attempt`. Abandoned requests are cancelled.
+        """
+        hedge_delay = self.hedge_delay()
+        states = {}
+
+        async def run(attempt):
+            with _attempt_context(attempt):
+                return await func(*args, **kwargs)
+
+        def start_request():
+            attempts.append(_Attempt(attempts))
+            task = asyncio.ensure_future(run(attempts[-1]))
+            states[task] = attempts[-1]
+            return task
+
+        now = time.monotonic()
+        end = None if timeout is None else now + timeout
+        hedge_at = None if hedge_delay is None else now + hedge_delay
+        pending = {start_request()}
+        error = None
+        try:
+            while pending:
+                committed = [t for t in pending if states[t].committed]
+                if committed:
+                    return await committed[0]
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    tracing.add("hedges")
+                    pending.add(start_request())
+                deadlines = [t for t in (end, hedge_at) if t is not None]
+                wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                    if states[task].committed:
+                        raise error
+                if end is not None and time.monotonic() >= end:
+                    committed = [t for t in pending if not states[t].abandon()]
+                    if committed:
+                        return await committed[0]
+                    break
+        finally:
+            for task, state in states.items():
+                if not task.done():
+                    state.abandon()
+                    task.cancel()
+        if error is not None and not pending:
+            raise error
+        tracing.add("timeouts")
+        raise TimeoutError(f"{self.name} call did not finish within {timeout:.1f}s")
+
+
+def policy(name):
+    """
+    Returns the process-wide policy of a dependency, created on first use from DEFAULTS. Policies are shared, so
+    every agent calling the same dependency shares its circuit breaker and latency statistics.
+
+    Parameters:
+        name (str): The dependency, e.g. "llm", "llm:fast", "search" or "tool:calculator".
+    """
+    current = _policies.get(name)
+    if current is None:
+        with _lock:
+            current = _policies.get(name)
+            if current is None:
+                current = _policies[name] = make_policy(name)
+    return current
+
+
+def make_policy(name, **kwargs):
+    settings = {**DEFAULTS.get(name.split(":")[0], {}), **kwargs}
+    failure_threshold = settings.pop("failure_threshold", None)
+    reset_timeout = settings.pop("reset_timeout", 30.0)
+    if failure_threshold is not None and "breaker" not in settings:
+        settings["breaker"] = CircuitBreaker(name, failure_threshold, reset_timeout)
+    return Policy(name, **settings)
+
+
+def configure(name, **kwargs):
+    """
+    Replaces the policy of a dependency, e.g. `configure("search", hedge_after=1.0, bucket=TokenBucket(5))`.
+    Settings not given are taken from DEFAULTS.
+
+    Returns:
+        Policy: The new policy.
+    """
+    with _lock:
+        current = _policies[name] = make_policy(name, **kwargs)
+    return current
+
+
+def run_with_resume(graph, inputs, config, attempts=3, backoff=1.0, timeout=None, retry_on=is_transient):
+    """
+    Runs a compiled graph and, when the run fails with a transient error, resumes it from its last checkpoint
+    instead of starting over: the nodes that already finished are not run again.
+
+    Parameters:
+        graph (CompiledGraph): The graph, compiled with a checkpointer.
+        inputs (dict): The graph input, or None to resume the thread.
+        config (RunnableConfig): The run config (thread id).
+        attempts (int, optional): The maximum number of runs. Defaults to 3.
+        backoff (float, optional): The maximum wait before the first resume, doubled on each further one.
+            Defaults to 1.
+        timeout (float, optional): The deadline of all the runs together, in seconds. Defaults to None.
+        retry_on (Callable, optional): Whether an exception should be resumed from. Defaults to `is_transient`.
+
+    Returns:
+        dict: The final state of the graph.
+    """
+    with deadline(timeout):
+        for attempt in range(attempts):
+            try:
+                return graph.invoke(inputs, config)
+            except Exception as e:
+                wait_seconds = random.uniform(0, backoff * 2 ** attempt)
+                left = remaining()
+                if attempt + 1 >= attempts or not retry_on(e) or (left is not None and wait_seconds >= left):
+                    raise
+                inputs = resume_inputs(graph, inputs, config)
+                logger.warning("Run failed (%r), resuming in %.2fs", e, wait_seconds,
+                               extra={"thread_id": config["configurable"].get("thread_id"), "attempt": attempt + 1})
+                tracing.add("resumes")
+                time.sleep(wait_seconds)
+
+
+async def arun_with_resume(graph, inputs, config, attempts=3, backoff=1.0, timeout=None, retry_on=is_transient):
+    """
+    Async version of `run_with_resume`.
+    """
+    with deadline(timeout):
+        for attempt in range(attempts):
+            try:
+                return await graph.ainvoke(inputs, config)
+            except Exception as e:
+                wait_seconds = random.uniform(0, backoff * 2 ** attempt)
+                left = remaining()
+                if attempt + 1 >= attempts or not retry_on(e) or (left is not None and wait_seconds >= left):
+                    raise
+                inputs = await asyncio.to_thread(resume_inputs, graph, inputs, config)
+                logger.warning("Run failed (%r), resuming in %.2fs", e, wait_seconds,
+                               extra={"thread_id": config["configurable"].get("thread_id"), "attempt": attempt + 1})
+                tracing.add("resumes")
+                await asyncio.sleep(wait_seconds)
+
+
+def resume_inputs(graph, inputs, config):
+    """
+    Returns None to resume a failed run from its last checkpoint, or `inputs` to start it again if it failed
+    before writing one.
+    """
+    if graph.checkpointer is None or not graph.get_state(config).next:
+        return inputs
+    return None
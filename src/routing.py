@@ -0,0 +1,223 @@
+import logging
+import threading
+from collections import Counter
+
+import resilience
+import tracing
+from streaming import TOKEN_SINK, invoke_model
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+FAST = "fast"
+STRONG = "strong"
+
+
+class ModelRouter:
+    """
+    Picks the chat model of every graph node between a strong model and an optional faster, cheaper one.
+
+    Nodes listed in `routes` as "fast" are sent to the fast model unless their prompt is longer than
+    `max_fast_tokens`. A fast answer is escalated to the strong model when it looks unreliable: a structured output
+    that fails to parse or fails `validate`, or a tool calling turn with invalid tool calls or an empty answer.
+    Without a fast model every node uses the strong one, so a router can wrap any model.
+
+    Every call goes through the resilience policy of its tier (retries, timeouts, circuit breaker). A fast call that
+    still fails, or whose circuit is open, is escalated to the strong model too.
+
+    With a `cache` (an llm_cache.ResponseCache), the deterministic calls (models at temperature 0) that are not
+    streamed are answered from it when they were made before.
+
+    Example:
+        router = ModelRouter(make_chat_model("gpt-4o"), fast=make_chat_model("gpt-4o-mini"),
+                             routes={"research_plan": "fast", "research_critique": "fast"})
+
+    Attributes:
+        strong (BaseChatModel): The default model.
+        fast (BaseChatModel): The model of the nodes routed to "fast", or None.
+        routes (dict): The tier ("fast" or "strong") of each node; unlisted nodes use the strong model.
+        max_fast_tokens (int): Prompts longer than this go to the strong model, or None for no limit.
+        escalate (bool): Whether unreliable fast answers are retried on the strong model.
+        policies (dict): The resilience.Policy of each tier. Defaults to the "llm" and "llm:fast" policies.
+        cache (ResponseCache): The cache of the deterministic calls, or None.
+    """
+
+    def __init__(self, strong, fast=None, routes=None, max_fast_tokens=None, escalate=True, policies=None,
+                 cache=None):
+        self.strong = strong
+        self.fast = fast
+        self.routes = dict(routes or {})
+        self.max_fast_tokens = max_fast_tokens
+        self.escalate = escalate
+        self.policies = policies or {STRONG: resilience.policy("llm"), FAST: resilience.policy("llm:fast")}
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.calls = Counter()  # (node, tier) -> calls
+        self.escalations = Counter()  # node -> escalations
+
+    def bind_tools(self, tools, **kwargs):
+        """
+        Returns a router over the same models with `tools` bound, sharing the statistics of this one.
+        """
+        router = ModelRouter(
+            self.strong.bind_tools(tools, **kwargs),
+            self.fast.bind_tools(tools, **kwargs) if self.fast is not None else None,
+            self.routes, self.max_fast_tokens, self.escalate, self.policies, self.cache,
+        )
+        router.lock, router.calls, router.escalations = self.lock, self.calls, self.escalations
+        return router
+
+    def tier(self, node, messages):
+        if self.fast is None or self.routes.get(node) != FAST:
+            return STRONG
+        if self.max_fast_tokens is not None:
+            if sum(count_tokens(str(m.content)) for m in messages) > self.max_fast_tokens:
+                return STRONG
+        return FAST
+
+    def model(self, tier):
+        return self.fast if tier == FAST else self.strong
+
+    def record(self, node, tier, escalated=False):
+        with self.lock:
+            self.calls[(node, tier)] += 1
+            if escalated:
+                self.escalations[node] += 1
+        tracing.add(f"{tier}_calls")
+        if escalated:
+            tracing.add("escalations")
+
+    @staticmethod
+    def unreliable(message):
+        """
+        Whether a tool calling answer should be escalated: it has invalid tool calls or neither content nor calls.
+        """
+        if getattr(message, "invalid_tool_calls", None):
+            return True
+        return not message.content and not getattr(message, "tool_calls", None)
+
+    def cache_request(self, model, messages, schema=None):
+        """
+        Returns the ResponseCache request of a call to `model`, or None if there is no cache or the call is not
+        deterministic.
+        """
+        if self.cache is None:
+            return None
+        from llm_cache import message_key
+
+        bound = getattr(model, "bound", model)  # Models with tools bound are RunnableBindings
+        if getattr(bound, "temperature", None) != 0:
+            return None
+        return {
+            "model": getattr(bound, "model_name", type(bound).__name__),
+            "temperature": 0,
+            "messages": [message_key(m) for m in messages],
+            "tools": getattr(model, "kwargs", {}).get("tools"),
+            "schema": schema.schema() if schema is not None else None,
+        }
+
+    def call(self, tier, node, messages, config=None):
+        """
+        Invokes the model of `tier` under its policy, or answers from the cache. Streamed calls bypass the cache and
+        are not hedged, so no token is sent twice.
+        """
+        policy = self.policies[tier]
+        model = self.model(tier)
+        if TOKEN_SINK in ((config or {}).get("configurable") or {}):
+            return policy.replace(hedge_after=None).call(invoke_model, model, messages, config, node=node)
+        request = self.cache_request(model, messages)
+        if request is not None:
+            response = self.cache.lookup_message(request)
+            if response is not None:
+                tracing.add("cache_hits")
+                return response
+        response = policy.call(invoke_model, model, messages, config, node=node)
+        if request is not None:
+            self.cache.update_message(request, response)
+        return response
+
+    def call_structured(self, tier, schema, messages, config=None):
+        """
+        Invokes the model of `tier` with structured output under its policy, or answers from the cache.
+        """
+        model = self.model(tier)
+        request = self.cache_request(model, messages, schema)
+        if request is not None:
+            cached = self.cache.lookup_completion(request)
+            if cached is not None:
+                tracing.add("cache_hits")
+                return schema.parse_raw(cached)
+        output = self.policies[tier].call(model.with_structured_output(schema).invoke, messages, config)
+        if request is not None and output is not None:
+            self.cache.update_completion(request, output.json())
+        return output
+
+    def invoke(self, node, messages, config=None):
+        """
+        Invokes the model of `node` (see `streaming.invoke_model`), escalating an unreliable or failed fast answer.
+
+        When the run is streamed, the tokens of an escalated fast answer have already been sent to the sink; the
+        strong answer follows them.
+        """
+        tier = self.tier(node, messages)
+        try:
+            response = self.call(tier, node, messages, config)
+        except Exception as e:
+            if tier != FAST or not self.escalate:
+                raise
+            logger.info("Fast model failed on %s (%r), escalating", node, e, extra={"node": node})
+            response = None
+        self.record(node, tier)
+        if tier == FAST and self.escalate and (response is None or self.unreliable(response)):
+            logger.info("Escalating %s to the strong model", node, extra={"node": node})
+            response = self.call(STRONG, node, messages, config)
+            self.record(node, STRONG, escalated=True)
+        return response
+
+    def structured(self, node, schema, messages, config=None, validate=None):
+        """
+        Invokes the model of `node` with structured output, escalating to the strong model when the fast answer
+        cannot be parsed into `schema` or does not pass `validate`.
+
+        Parameters:
+            node (str): The name of the node.
+            schema (type): The pydantic model of the output.
+            messages (list[AnyMessage]): The messages to send.
+            config (RunnableConfig, optional): The run config. Defaults to None.
+            validate (Callable, optional): Returns False for outputs that should be escalated, e.g. an empty
+                query list. Defaults to None.
+
+        Returns:
+            The output, an instance of `schema`.
+        """
+        tier = self.tier(node, messages)
+        with tracing.span("llm", node=node):
+            if tier == FAST and self.escalate:
+                try:
+                    output = self.call_structured(FAST, schema, messages, config)
+                    self.record(node, FAST)
+                    if output is not None and (validate is None or validate(output)):
+                        return output
+                except Exception as e:
+                    self.record(node, FAST)
+                    logger.info("Fast model failed on %s (%r), escalating", node, e, extra={"node": node})
+                tier, escalated = STRONG, True
+            else:
+                escalated = False
+            output = self.call_structured(tier, schema, messages, config)
+            self.record(node, tier, escalated)
+            return output
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": {f"{node}:{tier}": n for (node, tier), n in sorted(self.calls.items())},
+                "escalations": dict(self.escalations),
+            }
+
+
+def as_router(model):
+    """
+    Returns `model` if it is a ModelRouter, otherwise a router sending every node to it.
+    """
+    return model if isinstance(model, ModelRouter) else ModelRouter(model)
@@ -0,0 +1,182 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from catalog import DATA_DIR
+
+# Columns a scenario can select products by, mapped to their indexed, normalized column.
+SCENARIO_COLUMNS = {
+    "brand": "brand_key",
+    "category": "category_key",
+}
+
+
+def normalize_key(value):
+    """
+    Formats a value the way it is stored in the key columns, e.g. "Coca Cola" -> "cocacola".
+    """
+    return re.sub(r"[^0-9a-z]+", "", str(value).lower())
+
+
+class ScenarioEngine:
+    """
+    Applies price-change scenarios to a SQLite price table.
+
+    Scenarios are copy-on-write overlays: the base `prices` table is never modified or copied, a scenario only
+    stores the new prices of the products it changes in `scenario_prices`. Products are selected with a single
+    parameterized INSERT ... SELECT over the indexed brand/category key columns, so a scenario over millions of rows
+    runs as one statement inside SQLite, and the impact summary is computed with NumPy.
+
+    Attributes:
+        conn (sqlite3.Connection): The database connection.
+    """
+
+    def __init__(self, path=":memory:", products_csv=os.path.join(DATA_DIR, "products.csv")):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS prices (
+                sku TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                brand TEXT NOT NULL,
+                category TEXT NOT NULL,
+                brand_key TEXT NOT NULL,
+                category_key TEXT NOT NULL,
+                price REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS prices_brand ON prices (brand_key);
+            CREATE INDEX IF NOT EXISTS prices_category ON prices (category_key);
+            CREATE TABLE IF NOT EXISTS scenarios (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                column_name TEXT NOT NULL,
+                column_values TEXT NOT NULL,
+                change_price REAL NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS scenario_prices (
+                scenario_id INTEGER NOT NULL,
+                sku TEXT NOT NULL,
+                price REAL NOT NULL,
+                PRIMARY KEY (scenario_id, sku)
+            ) WITHOUT ROWID;
+            """
+        )
+        if products_csv and not self.conn.execute("SELECT 1 FROM prices LIMIT 1").fetchone():
+            with open(products_csv, newline="", encoding="utf-8") as f:
+                self.load_prices(csv.DictReader(f))
+
+    def load_prices(self, rows):
+        """
+        Bulk loads products (dicts with sku, name, brand, category and price) into the base price table.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO prices (sku, name, brand, category, brand_key, category_key, price) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (r["sku"], r["name"], r["brand"], r["category"], normalize_key(r["brand"]),
+                     normalize_key(r["category"]), float(r["price"]))
+                    for r in rows
+                ),
+            )
+
+    def create_scenario(self, column, values, change_price, scenario_id=None):
+        """
+        Creates a scenario changing the prices of the products whose `column` is one of `values`.
+
+        Parameters:
+            column (str): "brand" or "category".
+            values (list[str]): The brands or categories to change. They are normalized like the stored keys.
+            change_price (float): The relative price change, e.g. 0.1 for +10%.
+            scenario_id (int, optional): An existing scenario to apply the change on top of. Defaults to None (a
+                new scenario based on the current prices).
+
+        Raises:
+            ValueError: If the column is not a scenario column or the scenario to stack on does not exist.
+
+        Returns:
+            dict: The scenario id and the summary of its impact (see `summarize`).
+        """
+        if column not in SCENARIO_COLUMNS:
+            raise ValueError(f"column must be one of {sorted(SCENARIO_COLUMNS)}, got {column!r}")
+        if isinstance(values, str):
+            values = [values]
+        keys = json.dumps([normalize_key(v) for v in values])
+        with self.lock, self.conn:
+            if scenario_id is None:
+                scenario_id = self.conn.execute(
+                    "INSERT INTO scenarios (column_name, column_values, change_price, created) VALUES (?, ?, ?, ?)",
+                    (column, json.dumps(list(values)), change_price, time.time()),
+                ).lastrowid
+            elif not self.conn.execute("SELECT 1 FROM scenarios WHERE id = ?", (scenario_id,)).fetchone():
+                raise ValueError(f"scenario {scenario_id!r} does not exist")
+            # The key column comes from the whitelist above, every value is a bound parameter.
+            self.conn.execute(
+                f"""
+                INSERT INTO scenario_prices (scenario_id, sku, price)
+                SELECT ?, p.sku, COALESCE(s.price, p.price) * (1 + ?)
+                FROM prices p
+                LEFT JOIN scenario_prices s ON s.scenario_id = ? AND s.sku = p.sku
+                WHERE p.{SCENARIO_COLUMNS[column]} IN (SELECT value FROM json_each(?))
+                ON CONFLICT (scenario_id, sku) DO UPDATE SET price = excluded.price
+                """,
+                (scenario_id, change_price, scenario_id, keys),
+            )
+        return {"scenario_id": scenario_id, **self.summarize(scenario_id)}
+
+    def summarize(self, scenario_id):
+        """
+        Computes the impact of a scenario on the prices it changes.
+
+        Returns:
+            dict: The number of changed products, the total and average base and scenario prices and the average
+            relative change. Free products (a base price of 0) have no relative change and are left out of it.
+        """
+        import numpy as np
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT p.price, s.price FROM scenario_prices s JOIN prices p ON p.sku = s.sku "
+                "WHERE s.scenario_id = ?",
+                (scenario_id,),
+            ).fetchall()
+        prices = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        base, new = prices[:, 0], prices[:, 1]
+        count = len(prices)
+        priced = base != 0
+        return {
+            "products": count,
+            "base_total": float(base.sum()),
+            "scenario_total": float(new.sum()),
+            "base_average": float(base.mean()) if count else 0.0,
+            "scenario_average": float(new.mean()) if count else 0.0,
+            "average_change": float(np.mean(new[priced] / base[priced] - 1)) if priced.any() else 0.0,
+        }
+
+    def scenario_prices(self, scenario_id):
+        """
+        Returns the prices of all products under a scenario, as (sku, name, price) rows.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT p.sku, p.name, COALESCE(s.price, p.price) FROM prices p "
+                "LEFT JOIN scenario_prices s ON s.scenario_id = ? AND s.sku = p.sku ORDER BY p.sku",
+                (scenario_id,),
+            ).fetchall()
+
+    def delete_scenario(self, scenario_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM scenario_prices WHERE scenario_id = ?", (scenario_id,))
+            self.conn.execute("DELETE FROM scenarios WHERE id = ?", (scenario_id,))
+
+
+@lru_cache(maxsize=None)
+def default_engine():
+    return ScenarioEngine(os.environ.get("SCENARIO_DB", ":memory:"))
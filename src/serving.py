@@ -0,0 +1,137 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from resilience import arun_with_resume
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is rejected because the runner already has `max_pending` requests waiting or running.
+    """
+
+
+class GraphRunner:
+    """
+    Drives a compiled agent graph (`Agent.graph`, `EssayAgent.graph`) for many tenants and threads at once.
+
+    Requests go through three limits:
+        - admission control: at most `max_pending` requests may be waiting or running; further requests are
+          rejected right away with `Overloaded`, which callers should turn into backpressure (e.g. HTTP 429);
+        - a per-tenant limit of `max_per_tenant` concurrent runs, so one tenant cannot take all the slots;
+        - a global limit of `max_in_flight` concurrent runs.
+    Runs of the same thread are serialized, since they read and write the same checkpoints. Thread ids are
+    namespaced by tenant. The locks of threads and the limits of tenants only exist while they have requests, so
+    memory does not grow with the number of tenants.
+
+    The graph must be compiled with a checkpointer that supports the async API (e.g. DurableSqliteSaver).
+
+    Example:
+        runner = GraphRunner(abot.graph, max_in_flight=64)
+        result = await runner.invoke("acme", "thread-1", {"messages": [HumanMessage(content="Hi")]})
+
+    Attributes:
+        graph (CompiledGraph): The compiled graph to run.
+        max_in_flight (int): The maximum number of concurrent runs.
+        max_per_tenant (int): The maximum number of concurrent runs per tenant.
+        max_pending (int): The maximum number of admitted requests, running or waiting.
+        resume_attempts (int): The maximum number of runs of a request that keeps failing with transient errors.
+    """
+
+    def __init__(self, graph, max_in_flight=32, max_per_tenant=4, max_pending=256, resume_attempts=2):
+        self.graph = graph
+        self.resume_attempts = resume_attempts
+        self.max_in_flight = max_in_flight
+        self.max_per_tenant = max_per_tenant
+        self.max_pending = max_pending
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.tenants = {}  # tenant -> [semaphore, number of requests using it]
+        self.threads = {}  # thread id -> [lock, number of requests using it]
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @staticmethod
+    def config(tenant, thread_id):
+        return {"configurable": {"thread_id": f"{tenant}:{thread_id}"}}
+
+    @asynccontextmanager
+    async def admit(self, tenant, thread_id):
+        """
+        Waits for a slot to run a request of `tenant` on `thread_id`, or raises Overloaded.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} requests pending, retry later")
+        self.pending += 1
+        key = f"{tenant}:{thread_id}"
+        thread = self.threads.setdefault(key, [asyncio.Lock(), 0])
+        thread[1] += 1
+        tenant_slots = self.tenants.setdefault(tenant, [asyncio.Semaphore(self.max_per_tenant), 0])
+        tenant_slots[1] += 1
+        try:
+            async with thread[0], tenant_slots[0], self.in_flight:
+                self.running += 1
+                try:
+                    yield
+                    self.completed += 1
+                except Exception:
+                    self.failed += 1
+                    raise
+                finally:
+                    self.running -= 1
+        finally:
+            self.pending -= 1
+            thread[1] -= 1
+            if not thread[1]:
+                del self.threads[key]
+            tenant_slots[1] -= 1
+            if not tenant_slots[1]:
+                del self.tenants[tenant]
+
+    async def invoke(self, tenant, thread_id, inputs, timeout=None):
+        """
+        Runs the graph to completion on a thread of a tenant.
+
+        Parameters:
+            tenant (str): The tenant making the request.
+            thread_id (str): The conversation thread, unique within the tenant.
+            inputs (dict): The graph input, or None to resume the thread from its last checkpoint.
+            timeout (float, optional): Seconds the run may take once it has a slot. Defaults to None (no limit).
+                It is also the deadline of the retries of the model and tool calls of the run.
+
+        Returns:
+            dict: The final state of the graph. A run failing with a transient error is resumed from its last
+            checkpoint, up to `resume_attempts` runs in total.
+        """
+        async with self.admit(tenant, thread_id):
+            run = arun_with_resume(self.graph, inputs, self.config(tenant, thread_id), attempts=self.resume_attempts,
+                                   timeout=timeout)
+            return await asyncio.wait_for(run, timeout)
+
+    async def stream(self, tenant, thread_id, inputs, stream_mode="updates"):
+        """
+        Runs the graph on a thread of a tenant and yields its events as they are produced.
+
+        Parameters:
+            tenant (str): The tenant making the request.
+            thread_id (str): The conversation thread, unique within the tenant.
+            inputs (dict): The graph input, or None to resume the thread from its last checkpoint.
+            stream_mode (str, optional): The graph stream mode. Defaults to "updates".
+
+        Yields:
+            dict: The graph events.
+        """
+        async with self.admit(tenant, thread_id):
+            async for event in self.graph.astream(inputs, self.config(tenant, thread_id), stream_mode=stream_mode):
+                yield event
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
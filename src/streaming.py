@@ -0,0 +1,119 @@
+import asyncio
+import queue
+import threading
+
+from langchain_core.messages import message_chunk_to_message
+
+import resilience
+import tracing
+
+# Key of the `configurable` section of a run config holding the callback that receives the streamed tokens.
+TOKEN_SINK = "token_sink"
+_DONE = object()
+
+
+def invoke_model(model, messages, config=None, node=None):
+    """
+    Invokes a chat model from a graph node.
+
+    If the run config carries a token sink (see `stream_with_tokens`), the response is streamed and each token is
+    passed to the sink as soon as it arrives. Either way the complete response message is returned, so nodes do not
+    need to know whether they are being streamed.
+
+    The call is committed (see `resilience.commit`) before its first token is sent: the policy running it no longer
+    retries it nor times it out, so the client never receives a token twice.
+
+    Parameters:
+        model (Runnable): The chat model.
+        messages (list[AnyMessage]): The messages to send.
+        config (RunnableConfig, optional): The config of the node, as passed by the graph. Defaults to None.
+        node (str, optional): The name of the node, reported with every token. Defaults to None.
+
+    Returns:
+        AIMessage: The response of the model.
+    """
+    sink = ((config or {}).get("configurable") or {}).get(TOKEN_SINK)
+    with tracing.span("llm", node=node) as span:
+        if sink is None:
+            response = model.invoke(messages, config)
+        else:
+            response = None
+            sent = False
+            for chunk in model.stream(messages, config):
+                if chunk.content:
+                    if not sent:
+                        resilience.commit()
+                        sent = True
+                    sink(node, chunk.content)
+                response = chunk if response is None else response + chunk
+            response = message_chunk_to_message(response)
+        usage = getattr(response, "usage_metadata", None)
+        if span is not None and usage:
+            span.add("input_tokens", usage.get("input_tokens", 0))
+            span.add("output_tokens", usage.get("output_tokens", 0))
+    return response
+
+
+def with_sink(config, sink):
+    return {**config, "configurable": {**config.get("configurable", {}), TOKEN_SINK: sink}}
+
+
+def stream_with_tokens(graph, inputs, config):
+    """
+    Runs a compiled graph and yields the tokens generated by its nodes along with the node updates.
+
+    Parameters:
+        graph (CompiledGraph): The graph to run. Its nodes must call their model through `invoke_model`.
+        inputs (dict): The graph input.
+        config (RunnableConfig): The run config (thread id).
+
+    Yields:
+        tuple: ("token", {"node": name, "delta": text}) for every token, and ("update", event) for every event of
+        `graph.stream(..., stream_mode="updates")`.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            sink = lambda node, delta: events.put(("token", {"node": node, "delta": delta}))  # noqa: E731
+            for event in graph.stream(inputs, with_sink(config, sink), stream_mode="updates"):
+                events.put(("update", event))
+            events.put(_DONE)
+        except BaseException as e:
+            events.put(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    while (item := events.get()) is not _DONE:
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+async def astream_with_tokens(graph, inputs, config):
+    """
+    Async version of `stream_with_tokens`, running the graph with `astream`.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def sink(node, delta):
+        # Sync nodes run in executor threads, so tokens are handed over to the event loop thread-safely.
+        loop.call_soon_threadsafe(events.put_nowait, ("token", {"node": node, "delta": delta}))
+
+    async def run():
+        try:
+            async for event in graph.astream(inputs, with_sink(config, sink), stream_mode="updates"):
+                await events.put(("update", event))
+            # Queued after any token still scheduled by call_soon_threadsafe.
+            loop.call_soon(events.put_nowait, _DONE)
+        except BaseException as e:
+            loop.call_soon(events.put_nowait, e)
+
+    task = asyncio.create_task(run())
+    try:
+        while (item := await events.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        task.cancel()
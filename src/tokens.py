@@ -0,0 +1,52 @@
+import logging
+from functools import lru_cache
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Rough number of characters per token of English text, used when the tiktoken encoding cannot be loaded.
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model="gpt-4o"):
+    """
+    Returns the tiktoken encoding used by a model, falling back to cl100k_base for unknown models.
+
+    tiktoken downloads the encoding files on first use; if that fails (e.g. on a host without network access),
+    None is returned and token counts are approximated from the text length.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("Could not load the tiktoken encoding for %s, approximating token counts (%r)", model, e)
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text, model="gpt-4o"):
+    """
+    Counts the tokens of a text. Results are memoized since the same snippets and messages are counted on every
+    turn.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model="gpt-4o"):
+    """
+    Truncates a text to at most `max_tokens` tokens.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,326 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The span being recorded in the current thread or task, if any.
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Upper bounds, in seconds, of the buckets of the latency histograms.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Span:
+    """
+    A timed operation (a graph node, a model call, a tool call, ...) in OpenTelemetry terms.
+
+    Counters (tokens, retries, the time of the child spans by name) are added with `add` and rolled up into the
+    parent span when the span ends, so a node span reports the LLM and tool share of its wall time.
+    """
+
+    def __init__(self, tracer, name, parent=None, sampled=True, **attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.sampled = sampled
+        self.trace_id = parent.trace_id if parent else random.getrandbits(128)
+        self.span_id = random.getrandbits(64)
+        self.attributes = attributes
+        self.counts = defaultdict(int)
+        # Child spans of concurrent tool and search calls end on worker threads and add to the counts at once.
+        self.lock = threading.Lock()
+        self.status = "OK"
+        self.start = time.time_ns()
+        self.perf_start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counts[name] += value
+
+    def end(self):
+        self.duration = time.perf_counter() - self.perf_start
+        if self.parent is not None:
+            with self.lock:
+                counts = list(self.counts.items())
+            with self.parent.lock:
+                self.parent.counts[f"{self.name}_seconds"] += self.duration
+                for name, value in counts:
+                    self.parent.counts[name] += value
+        self.tracer.record(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": f"{self.trace_id:032x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_span_id": f"{self.parent.span_id:016x}" if self.parent else None,
+            "name": self.name,
+            "start_time_unix_nano": self.start,
+            "end_time_unix_nano": self.start + int(self.duration * 1e9),
+            "attributes": {**self.attributes, **self.counts},
+            "status": self.status,
+        }
+
+
+class Tracer:
+    """
+    Records spans of graph nodes and the model and tool calls they make, and aggregates them into metrics.
+
+    Metrics (latency histograms per span and node, token, retry and error counters) are aggregated for every run.
+    Only a `sample_rate` fraction of the traces is exported as spans to `path`, one JSON object per line, so the
+    cost of tracing stays low under load.
+
+    Attributes:
+        sample_rate (float): The fraction of the traces exported as spans.
+        path (str): The JSON lines file the sampled spans are appended to, or None to not export spans.
+    """
+
+    def __init__(self, sample_rate=1.0, path=None):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+        self.sums = defaultdict(float)
+        self.counters = defaultdict(float)
+        self.file = open(path, "a", encoding="utf-8") if path else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Records a span around a block, as a child of the current span if there is one.
+        """
+        parent = _current_span.get()
+        sampled = parent.sampled if parent else random.random() < self.sample_rate
+        span = Span(self, name, parent, sampled, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "ERROR"
+            span.set(error=repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def record(self, span):
+        labels = (span.name, span.attributes.get("node") or span.attributes.get("tool") or "")
+        bucket = next((i for i, le in enumerate(LATENCY_BUCKETS) if span.duration <= le), len(LATENCY_BUCKETS))
+        with self.lock:
+            self.histograms[labels][bucket] += 1
+            self.sums[labels] += span.duration
+            if span.status != "OK":
+                self.counters[("errors",) + labels] += 1
+            if span.parent is None:
+                # Counters are rolled up into the root span, count them once there.
+                for name, value in span.counts.items():
+                    if not name.endswith("_seconds"):
+                        self.counters[(name,) + labels] += value
+            if span.sampled and self.file is not None:
+                self.file.write(json.dumps(span.to_dict(), default=str) + "\n")
+                self.file.flush()
+
+    def metrics_text(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        lines = ["# TYPE agent_span_seconds histogram"]
+        with self.lock:
+            for (name, target), counts in sorted(self.histograms.items()):
+                labels = f'span="{name}",target="{target}"'
+                total = 0
+                for le, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                    total += count
+                    lines.append(f'agent_span_seconds_bucket{{{labels},le="{le}"}} {total}')
+                lines.append(f"agent_span_seconds_sum{{{labels}}} {self.sums[(name, target)]}")
+                lines.append(f"agent_span_seconds_count{{{labels}}} {total}")
+            for metric in sorted({key[0] for key in self.counters}):
+                lines.append(f"# TYPE agent_{metric}_total counter")
+                for (counter, name, target), value in sorted(self.counters.items()):
+                    if counter == metric:
+                        lines.append(f'agent_{metric}_total{{span="{name}",target="{target}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path):
+        """
+        Writes the metrics to a file, e.g. for the textfile collector of the Prometheus node exporter.
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.metrics_text())
+        os.replace(tmp, path)
+
+    def serve_metrics(self, port=9464, host="127.0.0.1"):
+        """
+        Serves the metrics on http://host:port/metrics from a background thread.
+
+        Returns:
+            ThreadingHTTPServer: The server, stop it with `shutdown()`.
+        """
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.metrics_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Records a child span of the current span. Outside of a traced node this does nothing and yields None.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.span(name, **attributes) as child:
+        yield child
+
+
+def add(name, value=1):
+    """
+    Adds to a counter (tokens, retries, ...) of the current span, if any.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.add(name, value)
+
+
+def state_size(value):
+    """
+    Estimates the size of a graph state or update in characters of text, without serializing it.
+    """
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(state_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(state_size(v) for v in value)
+    content = getattr(value, "content", None)
+    return state_size(content) if content is not None else 0
+
+
+def trace_node(func, node, tracer=None):
+    """
+    Wraps a graph node so every call is recorded as a span with its wall time, its LLM and tool time, its token
+    counts and the size of its input state and of its update.
+
+    The wrapper keeps the signature of the node, so nodes accepting a `config` still receive it. Without a tracer
+    the node is returned unchanged.
+    """
+    if tracer is None:
+        return func
+
+    from langchain_core.runnables.config import var_child_runnable_config
+
+    def attributes(state):
+        config = var_child_runnable_config.get() or {}
+        thread_id = (config.get("configurable") or {}).get("thread_id")
+        return {"node": node, "thread_id": thread_id, "state_size": state_size(state)}
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state, *args, **kwargs):
+            with tracer.span("node", **attributes(state)) as node_span:
+                update = await func(state, *args, **kwargs)
+                node_span.set(update_size=state_size(update))
+                return update
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, *args, **kwargs):
+        with tracer.span("node", **attributes(state)) as node_span:
+            update = func(state, *args, **kwargs)
+            node_span.set(update_size=state_size(update))
+            return update
+
+    return wrapper
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as JSON lines, including the fields passed with `extra` and the current trace and span.
+    """
+
+    RESERVED = set(vars(logging.makeLogRecord({})))
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self.RESERVED and k != "message"})
+        current = _current_span.get()
+        if current is not None:
+            entry["trace_id"] = f"{current.trace_id:032x}"
+            entry["span_id"] = f"{current.span_id:016x}"
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a `rate` fraction of the records below `always_level`; warnings and errors are always kept.
+    """
+
+    def __init__(self, rate=1.0, always_level=logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.always_level = always_level
+
+    def filter(self, record):
+        return record.levelno >= self.always_level or random.random() < self.rate
+
+
+# Libraries whose debug records (connection and TLS setup of every request) would drown those of the agents.
+QUIET_LOGGERS = ("httpx", "httpcore", "openai", "urllib3")
+
+
+def configure_logging(level=logging.INFO, json_format=False, sample_rate=1.0):
+    """
+    Configures the logging of a script: plain or JSON lines records on stderr, sampled below warnings.
+
+    The handler is only added if the root logger has none, so the logging of a process importing the agents is left
+    as it is. The HTTP client libraries only log warnings and errors, whatever `level`.
+    """
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter() if json_format else logging.Formatter("%(message)s"))
+        handler.addFilter(SamplingFilter(sample_rate))
+        root.addHandler(handler)
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(level, logging.WARNING))
@@ -0,0 +1,35 @@
+import pytest
+
+from actions import ActionRegistry, UnknownAction, calculate, parse_actions
+
+
+def test_actions_are_parsed_in_order():
+    text = "Thought: prices\nAction: get_price: pencil\nAction: calculate: 2 * 3\n"
+    assert parse_actions(text) == [("get_price", "pencil"), ("calculate", "2 * 3")]
+
+
+def test_unknown_actions_raise():
+    with pytest.raises(UnknownAction):
+        ActionRegistry().dispatch("missing", "input")
+
+
+@pytest.mark.parametrize("expression, value", [
+    ("2 * (3 + 4)", 14),
+    ("round(2 / 3, 2)", 0.67),
+    ("max(1, 2) ** 10", 1024),
+    ("(2**1000) * (2**1000)", 2 ** 2000),
+])
+def test_arithmetic_expressions_are_evaluated(expression, value):
+    assert calculate(expression) == value
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')",
+    "2 ** 100000",
+    "((2**1000)**1000)**1000",
+    "(10**100)**1000 - 1",
+    "*".join(["3**999"] * 8),
+])
+def test_unsafe_or_unbounded_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        calculate(expression)
@@ -0,0 +1,52 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from append_log import AppendLog, append_messages
+from checkpointer import DurableSqliteSaver
+from clients import tavily_search_tool
+from content_store import add_content
+from fakes import FakeChatModel, FakeSearchClient, Latency
+from lang_graph import Agent
+
+
+def test_graph_outputs_are_plain_lists(tmp_path):
+    checkpointer = DurableSqliteSaver.from_path(str(tmp_path / "checkpoints.sqlite"))
+    model = FakeChatModel(latency=Latency(), tool_calls=2, response_words=5)
+    agent = Agent(model, [tavily_search_tool(FakeSearchClient(result_words=5), max_results=1)],
+                  checkpointer=checkpointer)
+    result = agent.graph.invoke({"messages": [HumanMessage(content="question")]},
+                                {"configurable": {"thread_id": "thread"}})
+    messages = result["messages"]
+    assert isinstance(messages, list) and len(messages) == 5
+    messages.append(HumanMessage(content="follow-up"))
+    assert json.dumps([m.content for m in messages])
+
+
+def test_versions_do_not_see_the_items_of_newer_ones():
+    first = append_messages([], [HumanMessage(content="a", id="1")])
+    second = append_messages(first, [AIMessage(content="b", id="2")])
+    third = append_messages(first, [AIMessage(content="c", id="3")])
+    assert [m.content for m in first] == ["a"]
+    assert [m.content for m in second] == ["a", "b"]
+    assert [m.content for m in third] == ["a", "c"]
+    assert third.position("2") is None and third.position("3") == 1
+
+
+def test_messages_with_an_existing_id_replace_it():
+    messages = append_messages([], [HumanMessage(content="a", id="1"), AIMessage(content="b", id="2")])
+    messages = append_messages(messages, [AIMessage(content="B", id="2"), AIMessage(content="c", id="3")])
+    assert [m.content for m in messages] == ["a", "B", "c"]
+
+
+def test_logs_changed_in_place_are_indexed_again():
+    log = AppendLog(["a", "b"], key=str.upper)
+    log.append("c")
+    extended = log.extended(["d"])
+    assert extended == ["a", "b", "c", "d"] and extended.position("D") == 3
+
+
+def test_content_is_deduplicated_across_steps():
+    content = add_content([], ["first snippet about tides", "second snippet about volcanoes"])
+    content = add_content(content, ["first snippet about tides", "third snippet about glaciers"])
+    assert content == ["first snippet about tides", "second snippet about volcanoes", "third snippet about glaciers"]
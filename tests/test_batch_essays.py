@@ -0,0 +1,70 @@
+import json
+
+from batch_essays import EssayWorker, completed_ids, run_batch
+from checkpointer import DurableSqliteSaver
+from essay_writer import EssayAgent
+from fakes import FakeChatModel, FakeSearchClient, Usage
+
+USAGE = Usage()
+
+
+def fake_agent(options):
+    """An agent factory for `run_batch`, on the fake model and search client."""
+    return EssayAgent(
+        model=FakeChatModel(tool_calls=2, response_words=50, usage=USAGE),
+        search_tool=FakeSearchClient(result_words=50),
+        checkpointer=DurableSqliteSaver.from_path(options["checkpoint_db"]),
+    )
+
+
+def batch(tmp_path, topics, **kwargs):
+    topics_path = tmp_path / "topics.jsonl"
+    topics_path.write_text("".join(json.dumps(topic) + "\n" for topic in topics))
+    output_path = tmp_path / "essays.jsonl"
+    stats = run_batch(str(topics_path), str(output_path), workers=2, mode="async", max_revisions=1,
+                      checkpoint_db=str(tmp_path / "checkpoints.sqlite"), factory="test_batch_essays:fake_agent",
+                      **kwargs)
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    return stats, records
+
+
+def options(tmp_path):
+    return {"factory": "test_batch_essays:fake_agent", "checkpoint_db": str(tmp_path / "checkpoints.sqlite"),
+            "max_revisions": 1}
+
+
+def test_finished_topics_are_skipped_when_the_batch_is_run_again(tmp_path):
+    topics = [{"id": "a", "topic": "tides"}, {"id": "b", "topic": "volcanoes"}]
+    stats, records = batch(tmp_path, topics)
+    assert stats["ok"] == 2 and stats["skipped"] == 0
+    calls = USAGE.calls
+    stats, records = batch(tmp_path, topics + [{"id": "c", "topic": "glaciers"}])
+    assert stats["topics"] == 1 and stats["skipped"] == 2 and stats["ok"] == 1
+    assert sorted(r["id"] for r in records[:2]) == ["a", "b"] and records[2]["id"] == "c"
+    assert all(r["status"] == "ok" and r["draft"] for r in records)
+    assert USAGE.calls > calls
+
+
+def test_failed_and_truncated_records_are_not_completed(tmp_path):
+    path = tmp_path / "essays.jsonl"
+    path.write_text('{"id": "a", "status": "ok"}\n{"id": "b", "status": "error"}\n{"id": "c", "sta')
+    assert completed_ids(str(path)) == {"a"}
+
+
+def test_interrupted_topics_resume_from_their_last_checkpoint(tmp_path):
+    worker = EssayWorker(options(tmp_path))
+    # A full run of the same topic on another thread, to count its model calls.
+    calls = USAGE.calls
+    worker.run({"id": "full", "topic": "tides"})
+    full_calls = USAGE.calls - calls
+
+    # The batch stops before the generation of topic "a", after its planner and research.
+    topic = {"id": "a", "topic": "tides"}
+    calls = USAGE.calls
+    worker.agent.graph.invoke(worker.inputs(topic), worker.config(topic), interrupt_before=["generate"])
+    assert worker.agent.graph.get_state(worker.config(topic)).next == ("generate",)
+
+    stats, records = batch(tmp_path, [topic])
+    assert stats["ok"] == 1 and records[0]["draft"]
+    # The planner and the research are not run again.
+    assert USAGE.calls - calls == full_calls
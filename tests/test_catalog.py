@@ -0,0 +1,50 @@
+import pytest
+
+from catalog import Catalog, dog_breeds, normalize, products, strip_quantity
+from open_ai_react import average_dog_weight, get_price
+
+
+@pytest.mark.parametrize("name, stripped", [
+    ("2 pencils", "pencils"),
+    ("3x notebook", "notebook"),
+    ("pencil", "pencil"),
+    ("7up 330ml", "7up 330ml"),
+])
+def test_quantities_are_stripped(name, stripped):
+    assert strip_quantity(name) == stripped
+
+
+def test_names_are_normalized():
+    assert normalize("  Pencils! ") == normalize("pencil") == "pencil"
+
+
+def test_exact_and_fuzzy_lookups_find_a_single_record():
+    assert products().lookup("Pencils").record["name"] == "pencil"
+    assert products().lookup("pencl").record["name"] == "pencil"
+
+
+def test_lookups_match_whole_words():
+    assert products().lookup("pen").record["name"] == "ballpoint pen"
+
+
+def test_ambiguous_names_return_candidates_instead_of_a_record():
+    match = dog_breeds().lookup("terrier")
+    assert not match.found
+    assert sorted(match.candidates) == ["Scottish Terrier", "Yorkshire Terrier"]
+
+
+def test_unknown_names_are_not_found():
+    match = products().lookup("ferrari")
+    assert not match.found and not match.ambiguous
+
+
+def test_fuzzy_matches_close_to_each_other_are_ambiguous():
+    catalog = Catalog({"red apple": 1, "red apples box": 2, "banana": 3}, margin=1)
+    match = catalog.lookup("red appel")
+    assert match.ambiguous and "red apple" in match.candidates
+
+
+def test_tools_strip_quantities_and_report_ambiguities():
+    assert get_price("2 pencils, 3x notebook") == "A pencil costs 1.0 Euros; A notebook costs 2.5 Euros"
+    assert "ambiguous" in average_dog_weight("terrier")
+    assert "not found" in get_price("ferrari")
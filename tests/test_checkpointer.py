@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from checkpointer import DurableSqliteSaver
+from clients import tavily_search_tool
+from fakes import FakeChatModel, FakeSearchClient, Latency
+from lang_graph import Agent
+
+
+def agent(checkpointer):
+    model = FakeChatModel(latency=Latency(), tool_calls=1, response_words=100)
+    search = FakeSearchClient(result_words=100)
+    return Agent(model, [tavily_search_tool(search, max_results=1)], checkpointer=checkpointer)
+
+
+def count_blobs(checkpointer):
+    with checkpointer.cursor(transaction=False) as cur:
+        return cur.execute("SELECT count(*) FROM blobs").fetchone()[0]
+
+
+def ask(checkpointer, thread_id, question):
+    config = {"configurable": {"thread_id": thread_id}}
+    return agent(checkpointer).graph.invoke({"messages": [("user", question)]}, config)
+
+
+def test_unreferenced_blobs_are_collected_while_writing(tmp_path):
+    checkpointer = DurableSqliteSaver.from_path(str(tmp_path / "checkpoints.sqlite"), max_checkpoints_per_thread=1,
+                                                prune_every=1, collect_every=5, blob_threshold=100)
+    for i in range(10):
+        ask(checkpointer, f"thread {i}", f"question {i}")
+        checkpointer.delete_thread(f"thread {i}")
+    # Only the blobs written since the last collection are left, not those of all the deleted threads.
+    assert count_blobs(checkpointer) < 10
+    assert count_blobs(checkpointer) > 0
+    checkpointer.collect_blobs()
+    assert count_blobs(checkpointer) == 0
+
+
+def test_close_closes_the_connections_of_every_thread(tmp_path):
+    checkpointer = DurableSqliteSaver.from_path(str(tmp_path / "checkpoints.sqlite"))
+    ask(checkpointer, "thread", "question")
+    connections = [checkpointer.conn]
+    done = threading.Event()
+
+    def read():
+        checkpointer.get_tuple({"configurable": {"thread_id": "thread"}})
+        connections.append(checkpointer.readers[threading.current_thread()])
+        done.wait()
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while len(connections) < 4:
+        time.sleep(0.01)
+    checkpointer.close()
+    done.set()
+    for thread in threads:
+        thread.join()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+def test_threads_continue_after_reopening_the_database(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    checkpointer = DurableSqliteSaver.from_path(path, blob_threshold=100)
+    first = ask(checkpointer, "thread", "question 1")["messages"]
+    checkpointer.close()
+
+    reopened = DurableSqliteSaver.from_path(path, blob_threshold=100)
+    config = {"configurable": {"thread_id": "thread"}}
+    state = agent(reopened).graph.get_state(config)
+    assert [m.content for m in state.values["messages"]] == [m.content for m in first]
+    messages = ask(reopened, "thread", "question 2")["messages"]
+    assert [m.content for m in messages[:len(first)]] == [m.content for m in first]
+    assert messages[len(first)].content == "question 2"
+    assert len(messages) == 2 * len(first)
+    reopened.close()
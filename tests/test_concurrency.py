@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from concurrency import arun_concurrently, run_concurrently
+
+
+def test_results_keep_the_order_of_the_items():
+    assert run_concurrently(lambda x: time.sleep(0.05 * (3 - x)) or x * 2, [0, 1, 2]) == [0, 2, 4]
+
+
+def test_failures_are_returned_in_place():
+    results = run_concurrently(lambda x: 1 / x, [1, 0, 2])
+    assert results[0] == 1 and isinstance(results[1], ZeroDivisionError) and results[2] == 0.5
+
+
+def test_queued_calls_get_their_full_timeout():
+    # Two workers and a 0.3s timeout: the last calls start after 0.2s but are not timed out for it.
+    results = run_concurrently(lambda x: time.sleep(x) or x, [0.2, 0.2, 0.2, 0.2, 0.5], max_workers=2, timeout=0.3)
+    assert results[:4] == [0.2, 0.2, 0.2, 0.2]
+    assert isinstance(results[4], TimeoutError)
+
+
+def test_timed_out_calls_free_their_worker():
+    start = time.monotonic()
+    results = run_concurrently(lambda x: time.sleep(x) or x, [1, 0.05, 0.05], max_workers=1, timeout=0.1)
+    assert isinstance(results[0], TimeoutError) and results[1:] == [0.05, 0.05]
+    assert time.monotonic() - start < 0.5
+
+
+def test_async_calls_get_their_own_timeout():
+    async def call(x):
+        await asyncio.sleep(x)
+        return x
+
+    results = asyncio.run(arun_concurrently(call, [0.2, 0.2, 0.2, 0.5], max_concurrency=2, timeout=0.3))
+    assert results[:3] == [0.2, 0.2, 0.2] and isinstance(results[3], asyncio.TimeoutError)
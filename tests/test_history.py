@@ -0,0 +1,66 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from clients import tavily_search_tool
+from fakes import FakeChatModel, FakeSearchClient, fake_text
+from history import MessageHistory
+from lang_graph import Agent
+
+
+def tool_turn(i, words=300):
+    call = {"name": "search", "args": {"query": f"query {i}"}, "id": f"call_{i}"}
+    return [
+        HumanMessage(content=f"question {i}", id=f"human_{i}"),
+        AIMessage(content="", tool_calls=[call], id=f"ai_{i}"),
+        ToolMessage(content=fake_text(f"result {i}", words), tool_call_id=f"call_{i}", name="search", id=f"tool_{i}"),
+        AIMessage(content=f"answer {i}", id=f"answer_{i}"),
+    ]
+
+
+def total_tokens(history, messages):
+    return sum(history.message_tokens(m) for m in messages)
+
+
+def test_histories_within_budget_are_left_as_is():
+    history = MessageHistory(max_tokens=100_000)
+    assert history.compact(tool_turn(0) + tool_turn(1)) == []
+
+
+def test_the_oldest_tool_outputs_are_compacted_until_the_history_fits():
+    messages = [m for i in range(5) for m in tool_turn(i)]
+    history = MessageHistory(max_tokens=1000, keep_last=4, tool_tokens=16)
+    compacted = history.compact(messages)
+    assert [m.id for m in compacted] == [f"tool_{i}" for i in range(len(compacted))]
+    assert all(m.additional_kwargs["compacted"] and m.tool_call_id == m.id.replace("tool", "call") for m in compacted)
+    replacements = {m.id: m for m in compacted}
+    messages = [replacements.get(m.id, m) for m in messages]
+    assert total_tokens(history, messages) <= history.max_tokens
+    # Compacting again does not rewrite the compacted messages.
+    assert history.compact(messages) == []
+
+
+def test_the_most_recent_messages_are_never_compacted():
+    messages = tool_turn(0) + tool_turn(1)
+    history = MessageHistory(max_tokens=10, keep_last=4)
+    assert [m.id for m in history.compact(messages)] == ["tool_0"]
+
+
+def test_tool_outputs_are_summarized_with_the_summarizer():
+    history = MessageHistory(max_tokens=10, keep_last=0, summarize=lambda content: "summary")
+    assert [m.content for m in history.compact(tool_turn(0))] == ["summary"]
+
+
+def test_compacted_messages_replace_the_originals_in_the_checkpointed_state():
+    model = FakeChatModel(tool_calls=1, response_words=20)
+    search = FakeSearchClient(result_words=300)
+    history = MessageHistory(max_tokens=600, keep_last=4, tool_tokens=16)
+    with SqliteSaver.from_conn_string(":memory:") as checkpointer:
+        agent = Agent(model, [tavily_search_tool(search, max_results=1)], checkpointer=checkpointer, history=history)
+        config = {"configurable": {"thread_id": "thread"}}
+        for i in range(3):
+            messages = agent.graph.invoke({"messages": [("user", f"question {i}")]}, config)["messages"]
+    assert len(messages) == 12
+    assert len({m.id for m in messages}) == 12
+    tool_messages = [m for m in messages if isinstance(m, ToolMessage)]
+    assert tool_messages[0].additional_kwargs.get("compacted")
+    assert not tool_messages[-1].additional_kwargs.get("compacted")
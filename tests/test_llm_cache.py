@@ -0,0 +1,76 @@
+from typing import List
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.pydantic_v1 import BaseModel
+
+from clients import make_chat_model
+from fakes import FakeChatModel, FlakyServer, Latency, Usage
+from llm_cache import ResponseCache
+from resilience import Policy
+from routing import STRONG, ModelRouter
+
+
+class Queries(BaseModel):
+    queries: List[str]
+
+
+class DeterministicFakeChatModel(FakeChatModel):
+    temperature: float = 0
+
+
+@pytest.fixture
+def server():
+    with FlakyServer() as server:
+        yield server
+
+
+def router(model, cache):
+    return ModelRouter(model, policies={STRONG: Policy("test", attempts=1)}, cache=cache)
+
+
+def messages(topic):
+    return [SystemMessage(content="Write an outline."), HumanMessage(content=topic)]
+
+
+def test_chat_model_calls_at_temperature_0_are_cached(server):
+    cache = ResponseCache()
+    model = make_chat_model("gpt-4o", base_url=f"{server.url}/v1", api_key="fake", temperature=0)
+    first = router(model, cache).invoke("planner", messages("tides"))
+    second = router(model, cache).invoke("planner", messages("tides"))
+    assert second.content == first.content
+    assert server.usage.calls == 1
+    assert cache.stats()["hits"] == 1
+
+    router(model, cache).invoke("planner", messages("volcanoes"))
+    assert server.usage.calls == 2
+
+
+def test_chat_model_calls_at_other_temperatures_are_not_cached(server):
+    cache = ResponseCache()
+    model = make_chat_model("gpt-4o", base_url=f"{server.url}/v1", api_key="fake", temperature=0.7)
+    router(model, cache).invoke("generate", messages("tides"))
+    router(model, cache).invoke("generate", messages("tides"))
+    assert server.usage.calls == 2
+    assert cache.stats()["misses"] == 0
+
+
+def test_streamed_calls_bypass_the_cache(server):
+    cache = ResponseCache()
+    model = DeterministicFakeChatModel(latency=Latency(), response_words=5)
+    tokens = []
+    config = {"configurable": {"token_sink": lambda node, delta: tokens.append(delta)}}
+    router(model, cache).invoke("planner", messages("tides"))
+    response = router(model, cache).invoke("planner", messages("tides"), config)
+    assert "".join(tokens) == response.content
+    assert cache.stats() == {"hits": 0, "near_hits": 0, "misses": 1, "hit_rate": 0.0}
+
+
+def test_structured_outputs_are_cached():
+    cache = ResponseCache()
+    usage = Usage()
+    model = DeterministicFakeChatModel(latency=Latency(), tool_calls=2, usage=usage)
+    first = router(model, cache).structured("research_plan", Queries, messages("tides"))
+    second = router(model, cache).structured("research_plan", Queries, messages("tides"))
+    assert second == first and len(first.queries) == 2
+    assert usage.calls == 1
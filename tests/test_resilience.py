@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+import resilience
+from fakes import FakeChatModel, FakeSearchClient, FakeTransientError, Faults, Latency
+from resilience import AttemptAbandoned, CircuitBreaker, CircuitOpenError, Policy
+from routing import STRONG, ModelRouter
+from streaming import TOKEN_SINK
+
+
+def fast_policy(**kwargs):
+    return Policy("test", **{"backoff": 0.001, **kwargs})
+
+
+def test_transient_failures_are_retried():
+    search = FakeSearchClient(faults=Faults(fail_first=2))
+    response = fast_policy(attempts=3).call(search.search, "tides", max_results=1)
+    assert len(response["results"]) == 1
+    assert search.faults.failures == 2
+
+
+def test_the_last_error_is_raised_after_the_attempts():
+    search = FakeSearchClient(faults=Faults(fail_first=5))
+    with pytest.raises(FakeTransientError):
+        fast_policy(attempts=3).call(search.search, "tides")
+    assert search.faults.calls == 3
+
+
+def test_permanent_errors_are_not_retried():
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        fast_policy(attempts=3).call(fail)
+    assert len(calls) == 1
+
+
+def test_slow_attempts_time_out_and_are_retried():
+    calls = []
+
+    def slow_then_fast():
+        calls.append(1)
+        time.sleep(0.5 if len(calls) == 1 else 0)
+        return "ok"
+
+    assert fast_policy(attempts=2, timeout=0.1).call(slow_then_fast) == "ok"
+    assert len(calls) == 2
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_after_a_trial():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.1)
+    policy = fast_policy(attempts=1, breaker=breaker)
+    search = FakeSearchClient(faults=Faults(fail_first=2))
+    for _ in range(2):
+        with pytest.raises(FakeTransientError):
+            policy.call(search.search, "tides")
+    with pytest.raises(CircuitOpenError):
+        policy.call(search.search, "tides")
+    assert search.faults.calls == 2
+    time.sleep(0.1)
+    policy.call(search.search, "tides")
+    assert breaker.state == "closed"
+
+
+def test_slow_idempotent_calls_are_hedged():
+    calls = []
+
+    def first_hangs():
+        calls.append(1)
+        time.sleep(1 if len(calls) == 1 else 0)
+        return len(calls)
+
+    policy = fast_policy(attempts=1, hedge_after=0.05, idempotent=True)
+    start = time.monotonic()
+    assert policy.call(first_hangs) == 2
+    assert time.monotonic() - start < 0.5
+
+
+def test_calls_that_are_not_idempotent_are_not_hedged():
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+
+    fast_policy(attempts=1, hedge_after=0.05).call(slow)
+    assert len(calls) == 1
+
+
+def test_attempt_threads_are_bounded():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    policy = fast_policy(attempts=1, timeout=5, max_workers=2)
+    threads = [threading.Thread(target=policy.call, args=(call,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(peak) == 6 and max(peak) == 2
+
+
+def test_deadline_stops_the_retries():
+    search = FakeSearchClient(latency=Latency(mean=0.05), faults=Faults(fail_first=100))
+    policy = fast_policy(attempts=100, backoff=0.05)
+    with resilience.deadline(0.2), pytest.raises((FakeTransientError, TimeoutError)):
+        policy.call(search.search, "tides")
+    assert search.faults.calls < 10
+
+
+def test_committed_attempts_are_neither_timed_out_nor_retried():
+    calls = []
+
+    def commit_then_fail():
+        calls.append(1)
+        resilience.commit()
+        time.sleep(0.2)
+        raise FakeTransientError("failed after committing")
+
+    with pytest.raises(FakeTransientError):
+        fast_policy(attempts=3, timeout=0.05).call(commit_then_fail)
+    assert len(calls) == 1
+
+
+def test_abandoned_attempts_cannot_commit():
+    abandoned = []
+
+    def slow():
+        time.sleep(0.2)
+        try:
+            resilience.commit()
+        except AttemptAbandoned:
+            abandoned.append(1)
+
+    with pytest.raises(TimeoutError):
+        fast_policy(attempts=1, timeout=0.05).call(slow)
+    time.sleep(0.3)
+    assert abandoned == [1]
+
+
+def test_async_committed_attempts_are_not_retried():
+    calls = []
+
+    async def commit_then_fail():
+        calls.append(1)
+        resilience.commit()
+        await asyncio.sleep(0.2)
+        raise FakeTransientError("failed after committing")
+
+    with pytest.raises(FakeTransientError):
+        asyncio.run(fast_policy(attempts=3, timeout=0.05).acall(commit_then_fail))
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("model", [
+    FakeChatModel(response_words=20, faults=Faults(error_rate=0.5, mid_stream=True, seed=1)),
+    FakeChatModel(response_words=20, token_seconds=0.01),
+], ids=["mid-stream faults", "slow stream"])
+def test_streamed_tokens_are_never_sent_twice(model):
+    router = ModelRouter(model, policies={STRONG: fast_policy(attempts=3, timeout=0.05)})
+    for i in range(10):
+        tokens = []
+        config = {"configurable": {TOKEN_SINK: lambda node, delta: tokens.append(delta)}}
+        messages = [HumanMessage(content=f"question {i}")]
+        try:
+            response = router.invoke("answer", messages, config)
+        except FakeTransientError:
+            response = None
+        time.sleep(0.05)  # Leaves time to an abandoned attempt to send late tokens
+        sent = "".join(tokens)
+        assert model.respond(messages, None)[0].startswith(sent)
+        if response is not None:
+            assert response.content == sent
@@ -0,0 +1,42 @@
+import pytest
+
+from scenarios import ScenarioEngine
+
+
+@pytest.fixture
+def engine():
+    engine = ScenarioEngine(products_csv=None)
+    engine.load_prices([
+        {"sku": "A", "name": "cola", "brand": "Coca Cola", "category": "soft drinks", "price": "2.0"},
+        {"sku": "B", "name": "sample", "brand": "Coca Cola", "category": "samples", "price": "0"},
+        {"sku": "C", "name": "pepsi", "brand": "Pepsi", "category": "soft drinks", "price": "1.0"},
+    ])
+    return engine
+
+
+def test_scenarios_change_the_selected_prices_only(engine):
+    summary = engine.create_scenario("brand", ["coca cola"], 0.5)
+    prices = {sku: price for sku, _, price in engine.scenario_prices(summary["scenario_id"])}
+    assert prices == {"A": 3.0, "B": 0.0, "C": 1.0}
+    assert summary["products"] == 2
+
+
+def test_free_products_are_left_out_of_the_average_change(engine):
+    summary = engine.create_scenario("brand", ["coca cola"], 0.5)
+    assert summary["average_change"] == pytest.approx(0.5)
+    summary = engine.create_scenario("category", ["samples"], 0.5)
+    assert summary["products"] == 1 and summary["average_change"] == 0.0
+
+
+def test_stacked_scenarios_compound(engine):
+    scenario_id = engine.create_scenario("brand", ["pepsi"], 0.5)["scenario_id"]
+    summary = engine.create_scenario("category", ["soft drinks"], 0.5, scenario_id=scenario_id)
+    prices = {sku: price for sku, _, price in engine.scenario_prices(scenario_id)}
+    assert prices == {"A": 3.0, "B": 0.0, "C": 2.25}
+    assert summary["scenario_id"] == scenario_id
+
+
+def test_stacking_on_an_unknown_scenario_raises(engine):
+    with pytest.raises(ValueError, match="does not exist"):
+        engine.create_scenario("brand", ["pepsi"], 0.1, scenario_id=42)
+    assert engine.scenario_prices(42) == engine.scenario_prices(0)
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from checkpointer import DurableSqliteSaver
+from clients import tavily_search_tool
+from fakes import FakeChatModel, FakeSearchClient, Latency
+from lang_graph import Agent
+from serving import GraphRunner, Overloaded
+
+
+@pytest.fixture
+def graph(tmp_path):
+    checkpointer = DurableSqliteSaver.from_path(str(tmp_path / "checkpoints.sqlite"))
+    model = FakeChatModel(latency=Latency(mean=0.02), tool_calls=2, response_words=10)
+    search = FakeSearchClient(latency=Latency(mean=0.01), result_words=10)
+    return Agent(model, [tavily_search_tool(search, max_results=1)], checkpointer=checkpointer).graph
+
+
+def question(text):
+    return {"messages": [HumanMessage(content=text)]}
+
+
+def test_concurrent_tenants_get_their_own_threads(graph):
+    runner = GraphRunner(graph, max_in_flight=4, max_per_tenant=2)
+    peak = 0
+
+    async def watch():
+        nonlocal peak
+        while True:
+            peak = max(peak, runner.running)
+            await asyncio.sleep(0.005)
+
+    async def main():
+        watcher = asyncio.create_task(watch())
+        results = await asyncio.gather(*(
+            runner.invoke(f"tenant {t}", f"thread {i}", question(f"question {t} {i}"))
+            for t in range(5) for i in range(3)
+        ))
+        watcher.cancel()
+        return results
+
+    results = asyncio.run(main())
+    assert len(results) == 15
+    for t in range(5):
+        for i in range(3):
+            state = graph.get_state(runner.config(f"tenant {t}", f"thread {i}"))
+            assert state.values["messages"][0].content == f"question {t} {i}"
+    assert 1 < peak <= 4
+    assert runner.stats() == {"pending": 0, "running": 0, "completed": 15, "failed": 0, "rejected": 0}
+    assert runner.tenants == {} and runner.threads == {}
+
+
+def test_streams_yield_the_updates_of_every_node(graph):
+    runner = GraphRunner(graph)
+
+    async def main():
+        async def collect(tenant):
+            return [event async for event in runner.stream(tenant, "thread", question(f"question {tenant}"))]
+
+        return await asyncio.gather(*(collect(f"tenant {t}") for t in range(3)))
+
+    for events in asyncio.run(main()):
+        assert [next(iter(event)) for event in events] == ["llm", "action", "llm"]
+    assert runner.tenants == {}
+
+
+def test_requests_beyond_max_pending_are_rejected(graph):
+    runner = GraphRunner(graph, max_in_flight=1, max_pending=2)
+
+    async def main():
+        return await asyncio.gather(*(
+            runner.invoke("tenant", f"thread {i}", question("question")) for i in range(4)
+        ), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert sum(isinstance(r, Overloaded) for r in results) == 2
+    assert runner.stats()["completed"] == 2 and runner.stats()["rejected"] == 2